@@ -0,0 +1,327 @@
+import asyncio
+import concurrent.futures
+import importlib.util
+import json
+import logging
+import threading
+import time
+import zlib
+
+import metrics
+from connectivity import ConnectivityMonitor
+from transport import TransportError
+
+# Marcador usado para encerrar as tarefas de envio
+_STOP = object()
+
+
+def create_network(core, base_url, pool_size=2, timeout=None):
+    """AsyncNetwork para core='async' com o aiohttp instalado; None (núcleo de threads) nos demais casos."""
+    if core != 'async':
+        return None
+    if importlib.util.find_spec('aiohttp') is None:
+        logging.warning("NETWORK_CORE=async precisa do pacote aiohttp (requirements-async.txt). Usando o núcleo de threads.")
+        return None
+    return AsyncNetwork(base_url, pool_size, timeout)
+
+
+class AsyncResponse:
+    """Resposta lida por completo, com a parte da interface da resposta do requests usada pelo motor."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class LoopEvent:
+    """Evento que qualquer thread pode disparar e que uma tarefa do loop espera com timeout.
+
+    Substitui o threading.Event de quem passou a rodar como tarefa: set() é
+    seguro fora do loop; clear() e wait() são chamados só pela tarefa.
+    """
+
+    def __init__(self, network):
+        self.network = network
+        self.event = asyncio.Event()
+
+    def set(self):
+        self.network.call_soon(self.event.set)
+
+    def clear(self):
+        self.event.clear()
+
+    async def wait(self, timeout=None):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class AsyncNetwork:
+    """Núcleo de rede opcional (NETWORK_CORE=async): um único event loop para todo o I/O de rede.
+
+    Uma thread roda o loop asyncio com uma sessão aiohttp, cujo pool de
+    conexões keep-alive é limitado a pool_size. O envio online, a verificação
+    de conectividade e os POSTs do backlog rodam como tarefas desse loop, com
+    os mesmos timeouts (conexão, leitura) do transporte HTTP; close() cancela
+    todas de uma vez. As outras threads (Tk, leitor, agendador) usam só a
+    ponte: submit(corrotina) devolve um concurrent.futures.Future e
+    call_soon(função) agenda uma chamada no loop. O aiohttp só é importado
+    na criação da sessão (warm_up() ou primeiro post()).
+    """
+
+    def __init__(self, base_url, pool_size=2, timeout=None):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = None
+        self.aiohttp = None
+        self.closed = False
+        self.loop = asyncio.new_event_loop()
+        # Trabalho bloqueante das tarefas (gravação no diário) fica fora do loop, em uma thread só
+        self.blocking = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="net-blocking")
+        self._thread = threading.Thread(target=self.loop.run_forever, name="net-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Roda a corrotina no loop a partir de qualquer thread; devolve um concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    async def run_blocking(self, function, *args):
+        """Chama function(*args) fora do loop e espera o resultado sem travar as outras tarefas."""
+        return await self.loop.run_in_executor(self.blocking, function, *args)
+
+    def warm_up(self):
+        """Cria a sessão antes do primeiro envio; chamado em segundo plano na inicialização."""
+        return self.submit(self._session()).result()
+
+    async def _session(self):
+        if self.session is None:
+            import aiohttp
+            self.aiohttp = aiohttp
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self.session
+
+    def _client_timeout(self, timeout):
+        # Mesma convenção do requests: (conexão, leitura) ou um total em segundos
+        timeout = timeout or self.timeout
+        if isinstance(timeout, tuple):
+            return self.aiohttp.ClientTimeout(total=None, sock_connect=timeout[0], sock_read=timeout[1])
+        return self.aiohttp.ClientTimeout(total=timeout)
+
+    async def post(self, path, json=None, data=None, files=None, timeout=None):
+        """POST relativo a base_url; devolve AsyncResponse para qualquer código HTTP e levanta TransportError sem resposta."""
+        session = await self._session()
+        if files:
+            form = self.aiohttp.FormData()
+            for name, value in (data or {}).items():
+                form.add_field(name, str(value))
+            for name, (filename, content, content_type) in files.items():
+                form.add_field(name, content, filename=filename, content_type=content_type)
+            data = form
+        started = time.perf_counter()
+        try:
+            async with session.post(f"{self.base_url or ''}{path}", json=json, data=data, timeout=self._client_timeout(timeout)) as response:
+                content = await response.read()
+        except (self.aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.counter('http_failures_total', "Requisições HTTP sem resposta (conexão, timeout)", {'path': path}).inc()
+            raise TransportError(str(e) or type(e).__name__) from e
+        metrics.histogram('http_request_seconds', "Latência das requisições HTTP, em segundos", {'path': path}).observe(time.perf_counter() - started)
+        return AsyncResponse(response.status, response.headers, content)
+
+    def close(self, timeout=5):
+        """Cancela todas as tarefas do loop (envios, verificação, POSTs em andamento), fecha a sessão e para o loop."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.submit(self._shutdown()).result(timeout)
+        except Exception as e:
+            logging.error(f"Erro ao encerrar o núcleo de rede: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self.blocking.shutdown(wait=False)
+
+    async def _shutdown(self):
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
+
+
+class AsyncTransport:
+    """Transporte com a interface do HttpTransport sobre o AsyncNetwork, para quem roda fora do loop.
+
+    Usado pelo envio do backlog (threads do uploader): cada post() vira uma
+    tarefa do loop, na sessão e no pool compartilhados, e a thread só espera
+    o resultado. close() não fecha nada; a sessão é do AsyncNetwork.
+    """
+
+    def __init__(self, network):
+        self.network = network
+
+    @property
+    def base_url(self):
+        return self.network.base_url
+
+    @base_url.setter
+    def base_url(self, value):
+        self.network.base_url = value
+
+    def warm_up(self):
+        return self.network.warm_up()
+
+    def post(self, path, **kwargs):
+        if self.network.closed:
+            raise TransportError("Núcleo de rede encerrado")
+        try:
+            return self.network.submit(self.network.post(path, **kwargs)).result()
+        except concurrent.futures.CancelledError as e:
+            raise TransportError("Envio cancelado no encerramento do núcleo de rede") from e
+
+    def close(self):
+        pass
+
+
+class AsyncScanSender:
+    """ScanSender com tarefas do loop do AsyncNetwork no lugar das threads.
+
+    Mesma interface (submit, pending, stop, batch_size) e mesmas regras: cada
+    dispositivo é sempre atendido pela mesma tarefa, o que mantém a ordem por
+    dispositivo, e com a fila cheia o item vai para on_overflow na thread de
+    quem chamou submit, sem bloquear. handler e batch_handler são corrotinas.
+    """
+
+    def __init__(self, network, handler, on_overflow, workers=2, queue_size=200, batch_handler=None, batch_size=1, linger=0):
+        self.network = network
+        self.handler = handler
+        self.on_overflow = on_overflow
+        self.batch_handler = batch_handler
+        self.batch_size = batch_size
+        self.linger = linger
+        workers = max(1, workers)
+        self.per_worker = max(1, queue_size // workers)
+        # O limite da fila é contado aqui: submit() roda fora do loop e não pode consultar a asyncio.Queue
+        self.waiting = [0] * workers
+        self.lock = threading.Lock()
+        self.queues = [asyncio.Queue() for _ in range(workers)]
+        self.workers = [network.submit(self._worker(index)) for index in range(workers)]
+
+    def submit(self, device_key, item):
+        # crc32 é estável entre execuções, ao contrário de hash() para strings
+        index = zlib.crc32(str(device_key).encode()) % len(self.queues)
+        with self.lock:
+            accepted = self.waiting[index] < self.per_worker
+            if accepted:
+                self.waiting[index] += 1
+        if accepted:
+            self.network.call_soon(self.queues[index].put_nowait, item)
+            return True
+        logging.warning("Fila de envio cheia. Salvando código de barras localmente.")
+        try:
+            self.on_overflow(item)
+        except Exception as e:
+            logging.error(f"Erro ao salvar código de barras descartado da fila: {e}")
+        return False
+
+    def pending(self):
+        with self.lock:
+            return sum(self.waiting)
+
+    def stop(self, timeout=5):
+        """Envia o que já está na fila e encerra as tarefas; o que passar de timeout é cancelado com o loop."""
+        for work_queue in self.queues:
+            self.network.call_soon(work_queue.put_nowait, _STOP)
+        concurrent.futures.wait(self.workers, timeout)
+
+    def _taken(self, index, count):
+        with self.lock:
+            self.waiting[index] -= count
+
+    async def _worker(self, index):
+        work_queue = self.queues[index]
+        while True:
+            item = await work_queue.get()
+            if item is _STOP:
+                return
+            items = [item]
+            stopping = False
+            if self.batch_handler is not None and self.batch_size > 1:
+                deadline = self.network.loop.time() + self.linger
+                while len(items) < self.batch_size:
+                    remaining = deadline - self.network.loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        next_item = await asyncio.wait_for(work_queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if next_item is _STOP:
+                        stopping = True
+                        break
+                    items.append(next_item)
+            self._taken(index, len(items))
+            try:
+                if len(items) > 1:
+                    await self.batch_handler(items)
+                else:
+                    await self.handler(items[0])
+            except Exception as e:
+                logging.error(f"Erro no envio do código de barras: {e}")
+            if stopping:
+                return
+
+
+class AsyncConnectivityMonitor(ConnectivityMonitor):
+    """ConnectivityMonitor com a verificação periódica como tarefa do loop do AsyncNetwork, sem thread própria.
+
+    O teste de conexão TCP usa asyncio.open_connection; cache, backoff e
+    avisos de mudança de estado são os da classe base.
+    """
+
+    def __init__(self, network, endpoint, **options):
+        super().__init__(endpoint, **options)
+        self.network = network
+        self._wake = LoopEvent(network)
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = self.network.submit(self._run_async())
+
+    async def probe_async(self):
+        if not self.host:
+            return False
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    async def _run_async(self):
+        backoff = self.min_backoff
+        while not self._stopped.is_set():
+            self._wake.clear()
+            online = await self.probe_async()
+            self._set_state(online)
+            delay, backoff = self._next_delay(online, backoff)
+            await self._wake.wait(delay)
@@ -0,0 +1,243 @@
+import argparse
+import json
+import math
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+# Benchmark do envio contra o mock do Laravel (mock_laravel.py) ou um endpoint informado:
+#   python3 benchmark.py scans --bursts 50 --burst-size 20 --latency-ms 30
+#   python3 benchmark.py backlog --days 7 --scans-per-day 5000 --concurrency 2 --rate 0
+# Cada cenário roda em um processo próprio para que memória e CPU sejam só dele.
+
+MOCK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_laravel.py')
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_mock(args, extra_args=()):
+    """Sobe o mock em outro processo (fora da medição de CPU/memória). Retorna (processo, url)."""
+    if args.endpoint:
+        return None, args.endpoint
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, MOCK_PATH, '--port', str(port),
+        '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+        '--error-rate', str(args.error_rate), '--drop-rate', str(args.drop_rate), *extra_args,
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Mock do Laravel não respondeu")
+
+def mock_stats(url):
+    try:
+        with urllib.request.urlopen(f"{url}/__stats", timeout=2) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
+
+def configure_environment(workdir, endpoint, args):
+    """Aponta o motor para o endpoint e para arquivos temporários; precisa vir antes de importar engine/sync."""
+    os.environ.update({
+        'LARAVEL_STORE_ENDPOINT': endpoint,
+        'RASPBERRY_ID': os.getenv('RASPBERRY_ID', '1'),
+        'FILIAL_ID': os.getenv('FILIAL_ID', '1'),
+        'JOURNAL_DIR': os.path.join(workdir, 'journal'),
+        'OUTBOX_DB_PATH': os.path.join(workdir, 'outbox.db'),
+        'STATE_PATH': os.path.join(workdir, 'state.json'),
+        'SYNC_LOCK_PATH': os.path.join(workdir, '.sync.lock'),
+        'SYNC_INTERVAL': '86400',
+        'SYNC_BACKLOG_THRESHOLD': '1000000000',
+        'DEDUP_WINDOW': '0',
+        'METRICS_PORT': '0',
+        'METRICS_SNAPSHOT_PATH': '',
+        'UPLOAD_CONCURRENCY': str(args.concurrency),
+        'UPLOAD_RATE_LIMIT': str(args.rate),
+        'UPLOAD_BATCH_SIZE': str(args.batch_size),
+    })
+
+def usage(cpu_start, elapsed):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = usage.ru_utime + usage.ru_stime - cpu_start
+    return {
+        'cpu_seconds': round(cpu, 3),
+        'cpu_percent': round(100 * cpu / elapsed, 1) if elapsed else None,
+        'max_rss_mb': round(usage.ru_maxrss / 1024, 1),
+    }
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def bench_scans(args):
+    """Rajadas de leituras sintéticas pelo framer e pelo envio online; mede vazão e latência leitura->confirmação."""
+    import engine
+
+    scan_engine = engine.ScanEngine()
+    started = {}
+    latencies = []
+    outcome = {'sent': 0, 'failed': 0, 'rejected': 0}
+    lock = threading.Condition()
+
+    def on_event(event, message, data):
+        if event not in (engine.SENT, engine.FAILED, engine.REJECTED):
+            return
+        with lock:
+            started_at = started.pop(data['barcode'], None)
+            if started_at is None:
+                return
+            latencies.append(time.perf_counter() - started_at)
+            outcome[{engine.SENT: 'sent', engine.FAILED: 'failed', engine.REJECTED: 'rejected'}[event]] += 1
+            lock.notify_all()
+
+    scan_engine.add_listener(on_event)
+    scan_engine.start(backend=None)
+    cpu_start = cpu_time()
+    begin = time.perf_counter()
+    sequence = 0
+    for _ in range(args.bursts):
+        for _ in range(args.burst_size):
+            sequence += 1
+            barcode = f"{sequence:012d}"
+            with lock:
+                started[barcode] = time.perf_counter()
+            for char in barcode:
+                scan_engine.scanner.feed_char(char)
+            scan_engine.scanner.feed_enter()
+        time.sleep(args.burst_gap_ms / 1000)
+    with lock:
+        lock.wait_for(lambda: not started, timeout=args.timeout)
+        unacked = len(started)
+    elapsed = time.perf_counter() - begin
+    result = {
+        'scenario': 'scans',
+        'scans': sequence,
+        'sent': outcome['sent'],
+        'saved_offline': outcome['failed'],
+        'rejected': outcome['rejected'],
+        'unacked': unacked,
+        'elapsed_seconds': round(elapsed, 3),
+        'scans_per_second': round(sum(outcome.values()) / elapsed, 1),
+        'latency_ms': {name: round(percentile(latencies, p) * 1000, 2) if latencies else None
+                       for name, p in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))},
+    }
+    result.update(usage(cpu_start, elapsed))
+    scan_engine.stop()
+    return result
+
+
+def bench_backlog(args):
+    """Backlog offline de vários dias no outbox, drenado em lotes; mede a vazão do envio."""
+    import sync
+    from outbox import Outbox
+
+    outbox = Outbox(sync.OUTBOX_DB_PATH)
+    total = args.days * args.scans_per_day
+    first_day = datetime.now() - timedelta(days=args.days)
+    step = timedelta(days=1) / args.scans_per_day
+    batch = []
+    for index in range(total):
+        batch.append({
+            'key': f"bench-{index}",
+            'timestamp': (first_day + step * index).strftime('%Y-%m-%d %H:%M:%S'),
+            'raspberry_id': os.environ['RASPBERRY_ID'],
+            'codigobarras': f"{index:012d}",
+            'filial_id': os.environ['FILIAL_ID'],
+            'mac_address': '00:00:00:00:00:00',
+        })
+        if len(batch) == 10000:
+            outbox.enqueue_many(batch)
+            batch = []
+    if batch:
+        outbox.enqueue_many(batch)
+
+    cpu_start = cpu_time()
+    begin = time.perf_counter()
+    sent = sync.drain_outbox(outbox, args.concurrency)
+    elapsed = time.perf_counter() - begin
+    result = {
+        'scenario': 'backlog',
+        'rows': total,
+        'sent': sent,
+        'pending': outbox.count(),
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(sent / elapsed, 1) if elapsed else None,
+    }
+    result.update(usage(cpu_start, elapsed))
+    outbox.close()
+    return result
+
+
+def print_report(result):
+    for key, value in result.items():
+        if isinstance(value, dict):
+            value = ', '.join(f"{name}={item}" for name, item in value.items())
+        print(f"{key:>18}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do envio de códigos de barras.")
+    parser.add_argument('scenario', choices=['scans', 'backlog'])
+    parser.add_argument('--endpoint', help="usa este servidor em vez de subir o mock_laravel.py")
+    parser.add_argument('--json', action='store_true', help="saída em JSON")
+    mock = parser.add_argument_group('falhas injetadas no mock')
+    mock.add_argument('--latency-ms', type=float, default=0)
+    mock.add_argument('--jitter-ms', type=float, default=0)
+    mock.add_argument('--error-rate', type=float, default=0)
+    mock.add_argument('--drop-rate', type=float, default=0)
+    scans = parser.add_argument_group('cenário scans')
+    scans.add_argument('--bursts', type=int, default=50)
+    scans.add_argument('--burst-size', type=int, default=20)
+    scans.add_argument('--burst-gap-ms', type=float, default=100)
+    scans.add_argument('--timeout', type=float, default=120, help="espera máxima pelas confirmações")
+    backlog = parser.add_argument_group('cenário backlog')
+    backlog.add_argument('--days', type=int, default=7)
+    backlog.add_argument('--scans-per-day', type=int, default=5000)
+    backlog.add_argument('--concurrency', type=int, default=2)
+    backlog.add_argument('--rate', type=float, default=0, help="requisições por segundo (0 = sem limite)")
+    backlog.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='staf-bench-')
+    process, endpoint = start_mock(args)
+    try:
+        configure_environment(workdir, endpoint, args)
+        result = bench_scans(args) if args.scenario == 'scans' else bench_backlog(args)
+        result['server'] = mock_stats(endpoint)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+
+
+def write_atomic(path, text):
+    """Grava o arquivo inteiro em um temporário no mesmo diretório e troca com rename.
+
+    Um travamento no meio da gravação deixa o arquivo antigo intacto, nunca
+    um arquivo truncado.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def update_env(path, updates):
+    """Troca (ou acrescenta) as chaves de updates no .env, preservando as demais linhas, com gravação atômica."""
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            lines = file.readlines()
+    pending = dict(updates)
+    output = []
+    for line in lines:
+        key = line.split('=', 1)[0].strip()
+        if '=' in line and key in pending:
+            output.append(f"{key}={pending.pop(key)}\n")
+        else:
+            output.append(line if line.endswith('\n') else line + '\n')
+    output += [f"{key}={value}\n" for key, value in pending.items()]
+    write_atomic(path, ''.join(output))
+    os.environ.update({key: str(value) for key, value in updates.items()})
+
+
+class StateStore:
+    """Valores de execução (último envio etc.) em um JSON separado do .env.
+
+    set() só altera a memória; uma thread grava o arquivo no máximo uma vez a
+    cada flush_interval segundos, juntando todas as alterações do intervalo,
+    sempre com write_atomic. close() grava o que estiver pendente. Gravações
+    (da thread ou de flush() chamado por outra thread, como em Sequence) são
+    feitas uma de cada vez, com a cópia dos valores tirada já na vez de cada
+    uma: uma cópia mais antiga nunca é gravada por cima de uma mais nova.
+    """
+
+    def __init__(self, path, flush_interval=5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.values = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        try:
+            with open(path, 'r') as file:
+                self.values = json.load(file)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.error(f"Erro ao ler o estado salvo em {path}: {e}. Começando do zero.")
+        self._thread = threading.Thread(target=self._run, name="state-store", daemon=True)
+        self._thread.start()
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.values.get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            if self.values.get(key) == value:
+                return
+            self.values[key] = value
+            self.dirty = True
+        self._wake.set()
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                text = json.dumps(self.values, ensure_ascii=False, indent=2)
+                self.dirty = False
+            try:
+                write_atomic(self.path, text)
+            except OSError as e:
+                with self.lock:
+                    self.dirty = True
+                logging.error(f"Erro ao gravar o estado em {self.path}: {e}")
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            # Junta as alterações que chegarem durante o intervalo em uma única gravação
+            self._stopped.wait(self.flush_interval)
+            self.flush()
+
+
+class Sequence:
+    """Contador monotônico guardado no StateStore, reservado em blocos de block números.
+
+    A reserva de cada bloco é gravada em disco antes do primeiro número dele
+    ser usado; depois de uma queda o contador recomeça do fim do último bloco
+    reservado. Pode pular números, mas nunca repete.
+    """
+
+    def __init__(self, state, key, block=1000):
+        self.state = state
+        self.key = key
+        self.block = block
+        self.lock = threading.Lock()
+        self.value = self.limit = int(state.get(key, 0))
+
+    def next(self):
+        with self.lock:
+            if self.value >= self.limit:
+                self.limit = self.value + self.block
+                self.state.set(self.key, self.limit)
+                self.state.flush()
+            self.value += 1
+            return self.value
+
+
+class ConfigWatcher:
+    """Observa o .env (mtime e tamanho) e chama on_change quando ele muda em disco."""
+
+    def __init__(self, path, on_change, interval=5.0):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.signature = self._signature()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            signature = self._signature()
+            if signature != self.signature:
+                self.signature = signature
+                try:
+                    self.on_change()
+                except Exception as e:
+                    logging.error(f"Erro ao recarregar configurações: {e}")
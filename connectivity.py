@@ -0,0 +1,111 @@
+import logging
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import metrics
+
+FLAPS = metrics.counter('connectivity_changes_total', "Mudanças de estado online/offline da conexão com o servidor")
+
+
+class ConnectivityMonitor:
+    """Estado de conectividade com o servidor, compartilhado entre envio e interface.
+
+    O estado fica em cache: is_online() nunca faz requisição de rede. Uma thread
+    em segundo plano testa a conexão TCP com o host do LARAVEL_STORE_ENDPOINT,
+    a cada online_interval segundos quando online e com backoff exponencial
+    (min_backoff até max_backoff) quando offline. Os envios reais informam o
+    resultado por report_success/report_failure, o que muda o estado na hora.
+    """
+
+    def __init__(self, endpoint, ttl=30, online_interval=10, min_backoff=2, max_backoff=60, timeout=3):
+        self.ttl = ttl
+        self.online_interval = online_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.online = None  # None = ainda não verificado
+        self.checked_at = 0
+        self.listeners = []
+        self.lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.set_endpoint(endpoint)
+
+    def set_endpoint(self, endpoint):
+        parsed = urlparse(endpoint or '')
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self._wake.set()
+
+    def add_listener(self, callback):
+        """Registra callback(online) chamado sempre que o estado muda."""
+        self.listeners.append(callback)
+
+    def is_online(self):
+        with self.lock:
+            online, checked_at = self.online, self.checked_at
+        if online and time.monotonic() - checked_at > self.ttl:
+            # Cache vencido: pede nova verificação, mas responde com o último estado conhecido.
+            # Offline quem manda é o backoff da thread de verificação.
+            self._wake.set()
+        # Antes da primeira verificação tentamos o envio; o resultado atualiza o estado
+        return online is not False
+
+    def report_success(self):
+        self._set_state(True)
+
+    def report_failure(self):
+        self._set_state(False)
+        self._wake.set()
+
+    def probe(self):
+        if not self.host:
+            return False
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout):
+                return True
+        except OSError:
+            return False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="connectivity-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def _set_state(self, online):
+        with self.lock:
+            changed = online != self.online
+            flapped = changed and self.online is not None
+            self.online = online
+            self.checked_at = time.monotonic()
+        if flapped:
+            FLAPS.inc()
+        if changed:
+            logging.info(f"Conectividade com o servidor: {'online' if online else 'offline'}")
+            for callback in list(self.listeners):
+                try:
+                    callback(online)
+                except Exception as e:
+                    logging.error(f"Erro ao notificar mudança de conectividade: {e}")
+
+    def _next_delay(self, online, backoff):
+        """(espera até a próxima verificação, próximo backoff) depois de uma verificação."""
+        if online:
+            return self.online_interval, self.min_backoff
+        return backoff, min(backoff * 2, self.max_backoff)
+
+    def _run(self):
+        backoff = self.min_backoff
+        while not self._stopped.is_set():
+            self._wake.clear()
+            online = self.probe()
+            self._set_state(online)
+            delay, backoff = self._next_delay(online, backoff)
+            self._wake.wait(delay)
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+SUPPRESSED_META_KEY = 'dedup_suppressed'
+
+
+def parse_windows(spec):
+    """Converte DEDUP_WINDOWS ("prefixo:segundos,prefixo:segundos") em {prefixo: segundos}."""
+    windows = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        try:
+            prefix, seconds = item.rsplit(':', 1)
+            windows[prefix.strip()] = float(seconds)
+        except ValueError:
+            logging.error(f"Janela de repetição inválida em DEDUP_WINDOWS: {item!r}")
+    return windows
+
+
+class DedupCache:
+    """Suprime leituras repetidas do mesmo código no mesmo dispositivo dentro de uma janela.
+
+    Cache LRU de (codigobarras, device) -> horário da última leitura aceita,
+    limitado a capacity entradas. A janela padrão é window segundos; windows
+    define janelas próprias por prefixo do código (vale o prefixo mais longo,
+    0 desliga a supressão). Repetições não renovam a janela, então segurar o
+    gatilho não bloqueia o código para sempre.
+
+    Com store (o Outbox), as leituras aceitas e o total suprimido são
+    gravados no SQLite e recarregados na inicialização: repetições continuam
+    suprimidas depois de um travamento e reinício. accept() só decide em
+    memória; uma thread grava as alterações em lote, numa transação a cada
+    flush_interval segundos, para que um envio do backlog segurando o banco
+    não atrase a leitura. Um travamento perde no máximo esse intervalo.
+    close() grava o que estiver pendente.
+    """
+
+    def __init__(self, window=5.0, capacity=1024, windows=None, store=None, clock=time.time, flush_interval=1.0):
+        self.window = window
+        self.capacity = capacity
+        self.windows = windows or {}
+        self.store = store
+        self.clock = clock
+        self.flush_interval = flush_interval
+        self.entries = OrderedDict()  # (codigobarras, device) -> [seen_at, suppressed]
+        self.suppressed = 0
+        self.accepted_since_prune = 0
+        # Alterações ainda não gravadas: (codigobarras, device) -> (seen_at, suppressed)
+        self.dirty = {}
+        self.suppressed_dirty = False
+        self.prune_before = None
+        self.lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        if store is not None:
+            self._load()
+            self._thread = threading.Thread(target=self._run, name="dedup-writer", daemon=True)
+            self._thread.start()
+
+    @property
+    def max_window(self):
+        return max([self.window] + list(self.windows.values()))
+
+    def window_for(self, barcode):
+        matches = [prefix for prefix in self.windows if barcode.startswith(prefix)]
+        if matches:
+            return self.windows[max(matches, key=len)]
+        return self.window
+
+    def accept(self, barcode, device):
+        """True se a leitura deve seguir para o envio; False se é repetição dentro da janela."""
+        window = self.window_for(barcode)
+        if window <= 0:
+            return True
+        # Sem RASPBERRY_ID o dispositivo vem None; a coluna device do outbox é NOT NULL
+        device = device or ''
+        key = (barcode, device)
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and 0 <= now - entry[0] < window:
+                entry[1] += 1
+                self.suppressed += 1
+                self.suppressed_dirty = True
+                self.entries.move_to_end(key)
+                accepted = False
+            else:
+                entry = self.entries[key] = [now, 0]
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.capacity:
+                    self.entries.popitem(last=False)
+                self.accepted_since_prune += 1
+                if self.accepted_since_prune >= self.capacity:
+                    self.accepted_since_prune = 0
+                    self.prune_before = now - self.max_window
+                accepted = True
+            if self.store is not None:
+                self.dirty[key] = (entry[0], entry[1])
+        if self.store is not None:
+            self._wake.set()
+        return accepted
+
+    def stats(self):
+        with self.lock:
+            return {'suppressed': self.suppressed, 'tracked': len(self.entries)}
+
+    def flush(self):
+        """Grava no outbox, em uma transação, as leituras e o total suprimido alterados desde a última gravação."""
+        with self.lock:
+            if not self.dirty and not self.suppressed_dirty and self.prune_before is None:
+                return
+            dirty, self.dirty = self.dirty, {}
+            meta = {SUPPRESSED_META_KEY: str(self.suppressed)} if self.suppressed_dirty else None
+            prune_before, self.prune_before = self.prune_before, None
+            self.suppressed_dirty = False
+        rows = [(barcode, device, seen_at, suppressed) for (barcode, device), (seen_at, suppressed) in dirty.items()]
+        try:
+            self.store.save_recent_scans(rows, meta=meta, prune_before=prune_before)
+        except Exception as e:
+            logging.error(f"Erro ao gravar leituras recentes no outbox: {e}")
+            # Devolve o lote para a próxima gravação, sem sobrescrever alterações mais novas
+            with self.lock:
+                for key, value in dirty.items():
+                    self.dirty.setdefault(key, value)
+                self.suppressed_dirty = self.suppressed_dirty or meta is not None
+                if self.prune_before is None:
+                    self.prune_before = prune_before
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            # Junta as leituras que chegarem durante o intervalo em uma única transação
+            self._stopped.wait(self.flush_interval)
+            self.flush()
+
+    def _load(self):
+        try:
+            self.suppressed = int(self.store.get_meta(SUPPRESSED_META_KEY, 0))
+            for row in self.store.recent_scans(self.clock() - self.max_window):
+                self.entries[(row['codigobarras'], row['device'])] = [row['seen_at'], row['suppressed']]
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        except Exception as e:
+            logging.error(f"Erro ao carregar leituras recentes do outbox: {e}")
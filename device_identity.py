@@ -0,0 +1,133 @@
+import logging
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+# Grupos de multicast do netlink (linux/rtnetlink.h): mudanças de interface e de endereço IPv4
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+
+Identity = namedtuple('Identity', ['mac_address', 'ip_address', 'raspberry_id', 'filial_id', 'updated_at'])
+
+
+def read_mac_address():
+    try:
+        mac = uuid.getnode()
+        mac_address = ':'.join(("%012X" % mac)[i:i+2] for i in range(0, 12, 2))
+        return mac_address
+    except Exception as e:
+        logging.error(f"Erro ao obter MAC Address: {e}")
+        return None
+
+def read_local_ip():
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.settimeout(0)
+        s.connect(('192.168.1.1', 1))  # Pode ser qualquer IP na rede local; nenhum pacote é enviado
+        local_network_ip = s.getsockname()[0]
+        s.close()
+        return local_network_ip
+    except Exception as e:
+        logging.error(f"Erro ao obter IP da rede local: {e}")
+        return None
+
+
+class DeviceIdentity:
+    """Identidade do dispositivo (MAC, IP, RASPBERRY_ID, FILIAL_ID) calculada uma vez e guardada.
+
+    snapshot() devolve sempre a mesma tupla imutável até a próxima
+    atualização, sem syscalls nem subprocessos. O MAC é lido uma única vez
+    (uuid.getnode() pode rodar um subprocesso); IP e ids do .env são relidos
+    quando o netlink avisa mudança de interface ou endereço, ou a cada ttl
+    segundos se o netlink não estiver disponível.
+    """
+
+    def __init__(self, ttl=3600, debounce=1.0):
+        self.ttl = ttl
+        self.debounce = debounce
+        self.mac_address = read_mac_address()
+        self.listeners = []
+        self.lock = threading.Lock()
+        self._snapshot = self._read()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def snapshot(self):
+        return self._snapshot
+
+    def add_listener(self, callback):
+        """Registra callback(identidade), chamado da thread do monitor quando o IP ou os ids mudam."""
+        self.listeners.append(callback)
+
+    def refresh(self):
+        with self.lock:
+            previous = self._snapshot
+            self._snapshot = current = self._read()
+        if current[:4] != previous[:4]:
+            logging.info(f"Identidade do dispositivo atualizada: MAC {current.mac_address}, IP {current.ip_address}")
+            for callback in self.listeners:
+                try:
+                    callback(current)
+                except Exception as e:
+                    logging.error(f"Erro ao notificar mudança de identidade: {e}")
+        return current
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="device-identity", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _read(self):
+        return Identity(self.mac_address, read_local_ip(), os.getenv('RASPBERRY_ID'), os.getenv('FILIAL_ID'), time.time())
+
+    def _open_netlink(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+            return sock
+        except (AttributeError, OSError) as e:
+            logging.warning(f"Netlink indisponível ({e}); identidade do dispositivo atualizada a cada {self.ttl:.0f} s.")
+            return None
+
+    def _run(self):
+        sock = self._open_netlink()
+        try:
+            while not self._stopped.is_set():
+                remaining = self._snapshot.updated_at + self.ttl - time.time()
+                if sock is None:
+                    if self._stopped.wait(max(0, remaining)):
+                        return
+                else:
+                    ready, _, _ = select.select([sock], [], [], max(0, min(remaining, 1.0)))
+                    if ready:
+                        sock.recv(65536)
+                        # Uma troca de rede gera uma rajada de mensagens; espera assentar e descarta o resto
+                        if self._stopped.wait(self.debounce):
+                            return
+                        while select.select([sock], [], [], 0)[0]:
+                            sock.recv(65536)
+                    elif time.time() < self._snapshot.updated_at + self.ttl:
+                        continue
+                self.refresh()
+        finally:
+            if sock is not None:
+                sock.close()
+
+
+_identity = None
+_identity_lock = threading.Lock()
+
+def get_identity(ttl=3600):
+    """Instância compartilhada pelo motor, pela interface e pelos scripts de envio."""
+    global _identity
+    with _identity_lock:
+        if _identity is None:
+            _identity = DeviceIdentity(ttl)
+        return _identity
@@ -0,0 +1,764 @@
+from dotenv import load_dotenv
+import os
+import uuid
+import socket
+import signal
+import time
+import logging
+import threading
+import subprocess
+from datetime import datetime
+from sender import ScanSender, parse_batch_results
+from connectivity import ConnectivityMonitor
+from async_net import AsyncConnectivityMonitor, AsyncScanSender, AsyncTransport, create_network
+from journal import Journal
+from outbox import Outbox
+from sync import (
+    RETRY_PERMANENT_STATUSES, TRANSPORT, UPLOAD_CONCURRENCY, SyncScheduler, endpoint_breaker, ingest_local_backlog, run_sync
+)
+from retry_policy import (
+    DUPLICATE, PERMANENT, RETRYABLE, SUCCESS, RetryQueue, classify, describe, retry_delay
+)
+from scanner_input import ScanFramer
+from scanner_device import create_reader
+from dedup import DedupCache, parse_windows
+from device_identity import get_identity
+from config_store import ConfigWatcher, Sequence, StateStore
+from transport import SCAN_PATH, TransportError, create_transport
+import metrics
+import startup
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Configurações
+LARAVEL_STORE_ENDPOINT = os.getenv('LARAVEL_STORE_ENDPOINT')
+
+# Envio online: pool de threads, fila limitada e timeouts (conexão, leitura) em segundos
+SENDER_WORKERS = int(os.getenv('SENDER_WORKERS', 2))
+SENDER_QUEUE_SIZE = int(os.getenv('SENDER_QUEUE_SIZE', 200))
+HTTP_TIMEOUT = (float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05)), float(os.getenv('HTTP_READ_TIMEOUT', 10)))
+
+# Envio em lote (opcional): até SENDER_BATCH_SIZE itens ou SENDER_BATCH_LINGER_MS milissegundos por lote
+SENDER_BATCH_MODE = os.getenv('SENDER_BATCH_MODE', 'false').lower() in ('1', 'true', 'sim', 'on')
+SENDER_BATCH_SIZE = int(os.getenv('SENDER_BATCH_SIZE', 20))
+SENDER_BATCH_LINGER_MS = int(os.getenv('SENDER_BATCH_LINGER_MS', 200))
+SENDER_BATCH_PATH = os.getenv('SENDER_BATCH_PATH', '/api/raspberry-scan-store-batch')
+# Volta ao envio item a item se o servidor não aceitar lotes
+SENDER_BATCH_FALLBACK = os.getenv('SENDER_BATCH_FALLBACK', 'true').lower() in ('1', 'true', 'sim', 'on')
+
+# Núcleo de rede: 'threads' (pool de threads com requests) ou 'async' (um único event loop com aiohttp
+# para o envio online, a verificação de conectividade e os POSTs do backlog; precisa do pacote aiohttp)
+NETWORK_CORE = os.getenv('NETWORK_CORE', 'threads')
+
+# Novas tentativas do envio online para falhas passageiras (sem resposta, 408, 429, 5xx): tentativas antes
+# de ir para o backup offline e backoff (segundos); 429/503 respeitam o Retry-After do servidor
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 3))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 2))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 60))
+
+# Monitor de conectividade: validade do cache e backoff máximo offline, em segundos
+CONNECTIVITY_TTL = float(os.getenv('CONNECTIVITY_TTL', 30))
+CONNECTIVITY_MAX_BACKOFF = float(os.getenv('CONNECTIVITY_MAX_BACKOFF', 60))
+
+# Diário de backup offline: fsync em grupo (segundos / registros) e rotação de segmentos
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', '/home/kali/staf-rasp/journal')
+JOURNAL_FSYNC_INTERVAL = float(os.getenv('JOURNAL_FSYNC_INTERVAL', 1))
+JOURNAL_FSYNC_RECORDS = int(os.getenv('JOURNAL_FSYNC_RECORDS', 32))
+JOURNAL_SEGMENT_MAX_BYTES = int(os.getenv('JOURNAL_SEGMENT_MAX_BYTES', 1024 * 1024))
+JOURNAL_SEGMENT_MAX_AGE = float(os.getenv('JOURNAL_SEGMENT_MAX_AGE', 300))
+# Compressão dos blocos dos segmentos selados (formato compacto): none, gzip ou zstd (pacote zstandard)
+JOURNAL_COMPRESSION = os.getenv('JOURNAL_COMPRESSION', 'gzip')
+
+# Outbox SQLite com os batimentos pendentes e enviados (retenção permanente)
+OUTBOX_DB_PATH = os.getenv('OUTBOX_DB_PATH', '/home/kali/staf-rasp/backup_permanente/outbox.db')
+
+# Leitor de código de barras: fim da leitura sem Enter, intervalo máximo entre teclas do leitor (ms),
+# tamanho mínimo da leitura e se a digitação manual seguida de Enter vale como leitura
+SCANNER_CHAR_TIMEOUT_MS = int(os.getenv('SCANNER_CHAR_TIMEOUT_MS', 50))
+SCANNER_MAX_INTERVAL_MS = int(os.getenv('SCANNER_MAX_INTERVAL_MS', 30))
+SCANNER_MIN_LENGTH = int(os.getenv('SCANNER_MIN_LENGTH', 4))
+SCANNER_ACCEPT_MANUAL = os.getenv('SCANNER_ACCEPT_MANUAL', 'true').lower() in ('1', 'true', 'sim', 'on')
+# Origem das teclas: pynput (teclado global do X), evdev (/dev/input/eventX) ou serial (/dev/ttyACM0)
+SCANNER_BACKEND = os.getenv('SCANNER_BACKEND', 'pynput')
+SCANNER_DEVICE = os.getenv('SCANNER_DEVICE', '')
+SCANNER_SERIAL_BAUD = int(os.getenv('SCANNER_SERIAL_BAUD', 9600))
+SCANNER_GRAB = os.getenv('SCANNER_GRAB', 'true').lower() in ('1', 'true', 'sim', 'on')
+
+# Supressão de leituras repetidas: janela padrão (segundos, 0 desliga), janelas por prefixo
+# do código ("prefixo:segundos,..."), quantos pares (código, dispositivo) ficam no cache e
+# de quantos em quantos segundos as alterações do cache são gravadas no outbox
+DEDUP_WINDOW = float(os.getenv('DEDUP_WINDOW', 5))
+DEDUP_WINDOWS = os.getenv('DEDUP_WINDOWS', '')
+DEDUP_CAPACITY = int(os.getenv('DEDUP_CAPACITY', 1024))
+DEDUP_FLUSH_INTERVAL = float(os.getenv('DEDUP_FLUSH_INTERVAL', 1))
+
+# Identidade do dispositivo (IP, RASPBERRY_ID, FILIAL_ID): releitura de segurança, em segundos,
+# além das mudanças de rede avisadas pelo netlink
+IDENTITY_TTL = float(os.getenv('IDENTITY_TTL', 3600))
+
+# Estado de execução (último envio etc.) fora do .env, gravado no máximo a cada STATE_FLUSH_INTERVAL segundos
+ENV_PATH = '.env'
+STATE_PATH = os.getenv('STATE_PATH', '/home/kali/staf-rasp/state.json')
+STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', 5))
+
+# Métricas: endpoint HTTP local (Prometheus em /metrics, JSON em /metrics.json; porta 0 desliga)
+# e snapshot JSON periódico (caminho vazio desliga)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9464))
+METRICS_SNAPSHOT_PATH = os.getenv('METRICS_SNAPSHOT_PATH', '/home/kali/staf-rasp/metrics.json')
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', 60))
+
+# Relatório de tempos da inicialização (até a leitura ficar pronta e até a primeira leitura); vazio desliga
+STARTUP_REPORT_PATH = os.getenv('STARTUP_REPORT_PATH', '/home/kali/staf-rasp/startup.json')
+
+SETUP_CRON_PATH = "/home/kali/staf-rasp/setup_cron.sh"
+
+# Eventos emitidos pelo motor para os clientes (interface Tk ou log do serviço)
+SCAN = 'scan'                  # leitura recebida: barcode, timestamp
+DUPLICATE_SCAN = 'duplicate'   # leitura repetida suprimida: barcode, suppressed
+STATUS = 'status'              # situação do envio em andamento
+SENT = 'sent'                  # código enviado: barcode, data_time
+FAILED = 'failed'              # código gravado no backup offline: barcode, data_time
+RESPONSE = 'response'          # resposta do endpoint
+LOG = 'log'                    # mensagem geral
+ERROR = 'error'                # mensagem de erro
+CONNECTIVITY = 'connectivity'  # mudança de conectividade: online
+CONFIG = 'config'              # .env recarregado: endpoint
+RETRY = 'retry'                # nova tentativa agendada: barcode, data_time, delay
+REJECTED = 'rejected'          # código recusado pelo servidor (dead-letter): barcode, data_time, status
+
+SCAN_TO_ENQUEUE = metrics.histogram('scan_to_enqueue_seconds', "Da leitura completa até entrar na fila de envio, em segundos")
+ENQUEUE_TO_ACK = metrics.histogram('enqueue_to_ack_seconds', "Da fila de envio até a confirmação do servidor, em segundos")
+SCANS = metrics.counter('scans_total', "Leituras completas recebidas do leitor")
+SCANS_SENT = metrics.counter('scans_sent_total', "Leituras confirmadas pelo servidor no envio online")
+SCANS_OFFLINE = metrics.counter('scans_saved_offline_total', "Leituras gravadas no backup offline")
+SCANS_ALREADY_ACKED = metrics.counter('scans_already_acked_total', "Reenvios online que o servidor já tinha recebido (409)")
+SCANS_REJECTED = metrics.counter('scans_rejected_total', "Leituras recusadas de vez pelo servidor no envio online (dead-letter)")
+
+def remove_legacy_cron():
+    """Remove as tarefas horárias antigas do cron; devolve o texto de status para exibir ou registrar."""
+    # O envio do backlog agora roda dentro do motor (SyncScheduler);
+    # as tarefas horárias antigas do cron são removidas se existirem.
+    legacy_scripts = ["send_all_csvs.py", "send_csv.py"]
+    try:
+        result = subprocess.run(["crontab", "-l"], capture_output=True, text=True)
+        if any(script in result.stdout for script in legacy_scripts):
+            subprocess.run(["bash", SETUP_CRON_PATH], check=True)
+            return "Status do setup_cron: Cron antigo removido. Sincronização interna ativa."
+        return "Status do setup_cron: Sincronização interna ativa."
+    except (subprocess.CalledProcessError, OSError) as e:
+        return f"Status do setup_cron: Erro ao verificar/remover cron - {e}"
+
+
+class ScanEngine:
+    """Núcleo de leitura, envio e backup offline, sem dependência de interface.
+
+    Recebe as teclas do leitor, envia os códigos de barras, grava as falhas
+    no diário e sincroniza o backlog. Os clientes (a janela Tk ou o log do
+    serviço) acompanham o que acontece por add_listener: cada callback recebe
+    (evento, mensagem, dados) a partir de qualquer thread do motor.
+    """
+
+    def __init__(self):
+        self.listeners = []
+        # MAC, IP e ids do dispositivo calculados uma vez; cada leitura usa o retrato em cache
+        self.identity = get_identity(IDENTITY_TTL)
+        # Valores de execução em state.json; o .env só é regravado quando a configuração muda
+        self.state = StateStore(STATE_PATH, STATE_FLUSH_INTERVAL)
+        if self.state.get('last_sent_timestamp') is None and os.getenv('LAST_SENT_TIMESTAMP'):
+            self.state.set('last_sent_timestamp', os.getenv('LAST_SENT_TIMESTAMP'))
+        # Número de sequência do dispositivo, junto com o scan_id, identifica cada leitura no servidor
+        self.sequence = Sequence(self.state, 'scan_seq')
+        self.config_watcher = ConfigWatcher(ENV_PATH, self.reload_config)
+        # Diário de backup: recupera segmentos interrompidos antes de abrir o outbox
+        self.journal = Journal(JOURNAL_DIR, JOURNAL_FSYNC_INTERVAL, JOURNAL_FSYNC_RECORDS, JOURNAL_SEGMENT_MAX_BYTES, JOURNAL_SEGMENT_MAX_AGE,
+                               JOURNAL_COMPRESSION)
+        self.outbox = Outbox(OUTBOX_DB_PATH)
+        # Leituras repetidas recentes, recarregadas do outbox para valer também após um reinício
+        self.dedup = DedupCache(DEDUP_WINDOW, DEDUP_CAPACITY, parse_windows(DEDUP_WINDOWS), store=self.outbox,
+                                flush_interval=DEDUP_FLUSH_INTERVAL)
+
+        # Núcleo de rede assíncrono (NETWORK_CORE=async): None mantém as threads e o requests
+        self.network = create_network(NETWORK_CORE, LARAVEL_STORE_ENDPOINT, SENDER_WORKERS + UPLOAD_CONCURRENCY, HTTP_TIMEOUT)
+
+        # Estado de conectividade compartilhado entre o envio e os clientes
+        if self.network is not None:
+            self.connectivity = AsyncConnectivityMonitor(self.network, LARAVEL_STORE_ENDPOINT, ttl=CONNECTIVITY_TTL, max_backoff=CONNECTIVITY_MAX_BACKOFF)
+        else:
+            self.connectivity = ConnectivityMonitor(LARAVEL_STORE_ENDPOINT, ttl=CONNECTIVITY_TTL, max_backoff=CONNECTIVITY_MAX_BACKOFF)
+        self.connectivity.add_listener(self.on_connectivity)
+
+        # Sincronização do backlog offline: ao voltar a conexão, por volume de backlog e periodicamente
+        # Cada dispositivo da filial sincroniza no seu ponto do intervalo (SYNC_SCHEDULE=hashed)
+        device = self.identity.snapshot()
+        self.scheduler = SyncScheduler(self.run_sync, on_done=self.on_sync_done, device_key=device.mac_address or device.raspberry_id or '')
+        self.connectivity.add_listener(self.scheduler.on_connectivity)
+
+        # Política de novas tentativas: circuito por endpoint e fila de tentativas pelo horário da próxima
+        self.scan_breaker = endpoint_breaker(SCAN_PATH)
+        self.batch_breaker = endpoint_breaker(SENDER_BATCH_PATH)
+        self.retry_queue = RetryQueue(self.retry_scan)
+        self.retry_attempts = {}  # scan_id -> tentativas já feitas
+
+        # Transporte HTTP compartilhado (keep-alive) e pool de envio dos códigos de barras;
+        # no núcleo assíncrono o envio são tarefas do loop e o transporte é a ponte para o backlog
+        if self.network is not None:
+            self.transport = AsyncTransport(self.network)
+            self.sender = AsyncScanSender(
+                self.network, self.send_data_async, self.on_sender_overflow, SENDER_WORKERS, SENDER_QUEUE_SIZE,
+                batch_handler=self.send_batch_async,
+                batch_size=SENDER_BATCH_SIZE if SENDER_BATCH_MODE else 1,
+                linger=SENDER_BATCH_LINGER_MS / 1000
+            )
+        else:
+            self.transport = create_transport(TRANSPORT, LARAVEL_STORE_ENDPOINT, SENDER_WORKERS, HTTP_TIMEOUT)
+            self.sender = ScanSender(
+                self.send_data, self.on_sender_overflow, SENDER_WORKERS, SENDER_QUEUE_SIZE,
+                batch_handler=self.send_batch,
+                batch_size=SENDER_BATCH_SIZE if SENDER_BATCH_MODE else 1,
+                linger=SENDER_BATCH_LINGER_MS / 1000
+            )
+
+        # Monta as leituras do leitor fora de qualquer thread de interface
+        self.scanner = ScanFramer(
+            self.process_barcode,
+            char_timeout=SCANNER_CHAR_TIMEOUT_MS / 1000,
+            max_interval=SCANNER_MAX_INTERVAL_MS / 1000,
+            min_length=SCANNER_MIN_LENGTH,
+            accept_manual=SCANNER_ACCEPT_MANUAL
+        )
+        self.listener = None
+        self.enter_key = None
+
+        # Horário de entrada na fila de cada payload (por id) para a latência até a confirmação
+        self.enqueued_at = {}
+        # Métricas lidas só na coleta, sem custo por leitura
+        metrics.gauge('sender_queue_depth', "Leituras aguardando na fila de envio", self.sender.pending)
+        metrics.gauge('outbox_pending', "Batimentos pendentes no backlog offline", self.outbox.pending_total)
+        metrics.gauge('dedup_suppressed_total', "Leituras repetidas suprimidas", lambda: self.dedup.suppressed, kind='counter')
+        self.metrics_server = None
+        self.metrics_writer = None
+        self.first_scan_seen = False
+        startup.mark('engine')
+
+    def add_listener(self, callback):
+        """Registra callback(evento, mensagem, dados); chamado de threads do motor."""
+        self.listeners.append(callback)
+
+    def emit(self, event, message, **data):
+        for callback in self.listeners:
+            try:
+                callback(event, message, data)
+            except Exception as e:
+                logging.error(f"Erro ao notificar evento do motor ({event}): {e}")
+
+    def start(self, backend=SCANNER_BACKEND):
+        """Inicia a leitura do leitor e, em seguida, a sincronização e os monitores.
+
+        A leitura vem primeiro para o dispositivo aceitar batidas o quanto
+        antes. O que a primeira leitura não precisa (sessão HTTP e import do
+        requests, endpoint de métricas) é preparado em segundo plano por warm_up().
+        """
+        self.start_capture(backend)
+        startup.mark('capture')
+        self.scheduler.start()
+        self.retry_queue.start()
+        self.connectivity.start()
+        self.identity.start()
+        self.config_watcher.start()
+        threading.Thread(target=self.warm_up, name="engine-warm-up", daemon=True).start()
+
+    def start_capture(self, backend):
+        # Iniciar listener de teclas ou a leitura direta do dispositivo do leitor;
+        # backend=None não lê teclas (as leituras chegam pelo framer, como no benchmark)
+        if backend is None:
+            return
+        if backend == 'pynput':
+            # pynput precisa de uma sessão X; só é importado quando este backend é usado
+            from pynput import keyboard
+            self.enter_key = keyboard.Key.enter
+            self.listener = keyboard.Listener(on_press=self.on_key_press)
+        else:
+            self.listener = create_reader(backend, SCANNER_DEVICE, self.scanner, baudrate=SCANNER_SERIAL_BAUD, grab=SCANNER_GRAB)
+        self.listener.start()
+
+    def warm_up(self):
+        try:
+            warm_up = getattr(self.transport, 'warm_up', None)
+            if warm_up is not None:
+                warm_up()
+            self.start_metrics()
+            startup.mark('warm_up')
+        except Exception as e:
+            logging.error(f"Erro ao preparar o envio em segundo plano: {e}")
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+        self.scanner.stop()
+        # Tentativas ainda agendadas vão para o backup offline antes de parar o envio
+        for payload in self.retry_queue.stop():
+            self.on_sender_overflow(payload)
+        self.sender.stop()
+        self.scheduler.stop()
+        self.connectivity.stop()
+        self.identity.stop()
+        self.config_watcher.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.metrics_writer is not None:
+            self.metrics_writer.stop()
+        self.transport.close()
+        if self.network is not None:
+            self.network.close()
+        self.journal.close()
+        self.dedup.close()
+        self.outbox.close()
+        self.state.close()
+
+    def start_metrics(self):
+        if METRICS_PORT:
+            try:
+                self.metrics_server = metrics.MetricsServer(METRICS_HOST, METRICS_PORT)
+                self.metrics_server.start()
+            except OSError as e:
+                logging.error(f"Não foi possível abrir o endpoint de métricas em {METRICS_HOST}:{METRICS_PORT}: {e}")
+        if METRICS_SNAPSHOT_PATH:
+            self.metrics_writer = metrics.SnapshotWriter(METRICS_SNAPSHOT_PATH, METRICS_SNAPSHOT_INTERVAL)
+            self.metrics_writer.start()
+
+    def on_key_press(self, key):
+        try:
+            # Só alimenta o buffer do leitor; nenhum trabalho por tecla
+            if key == self.enter_key:
+                self.scanner.feed_enter()
+            elif hasattr(key, 'char') and key.char is not None:
+                self.scanner.feed_char(key.char)
+        except Exception as e:
+            logging.error(f"Erro ao processar tecla pressionada: {e}")
+
+    def process_barcode(self, barcode, source='scanner'):
+        """Recebe uma leitura completa do leitor e a envia para a fila de envio."""
+        started = time.perf_counter()
+        try:
+            barcode = barcode.strip()
+            timestamp = datetime.now().strftime('%H:%M')
+            self.emit(SCAN, f"Codigo de barras batido: {barcode} - {timestamp}", barcode=barcode, timestamp=timestamp, source=source)
+
+            if not barcode:
+                return
+            identity = self.identity.snapshot()
+            if not self.dedup.accept(barcode, identity.raspberry_id):
+                suppressed = self.dedup.suppressed
+                self.emit(DUPLICATE_SCAN, f"Leitura repetida ignorada: {barcode} ({suppressed} repetições ignoradas)", barcode=barcode, suppressed=suppressed)
+                return
+            SCANS.inc()
+            self.insert_data(identity.raspberry_id, barcode, identity.filial_id)
+            SCAN_TO_ENQUEUE.observe(time.perf_counter() - started)
+            if not self.first_scan_seen:
+                self.first_scan_seen = True
+                startup.mark('first_scan')
+                startup.report(STARTUP_REPORT_PATH)
+        except Exception as e:
+            logging.error(f"Erro ao processar código de barras: {e}")
+
+    def insert_data(self, raspberry_id, codigobarras, filial_id):
+        try:
+            data_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # Identificação gerada na leitura: o mesmo scan_id vai no envio online e no backlog,
+            # e o servidor responde 409 a um scan_id que já recebeu
+            payload = {
+                'scan_id': uuid.uuid4().hex,
+                'seq': self.sequence.next(),
+                'raspberry_id': raspberry_id,
+                'codigo_barras': codigobarras,
+                'data_time': data_time,
+                'filial_id': filial_id,
+                'mac_address': self.identity.snapshot().mac_address,
+                'tipo': 'online'
+            }
+            self.enqueued_at[id(payload)] = time.perf_counter()
+            self.sender.submit(raspberry_id, payload)
+        except Exception as e:
+            logging.error(f"Erro ao inserir dados: {e}")
+
+    def send_blocked(self, breaker):
+        """Motivo para não tentar o envio agora (sem conexão ou circuito do endpoint aberto), ou None."""
+        if not self.is_internet_available():
+            return "Sem conexão com a internet. Salvando no CSV."
+        if not breaker.allow():
+            return f"Servidor instável: envio pausado por {breaker.retry_in():.0f}s. Salvando no CSV."
+        return None
+
+    def send_data(self, payload):
+        codigobarras = payload['codigo_barras']
+
+        self.emit(STATUS, f"Status: Enviando código de barras {codigobarras}...")
+        blocked = self.send_blocked(self.scan_breaker)
+        if blocked:
+            self.emit(LOG, blocked)
+            self.scan_failed(payload)
+            self.emit(STATUS, "Status: Aguardando...")
+            return
+
+        try:
+            response = self.transport.post(SCAN_PATH, json=payload)
+        except TransportError as e:
+            self.connectivity.report_failure()
+            self.scan_breaker.record_failure()
+            self.scan_retry(payload, f"Erro ao tentar conectar: {e}")
+        else:
+            # Qualquer resposta HTTP prova que o servidor está alcançável
+            self.connectivity.report_success()
+            self.handle_scan_response(payload, response)
+
+        self.emit(STATUS, "Status: Aguardando...")
+
+    async def send_data_async(self, payload):
+        """send_data do núcleo assíncrono: o POST é uma tarefa do loop e a gravação no diário roda fora dele."""
+        codigobarras = payload['codigo_barras']
+
+        self.emit(STATUS, f"Status: Enviando código de barras {codigobarras}...")
+        blocked = self.send_blocked(self.scan_breaker)
+        if blocked:
+            self.emit(LOG, blocked)
+            await self.network.run_blocking(self.scan_failed, payload)
+            self.emit(STATUS, "Status: Aguardando...")
+            return
+
+        try:
+            response = await self.network.post(SCAN_PATH, json=payload)
+        except TransportError as e:
+            self.connectivity.report_failure()
+            self.scan_breaker.record_failure()
+            await self.network.run_blocking(self.scan_retry, payload, f"Erro ao tentar conectar: {e}")
+        else:
+            self.connectivity.report_success()
+            await self.network.run_blocking(self.handle_scan_response, payload, response)
+
+        self.emit(STATUS, "Status: Aguardando...")
+
+    def handle_scan_response(self, payload, response):
+        codigobarras = payload['codigo_barras']
+        status = response.status_code
+        kind = classify(status, RETRY_PERMANENT_STATUSES)
+        self.scan_breaker.record(kind)
+        if kind == DUPLICATE:
+            self.scan_succeeded(payload, status)
+            self.emit(RESPONSE, f"Resposta do Endpoint: código {codigobarras} já recebido anteriormente.")
+        elif kind == SUCCESS:
+            self.scan_succeeded(payload, status)
+            try:
+                body = response.json()
+            except ValueError:
+                # 202/204 podem vir sem corpo
+                body = response.text or describe(status)
+            self.emit(RESPONSE, f"Resposta do Endpoint: {body}")
+        else:
+            self.scan_outcome(payload, kind, status, response)
+
+    def scan_outcome(self, payload, kind, status, response=None):
+        """Destino de uma leitura não confirmada pela classe da resposta: dead-letter, nova tentativa ou backup offline."""
+        message = f"Erro do Endpoint ({status}): {describe(status)}"
+        if kind == PERMANENT:
+            self.scan_rejected(payload, status, message)
+        elif kind == RETRYABLE:
+            self.scan_retry(payload, message if status is not None else f"Sem confirmação do servidor para {payload['codigo_barras']}.", response)
+        else:
+            self.scan_failed(payload, message)
+
+    def send_batch(self, payloads):
+        """Envia vários códigos de barras em uma única requisição (SENDER_BATCH_MODE)."""
+        self.emit(STATUS, f"Status: Enviando lote de {len(payloads)} códigos de barras...")
+        blocked = self.send_blocked(self.batch_breaker)
+        if blocked:
+            self.emit(LOG, blocked)
+            self.batch_failed(payloads)
+            self.emit(STATUS, "Status: Aguardando...")
+            return
+
+        try:
+            response = self.transport.post(SENDER_BATCH_PATH, json=payloads)
+        except TransportError as e:
+            self.connectivity.report_failure()
+            self.batch_breaker.record_failure()
+            self.batch_retry(payloads, f"Erro ao tentar conectar: {e}")
+        else:
+            self.connectivity.report_success()
+            if not self.handle_batch_response(payloads, response):
+                for payload in payloads:
+                    self.send_data(payload)
+                return
+
+        self.emit(STATUS, "Status: Aguardando...")
+
+    async def send_batch_async(self, payloads):
+        """send_batch do núcleo assíncrono."""
+        self.emit(STATUS, f"Status: Enviando lote de {len(payloads)} códigos de barras...")
+        blocked = self.send_blocked(self.batch_breaker)
+        if blocked:
+            self.emit(LOG, blocked)
+            await self.network.run_blocking(self.batch_failed, payloads)
+            self.emit(STATUS, "Status: Aguardando...")
+            return
+
+        try:
+            response = await self.network.post(SENDER_BATCH_PATH, json=payloads)
+        except TransportError as e:
+            self.connectivity.report_failure()
+            self.batch_breaker.record_failure()
+            await self.network.run_blocking(self.batch_retry, payloads, f"Erro ao tentar conectar: {e}")
+        else:
+            self.connectivity.report_success()
+            if not await self.network.run_blocking(self.handle_batch_response, payloads, response):
+                for payload in payloads:
+                    await self.send_data_async(payload)
+                return
+
+        self.emit(STATUS, "Status: Aguardando...")
+
+    def handle_batch_response(self, payloads, response):
+        """Confirma, agenda nova tentativa ou grava cada item do lote. Retorna False se o servidor não aceita lotes (reenviar item a item)."""
+        if SENDER_BATCH_FALLBACK and response.status_code in (404, 405, 415):
+            logging.warning(f"Servidor não aceita envio em lote ({response.status_code}). Voltando ao envio individual.")
+            self.sender.batch_size = 1
+            return False
+        self.batch_breaker.record(classify(response.status_code, RETRY_PERMANENT_STATUSES))
+        statuses = parse_batch_results(response, len(payloads), [payload['scan_id'] for payload in payloads])
+        for payload, status in zip(payloads, statuses):
+            kind = classify(status, RETRY_PERMANENT_STATUSES)
+            if kind in (SUCCESS, DUPLICATE):
+                self.scan_succeeded(payload, status)
+            else:
+                self.scan_outcome(payload, kind, status, response)
+        self.emit(RESPONSE, f"Resposta do Endpoint (lote de {len(payloads)}): {response.status_code}")
+        return True
+
+    def batch_failed(self, payloads, error_message=None):
+        for payload in payloads:
+            self.scan_failed(payload, error_message)
+
+    def batch_retry(self, payloads, error_message):
+        for payload in payloads:
+            self.scan_retry(payload, error_message)
+
+    def scan_succeeded(self, payload, status=200):
+        codigobarras, data_time = payload['codigo_barras'], payload['data_time']
+        enqueued_at = self.enqueued_at.pop(id(payload), None)
+        if enqueued_at is not None:
+            ENQUEUE_TO_ACK.observe(time.perf_counter() - enqueued_at)
+        self.retry_attempts.pop(payload['scan_id'], None)
+        SCANS_SENT.inc()
+        if status == 409:
+            SCANS_ALREADY_ACKED.inc()
+        self.update_last_sent_timestamp(data_time)
+        self.emit(SENT, f"Enviado com sucesso: {codigobarras} - {data_time}", barcode=codigobarras, data_time=data_time)
+        self.emit(STATUS, f"Status: Código de barras {codigobarras} enviado com sucesso.")
+
+    def scan_retry(self, payload, error_message, response=None):
+        """Falha passageira: agenda nova tentativa com backoff; esgotadas as tentativas, vai para o backup offline."""
+        codigobarras, data_time = payload['codigo_barras'], payload['data_time']
+        attempt = self.retry_attempts.get(payload['scan_id'], 0)
+        if attempt >= RETRY_MAX_ATTEMPTS:
+            self.scan_failed(payload, f"{error_message} Sem sucesso após {attempt + 1} tentativas.")
+            return
+        # Com o circuito aberto a tentativa espera pelo menos até a requisição de teste
+        delay = max(retry_delay(response, attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY), self.scan_breaker.retry_in())
+        self.retry_attempts[payload['scan_id']] = attempt + 1
+        if not self.retry_queue.schedule(delay, payload):
+            self.scan_failed(payload, error_message)
+            return
+        self.emit(ERROR, error_message)
+        self.emit(RETRY, f"Nova tentativa em {delay:.0f}s: {codigobarras} - {data_time}", barcode=codigobarras, data_time=data_time, delay=delay)
+
+    def retry_scan(self, payload):
+        """Chamado pela fila de tentativas quando chega a hora: a leitura volta para a fila de envio."""
+        self.sender.submit(payload['raspberry_id'], payload)
+
+    def scan_rejected(self, payload, status, error_message):
+        """Recusa definitiva do servidor (400/422): a leitura vai para o dead-letter do outbox, fora do backlog."""
+        codigobarras, data_time = payload['codigo_barras'], payload['data_time']
+        self.enqueued_at.pop(id(payload), None)
+        self.retry_attempts.pop(payload['scan_id'], None)
+        SCANS_REJECTED.inc()
+        self.emit(ERROR, error_message)
+        try:
+            self.outbox.dead_letter([{
+                'key': payload['scan_id'],
+                'seq': payload.get('seq'),
+                'timestamp': data_time,
+                'raspberry_id': payload['raspberry_id'],
+                'codigobarras': codigobarras,
+                'filial_id': payload['filial_id'],
+                'mac_address': payload['mac_address'],
+                'source': 'online'
+            }], status, describe(status))
+        except Exception as e:
+            logging.error(f"Erro ao gravar código de barras recusado no dead-letter: {e}")
+        self.emit(REJECTED, f"Recusado pelo servidor ({status}): {codigobarras} - {data_time}", barcode=codigobarras, data_time=data_time, status=status)
+
+    def scan_failed(self, payload, error_message=None):
+        """Registra a falha e grava o código de barras no backup offline."""
+        codigobarras, data_time = payload['codigo_barras'], payload['data_time']
+        self.enqueued_at.pop(id(payload), None)
+        self.retry_attempts.pop(payload.get('scan_id'), None)
+        SCANS_OFFLINE.inc()
+        if error_message:
+            self.emit(ERROR, error_message)
+        self.backup_data_csv(payload['raspberry_id'], codigobarras, payload['filial_id'], data_time, payload['mac_address'],
+                             payload.get('scan_id'), payload.get('seq'))
+        self.emit(FAILED, f"Falha ao enviar: {codigobarras} - {data_time}", barcode=codigobarras, data_time=data_time)
+        self.scheduler.notify_backlog()
+        if error_message:
+            self.emit(STATUS, f"Status: Falha ao enviar código de barras {codigobarras}.")
+
+    def on_sender_overflow(self, payload):
+        """Fila de envio cheia: grava direto no backup local sem bloquear a leitura de teclas."""
+        self.enqueued_at.pop(id(payload), None)
+        SCANS_OFFLINE.inc()
+        self.backup_data_csv(payload['raspberry_id'], payload['codigo_barras'], payload['filial_id'], payload['data_time'], payload['mac_address'],
+                             payload.get('scan_id'), payload.get('seq'))
+        self.emit(FAILED, f"Falha ao enviar (fila cheia): {payload['codigo_barras']} - {payload['data_time']}", barcode=payload['codigo_barras'], data_time=payload['data_time'])
+        self.scheduler.notify_backlog()
+
+    def update_last_sent_timestamp(self, timestamp):
+        try:
+            # Só memória; o StateStore junta as gravações em disco
+            self.state.set('last_sent_timestamp', timestamp)
+        except Exception as e:
+            logging.error(f"Erro ao atualizar timestamp do último envio: {e}")
+
+    def get_last_sent_timestamp(self):
+        return self.state.get('last_sent_timestamp') or 'Nunca'
+
+    def reload_config(self):
+        """Relê o .env e aplica um novo LARAVEL_STORE_ENDPOINT e os ids do dispositivo sem reiniciar."""
+        global LARAVEL_STORE_ENDPOINT
+        load_dotenv(ENV_PATH, override=True)
+        self.identity.refresh()
+        endpoint = os.getenv('LARAVEL_STORE_ENDPOINT')
+        if endpoint != LARAVEL_STORE_ENDPOINT:
+            LARAVEL_STORE_ENDPOINT = endpoint
+            self.transport.base_url = endpoint
+            self.connectivity.set_endpoint(endpoint)
+            self.emit(CONFIG, f"Servidor: {endpoint}", endpoint=endpoint)
+
+    def is_internet_available(self):
+        try:
+            # Consulta o estado em cache do monitor; nunca bloqueia o envio
+            return self.connectivity.is_online()
+        except Exception as e:
+            logging.error(f"Erro ao verificar conexão com a internet: {e}")
+            return False
+
+    def on_connectivity(self, online):
+        self.emit(CONNECTIVITY, "Internet: Online" if online else "Internet: Offline", online=online)
+
+    def backup_data_csv(self, raspberry_id, codigobarras, filial_id, data_time, mac_address=None, scan_id=None, seq=None):
+        try:
+            # O scan_id da leitura vira a chave de idempotência no outbox e no envio do backlog
+            self.journal.append({
+                'key': scan_id or uuid.uuid4().hex,
+                'seq': seq,
+                'timestamp': data_time,
+                'raspberry_id': raspberry_id,
+                'codigobarras': codigobarras,
+                'filial_id': filial_id,
+                'mac_address': mac_address or self.identity.snapshot().mac_address
+            })
+        except Exception as e:
+            logging.error(f"Erro ao fazer backup de dados no diário: {e}")
+
+    def load_backlog(self):
+        """Sela o segmento ativo do diário e passa os segmentos selados e os CSVs legados para o outbox."""
+        self.journal.seal()
+        return ingest_local_backlog(self.outbox)
+
+    def run_sync(self, concurrency):
+        """Rodada de sincronização chamada pelo SyncScheduler, na thread dele."""
+        # Sela o segmento ativo para que os batimentos mais recentes entrem nesta rodada
+        self.journal.seal()
+        # No núcleo assíncrono os POSTs do backlog também são tarefas do loop, no pool compartilhado
+        transport_factory = (lambda: self.transport) if self.network is not None else None
+        return run_sync(self.outbox, concurrency, transport_factory)
+
+    def trigger_sync(self, concurrency=UPLOAD_CONCURRENCY):
+        self.scheduler.trigger(concurrency)
+
+    def retry_failed(self):
+        """Tenta de novo agora as leituras agendadas e devolve o dead-letter ao backlog. Retorna (agendadas, devolvidas)."""
+        scheduled = self.retry_queue.retry_now()
+        requeued = self.outbox.requeue_dead()
+        if requeued:
+            self.trigger_sync()
+        return scheduled, requeued
+
+    def on_sync_done(self, sent, error):
+        if error is not None:
+            self.emit(ERROR, f"Erro ao enviar backlog offline: {error}")
+        elif sent is None:
+            self.emit(LOG, "Envio do backlog já em andamento.")
+        elif sent:
+            self.emit(LOG, f"{sent} códigos de barras do backlog enviados com sucesso.")
+
+
+def notify_systemd(state):
+    """Envia sd_notify (READY=1, STOPPING=1) quando rodando como serviço Type=notify."""
+    address = os.getenv('NOTIFY_SOCKET')
+    if not address:
+        return
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(state.encode(), address)
+    except OSError as e:
+        logging.warning(f"Não foi possível notificar o systemd: {e}")
+
+def log_event(event, message, data):
+    """Cliente do motor no modo sem interface: os eventos vão para o log (journald)."""
+    if event == ERROR:
+        logging.error(message)
+    elif event == FAILED:
+        logging.warning(message)
+    elif event == STATUS:
+        logging.debug(message)
+    else:
+        logging.info(message)
+
+def run_headless():
+    """Roda o motor sem interface, em primeiro plano, até receber SIGTERM ou SIGINT.
+
+    A leitura é liberada (READY=1) antes da verificação do cron e da
+    passagem do backup local para o outbox, que não atrasam a primeira leitura.
+    """
+    startup.mark('imports')
+    stopped = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stopped.set())
+
+    engine = ScanEngine()
+    engine.add_listener(log_event)
+    if SCANNER_BACKEND == 'pynput' and not os.getenv('DISPLAY'):
+        logging.warning("SCANNER_BACKEND=pynput precisa de uma sessão X; use evdev ou serial no modo sem interface.")
+    engine.start()
+    notify_systemd('READY=1')
+    logging.info("Motor de leitura e envio iniciado sem interface.")
+
+    logging.info(remove_legacy_cron())
+    ingested = engine.load_backlog()
+    if ingested:
+        logging.info(f"{ingested} códigos de barras do backup local passados para o outbox.")
+    startup.mark('deferred')
+    startup.report(STARTUP_REPORT_PATH)
+
+    stopped.wait()
+    notify_systemd('STOPPING=1')
+    logging.info("Encerrando o motor de leitura e envio.")
+    engine.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run_headless()
@@ -0,0 +1,268 @@
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmark import mock_stats, percentile, start_mock
+
+# Simulador de frota: N dispositivos virtuais (RASPBERRY_ID e MAC próprios) num só processo,
+# cada um com outbox e SyncScheduler próprios, contra o mock do Laravel (mock_laravel.py):
+#   python3 fleet_sim.py --devices 40 --backlog 2000 --outage 5 --interval 30 --spread 15 --capacity 8
+# Compara os modos de agendamento (SYNC_SCHEDULE) no mesmo cenário: queda de conexão da filial
+# inteira, volta simultânea e, opcionalmente, quedas avulsas de alguns dispositivos.
+# Os tempos são encurtados (interval e spread em segundos de simulação, não uma hora).
+
+SCHEDULES = ('interval', 'jitter', 'hashed')
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.values = []
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.values.append(seconds)
+
+    def summary(self):
+        with self.lock:
+            values = list(self.values)
+        return {name: round(percentile(values, p) * 1000, 1) if values else None
+                for name, p in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))}
+
+
+class TimedTransport:
+    """Transporte de um worker do dispositivo, medindo a latência de cada post() no cliente."""
+
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    def post(self, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.transport.post(path, **kwargs)
+        finally:
+            self.recorder.add(time.perf_counter() - started)
+
+    def close(self):
+        self.transport.close()
+
+
+class VirtualDevice:
+    """Um dispositivo da frota com o outbox, o envio em lotes e o SyncScheduler de produção."""
+
+    def __init__(self, index, workdir, endpoint, schedule, args, outages, recorder, started_at):
+        import sync
+        from outbox import Outbox
+        from transport import create_transport
+
+        self.raspberry_id = str(1000 + index)
+        self.mac_address = '02:00:{:02x}:{:02x}:{:02x}:{:02x}'.format(*index.to_bytes(4, 'big'))
+        self.outages = outages
+        self.started_at = started_at
+        self.args = args
+        self.outbox = Outbox(os.path.join(workdir, f"device_{index:04d}.db"))
+        self.transport_factory = lambda: TimedTransport(
+            create_transport(sync.TRANSPORT, endpoint, pool_size=1, timeout=sync.UPLOAD_TIMEOUT), recorder
+        )
+        self.scheduler = sync.SyncScheduler(
+            self.run_sync, interval=args.interval, backlog_threshold=10 ** 9,
+            schedule=schedule, spread=args.spread, device_key=self.mac_address
+        )
+        self.was_online = self.online(0)
+        self.scan_credit = 0.0
+        self.sequence = 0
+
+    def online(self, elapsed):
+        return not any(start <= elapsed < end for start, end in self.outages)
+
+    def make_records(self, count, start):
+        records = []
+        for offset in range(count):
+            self.sequence += 1
+            records.append({
+                'key': uuid.uuid4().hex,
+                'seq': self.sequence,
+                'timestamp': (start + timedelta(seconds=offset)).strftime('%Y-%m-%d %H:%M:%S'),
+                'raspberry_id': self.raspberry_id,
+                'codigobarras': f"{random.randint(0, 10 ** 12):012d}",
+                'filial_id': '1',
+                'mac_address': self.mac_address,
+            })
+        return records
+
+    def tick(self, elapsed, dt):
+        """Avança o relógio do dispositivo: leituras offline entram no outbox e a volta da conexão avisa o agendador."""
+        online = self.online(elapsed)
+        if not online:
+            self.scan_credit += self.args.scan_rate * dt
+            if self.scan_credit >= 1:
+                count = int(self.scan_credit)
+                self.scan_credit -= count
+                self.outbox.enqueue_many(self.make_records(count, datetime.now()))
+        elif not self.was_online:
+            self.scheduler.on_connectivity(True)
+        self.was_online = online
+
+    def run_sync(self, concurrency):
+        import sync
+        import uploader
+
+        # Sem conexão a rodada real falha na hora; aqui ela nem chega ao servidor
+        if not self.online(time.monotonic() - self.started_at):
+            return None
+        return uploader.drain_outbox(
+            self.outbox, self.transport_factory, self.mac_address,
+            max_rows=sync.UPLOAD_BATCH_SIZE, max_bytes=sync.UPLOAD_CHUNK_BYTES,
+            compression=sync.UPLOAD_COMPRESSION, timeout=sync.UPLOAD_TIMEOUT,
+            concurrency=concurrency, rate=sync.UPLOAD_RATE_LIMIT,
+            time_budget=sync.SYNC_TIME_BUDGET, max_retries=sync.UPLOAD_MAX_RETRIES
+        )
+
+
+def fleet_outages(args, rng):
+    """Janelas offline de cada dispositivo: a queda da filial inteira e, para uma fração flaky, uma queda avulsa."""
+    outages = []
+    for _ in range(args.devices):
+        windows = [(0, args.outage)] if args.outage else []
+        if rng.random() < args.flaky:
+            start = args.outage + rng.uniform(0, args.interval)
+            windows.append((start, start + args.flaky_seconds))
+        outages.append(windows)
+    return outages
+
+
+def simulate(schedule, args):
+    workdir = tempfile.mkdtemp(prefix=f'staf-fleet-{schedule}-')
+    process, endpoint = start_mock(args, ['--capacity', str(args.capacity), '--load-latency-ms', str(args.load_latency_ms),
+                                          '--retry-after', str(args.retry_after)])
+    rng = random.Random(args.seed)
+    recorder = LatencyRecorder()
+    devices = []
+    try:
+        started_at = time.monotonic()
+        for index, outages in enumerate(fleet_outages(args, rng)):
+            device = VirtualDevice(index, workdir, endpoint, schedule, args, outages, recorder, started_at)
+            device.outbox.enqueue_many(device.make_records(args.backlog, datetime.now() - timedelta(days=1)))
+            devices.append(device)
+        # Todos ligam juntos, como depois de uma queda de energia na filial
+        started_at = time.monotonic()
+        for device in devices:
+            device.started_at = started_at
+            device.scheduler.start()
+
+        last_outage = max((end for device in devices for _, end in device.outages), default=0)
+        samples = []
+        drained_at = None
+        elapsed = 0.0
+        while elapsed < args.duration:
+            time.sleep(args.tick)
+            now = time.monotonic() - started_at
+            dt, elapsed = now - elapsed, now
+            for device in devices:
+                device.tick(elapsed, dt)
+            stats = mock_stats(endpoint)
+            if stats is not None:
+                samples.append(stats['in_flight'])
+            if elapsed >= last_outage and sum(device.outbox.pending_total() for device in devices) == 0:
+                drained_at = elapsed
+                break
+
+        for device in devices:
+            device.scheduler.stop(timeout=30)
+        server = mock_stats(endpoint) or {}
+        active = [sample for sample in samples if sample > 0]
+        return {
+            'schedule': schedule,
+            'devices': args.devices,
+            'rows_sent': server.get('offline_rows'),
+            'pending': sum(device.outbox.pending_total() for device in devices),
+            'drain_seconds': round(drained_at - args.outage, 2) if drained_at is not None else None,
+            'requests': server.get('requests'),
+            'overloaded_503': server.get('overloaded'),
+            'max_in_flight': server.get('max_in_flight'),
+            'p95_in_flight': percentile(active, 95) if active else 0,
+            'latency_ms': recorder.summary(),
+        }
+    finally:
+        for device in devices:
+            device.outbox.close()
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def configure_environment(args):
+    """Parâmetros do envio offline lidos pelo sync.py; precisa vir antes de importá-lo."""
+    os.environ.update({
+        'UPLOAD_RATE_LIMIT': str(args.rate),
+        'UPLOAD_BATCH_SIZE': str(args.batch_size),
+        'UPLOAD_CONCURRENCY': str(args.concurrency),
+        'UPLOAD_MAX_RETRIES': str(args.max_retries),
+    })
+
+
+def print_table(results):
+    columns = ['schedule', 'rows_sent', 'pending', 'drain_seconds', 'requests', 'overloaded_503', 'max_in_flight', 'p95_in_flight']
+    latency = ['p50', 'p95', 'p99', 'max']
+    header = columns + [f"lat_{name}_ms" for name in latency]
+    rows = [[str(result[column]) for column in columns] + [str(result['latency_ms'][name]) for name in latency] for result in results]
+    widths = [max(len(cell) for cell in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulador de frota: sincronização de vários dispositivos contra um mesmo servidor.")
+    parser.add_argument('--schedule', choices=SCHEDULES + ('all',), default='all', help="modo de agendamento (all compara os três)")
+    parser.add_argument('--endpoint', help="usa este servidor em vez de subir o mock_laravel.py")
+    parser.add_argument('--json', action='store_true', help="saída em JSON")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--verbose', action='store_true', help="mostra o log do envio de cada dispositivo")
+    fleet = parser.add_argument_group('frota')
+    fleet.add_argument('--devices', type=int, default=30)
+    fleet.add_argument('--backlog', type=int, default=1500, help="linhas pendentes em cada dispositivo no início")
+    fleet.add_argument('--scan-rate', type=float, default=2, help="leituras por segundo gravadas offline em cada dispositivo")
+    fleet.add_argument('--outage', type=float, default=5, help="segundos iniciais com a filial inteira offline")
+    fleet.add_argument('--flaky', type=float, default=0.2, help="fração dos dispositivos com uma queda avulsa depois")
+    fleet.add_argument('--flaky-seconds', type=float, default=3)
+    fleet.add_argument('--interval', type=float, default=30, help="SYNC_INTERVAL simulado, em segundos")
+    fleet.add_argument('--spread', type=float, default=10, help="SYNC_SPREAD simulado, em segundos")
+    fleet.add_argument('--duration', type=float, default=120, help="tempo máximo de cada simulação")
+    fleet.add_argument('--tick', type=float, default=0.1, help="passo do relógio e da amostragem do servidor")
+    upload = parser.add_argument_group('envio de cada dispositivo')
+    upload.add_argument('--concurrency', type=int, default=2)
+    upload.add_argument('--rate', type=float, default=2, help="requisições por segundo por dispositivo")
+    upload.add_argument('--batch-size', type=int, default=500)
+    upload.add_argument('--max-retries', type=int, default=3)
+    mock = parser.add_argument_group('servidor (mock)')
+    mock.add_argument('--capacity', type=int, default=8, help="requisições simultâneas atendidas (0 = sem limite)")
+    mock.add_argument('--load-latency-ms', type=float, default=5, help="latência extra por requisição simultânea")
+    mock.add_argument('--latency-ms', type=float, default=20)
+    mock.add_argument('--jitter-ms', type=float, default=10)
+    mock.add_argument('--error-rate', type=float, default=0)
+    mock.add_argument('--drop-rate', type=float, default=0)
+    mock.add_argument('--retry-after', type=int, default=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    configure_environment(args)
+    schedules = SCHEDULES if args.schedule == 'all' else (args.schedule,)
+    results = [simulate(schedule, args) for schedule in schedules]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
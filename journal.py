@@ -0,0 +1,304 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+import segment_format
+
+# Cada registro: tamanho (4 bytes) + crc32 (4 bytes) + JSON em UTF-8
+RECORD_HEADER = struct.Struct('>II')
+ACTIVE_SUFFIX = '.open'
+# Segmento já fechado para gravação, aguardando a compactação em segundo plano
+SEALING_SUFFIX = '.sealing'
+SEALED_SUFFIX = '.seg'
+SENDING_SUFFIX = '.sending'
+# Temporário da compactação de um segmento ao ser selado
+COMPACT_SUFFIX = '.compact'
+
+
+def _fsync_dir(path):
+    # Garante que renomeações e criações de arquivos no diretório sobrevivam a uma queda de energia
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _segment_number(filename):
+    try:
+        return int(filename.split('_', 1)[1].split('.', 1)[0])
+    except (IndexError, ValueError):
+        return -1
+
+
+def _valid_length(path):
+    """Retorna o tamanho da parte íntegra do segmento (até o último registro com CRC válido)."""
+    valid = 0
+    with open(path, 'rb') as file:
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, crc = RECORD_HEADER.unpack(header)
+            data = file.read(length)
+            if len(data) < length or zlib.crc32(data) != crc:
+                break
+            valid += RECORD_HEADER.size + length
+    return valid
+
+
+def read_segment(path):
+    """Lê os registros de um segmento (compacto ou de registros JSON), parando no primeiro trecho corrompido."""
+    if segment_format.is_compact(path):
+        yield from segment_format.read_records(path)
+        return
+    with open(path, 'rb') as file:
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, crc = RECORD_HEADER.unpack(header)
+            data = file.read(length)
+            if len(data) < length or zlib.crc32(data) != crc:
+                logging.warning(f"Registro corrompido ou incompleto em {path}. Leitura interrompida.")
+                return
+            yield json.loads(data.decode('utf-8'))
+
+
+def list_segments(journal_dir, suffix=SEALED_SUFFIX):
+    if not os.path.isdir(journal_dir):
+        return []
+    names = [name for name in os.listdir(journal_dir) if name.endswith(suffix)]
+    return [os.path.join(journal_dir, name) for name in sorted(names, key=_segment_number)]
+
+
+def sealed_segments(journal_dir):
+    """Segmentos fechados, prontos para envio, do mais antigo para o mais novo."""
+    return list_segments(journal_dir, SEALED_SUFFIX)
+
+
+def claim_segment(path):
+    """Reserva um segmento selado para envio. Retorna None se outro processo já o reservou."""
+    claimed = path[:-len(SEALED_SUFFIX)] + SENDING_SUFFIX
+    try:
+        os.rename(path, claimed)
+        return claimed
+    except FileNotFoundError:
+        return None
+
+
+def release_segment(claimed):
+    """Devolve um segmento reservado para a lista de selados (ex.: envio falhou)."""
+    os.rename(claimed, claimed[:-len(SENDING_SUFFIX)] + SEALED_SUFFIX)
+
+
+def remove_segment(path):
+    os.remove(path)
+    _fsync_dir(os.path.dirname(path))
+
+
+def seal_segment(sealing_path, compression='gzip'):
+    """Sela um segmento fechado (.sealing), regravando-o no formato compacto (segment_format).
+
+    O compacto é gravado num temporário e renomeado para .seg antes de o
+    original ser apagado; uma queda no meio deixa o .sealing, que é selado
+    sem compactar na recuperação. Se a compactação falhar, o segmento é
+    selado como está.
+    """
+    sealed = sealing_path[:-len(SEALING_SUFFIX)] + SEALED_SUFFIX
+    temp_path = sealing_path + COMPACT_SUFFIX
+    try:
+        with open(temp_path, 'wb') as file:
+            rows = segment_format.write_segment(file, read_segment(sealing_path), compression)
+            file.flush()
+            os.fsync(file.fileno())
+        if rows:
+            os.rename(temp_path, sealed)
+            os.remove(sealing_path)
+            return
+        os.remove(temp_path)
+    except Exception as e:
+        logging.error(f"Erro ao compactar segmento do diário {sealing_path}: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+    os.rename(sealing_path, sealed)
+
+
+class Journal:
+    """Diário de gravação antecipada (append-only) para os códigos de barras offline.
+
+    O segmento ativo fica aberto enquanto a aplicação roda. O fsync é feito em
+    grupo: a cada fsync_records registros ou a cada fsync_interval segundos, o
+    que vier primeiro. O segmento é fechado por renomeação atômica quando passa
+    de max_segment_bytes ou de max_segment_age segundos; uma thread própria o
+    regrava no formato compacto com a compressão compression e só então ele
+    fica selado (.seg), fora do lock: quem chama append() nunca espera a
+    compactação. Os scripts de envio só leem segmentos selados; seal() espera
+    a compactação para que o segmento ativo entre no envio seguinte.
+    """
+
+    def __init__(self, journal_dir, fsync_interval=1.0, fsync_records=32, max_segment_bytes=1024 * 1024, max_segment_age=300,
+                 compression='gzip'):
+        self.journal_dir = journal_dir
+        self.compression = segment_format.resolve_compression(compression)
+        self.fsync_interval = fsync_interval
+        self.fsync_records = fsync_records
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.lock = threading.Lock()
+        self.file = None
+        self.active_path = None
+        self.opened_at = 0
+        self.unsynced = 0
+        # Segmentos fechados aguardando compactação e quantos estão sendo compactados agora
+        self.to_compact = []
+        self.compacting = 0
+        self.compact_cond = threading.Condition()
+        self._closed = threading.Event()
+        os.makedirs(journal_dir, exist_ok=True)
+        self.next_number = self._last_number() + 1
+        self.recover()
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal-flusher", daemon=True)
+        self._flusher.start()
+        self._compactor = threading.Thread(target=self._compact_loop, name="journal-compactor", daemon=True)
+        self._compactor.start()
+
+    def _last_number(self):
+        numbers = [_segment_number(name) for name in os.listdir(self.journal_dir)]
+        return max(numbers, default=0)
+
+    def recover(self):
+        """Recuperação após queda: corta finais rasgados e sela segmentos que ficaram abertos ou sem compactar."""
+        for path in list_segments(self.journal_dir, ACTIVE_SUFFIX):
+            try:
+                valid = _valid_length(path)
+                size = os.path.getsize(path)
+                if valid < size:
+                    logging.warning(f"Segmento {path} com final corrompido: truncando {size - valid} bytes.")
+                    with open(path, 'r+b') as file:
+                        file.truncate(valid)
+                        file.flush()
+                        os.fsync(file.fileno())
+                if valid == 0:
+                    os.remove(path)
+                else:
+                    # Selado sem compactar: a recuperação fica fora do caminho até a primeira leitura
+                    os.rename(path, path[:-len(ACTIVE_SUFFIX)] + SEALED_SUFFIX)
+            except Exception as e:
+                logging.error(f"Erro ao recuperar segmento do diário {path}: {e}")
+        # Compactações interrompidas: o original continua valendo e é selado sem compactar
+        for path in list_segments(self.journal_dir, SEALING_SUFFIX):
+            try:
+                os.rename(path, path[:-len(SEALING_SUFFIX)] + SEALED_SUFFIX)
+            except Exception as e:
+                logging.error(f"Erro ao recuperar segmento do diário {path}: {e}")
+        for path in list_segments(self.journal_dir, COMPACT_SUFFIX):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.error(f"Erro ao remover temporário de compactação {path}: {e}")
+        # Reservas de envio interrompidas voltam para a fila
+        for path in list_segments(self.journal_dir, SENDING_SUFFIX):
+            try:
+                release_segment(path)
+            except Exception as e:
+                logging.error(f"Erro ao liberar segmento reservado {path}: {e}")
+        _fsync_dir(self.journal_dir)
+
+    def append(self, record):
+        data = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        with self.lock:
+            if self.file is None:
+                self._open_segment()
+            self.file.write(RECORD_HEADER.pack(len(data), zlib.crc32(data)) + data)
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_records:
+                self._sync()
+            if self.file.tell() >= self.max_segment_bytes:
+                self._seal()
+
+    def flush(self):
+        with self.lock:
+            self._sync()
+
+    def seal(self):
+        """Fecha o segmento ativo e espera a compactação, para que os scripts de envio possam lê-lo."""
+        with self.lock:
+            self._seal()
+        self.wait_sealed()
+
+    def wait_sealed(self, timeout=None):
+        """Espera os segmentos fechados ficarem selados. Retorna False se timeout passar antes."""
+        with self.compact_cond:
+            return self.compact_cond.wait_for(lambda: not self.to_compact and not self.compacting, timeout)
+
+    def close(self):
+        """Sela o segmento ativo e espera a compactação dos que faltam."""
+        with self.lock:
+            self._seal()
+        self._closed.set()
+        with self.compact_cond:
+            self.compact_cond.notify_all()
+        self._compactor.join()
+
+    def _open_segment(self):
+        self.active_path = os.path.join(self.journal_dir, f"segment_{self.next_number:08d}{ACTIVE_SUFFIX}")
+        self.next_number += 1
+        self.file = open(self.active_path, 'ab')
+        self.opened_at = time.monotonic()
+        _fsync_dir(self.journal_dir)
+
+    def _sync(self):
+        if self.file is not None and self.unsynced:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def _seal(self):
+        if self.file is None:
+            return
+        self._sync()
+        self.file.close()
+        self.file = None
+        # Sob o lock só a renomeação; a compactação fica com a thread do compactador
+        sealing = self.active_path[:-len(ACTIVE_SUFFIX)] + SEALING_SUFFIX
+        os.rename(self.active_path, sealing)
+        _fsync_dir(self.journal_dir)
+        self.active_path = None
+        with self.compact_cond:
+            self.to_compact.append(sealing)
+            self.compact_cond.notify_all()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.fsync_interval):
+            try:
+                with self.lock:
+                    self._sync()
+                    if self.file is not None and time.monotonic() - self.opened_at >= self.max_segment_age:
+                        self._seal()
+            except Exception as e:
+                logging.error(f"Erro ao sincronizar diário de backup: {e}")
+
+    def _compact_loop(self):
+        while True:
+            with self.compact_cond:
+                self.compact_cond.wait_for(lambda: self.to_compact or self._closed.is_set())
+                if not self.to_compact:
+                    return
+                path = self.to_compact.pop(0)
+                self.compacting += 1
+            try:
+                seal_segment(path, self.compression)
+                _fsync_dir(self.journal_dir)
+            except Exception as e:
+                logging.error(f"Erro ao selar segmento do diário {path}: {e}")
+            finally:
+                with self.compact_cond:
+                    self.compacting -= 1
+                    self.compact_cond.notify_all()
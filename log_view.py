@@ -0,0 +1,105 @@
+import tkinter as tk
+from collections import deque
+from itertools import islice
+
+
+class LogView(tk.Frame):
+    """Área de log com capacidade fixa e renderização só da parte visível.
+
+    As linhas ficam em um buffer circular (deque com maxlen); o widget Text
+    contém apenas a janela visível mais uma margem. Acompanhando o final do
+    log, as linhas novas são acrescentadas e as antigas removidas do Text em
+    lotes de trim_batch. Aceita insert/see/delete como um ScrolledText, para
+    ser usada no lugar dele.
+    """
+
+    def __init__(self, master, capacity=2000, margin=20, trim_batch=200, **text_options):
+        super().__init__(master)
+        self.lines = deque(maxlen=capacity)
+        self.margin = margin
+        self.trim_batch = trim_batch
+        self.top = 0  # índice no buffer da primeira linha exibida
+        self.rendered = 0  # linhas presentes no widget Text
+        self.following = True
+        self.text = tk.Text(self, **text_options)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.text.bind(sequence, self._on_wheel)
+
+    @property
+    def visible(self):
+        return int(self.text.cget('height'))
+
+    def insert(self, index, text):
+        new_lines = text.rstrip('\n').split('\n')
+        dropped = max(0, len(self.lines) + len(new_lines) - self.lines.maxlen)
+        self.lines.extend(new_lines)
+        if not self.following:
+            # Mantém a mesma linha no topo mesmo com o descarte das mais antigas
+            self.top = max(0, self.top - dropped)
+            self._update_scrollbar()
+            return
+        self.top = max(0, len(self.lines) - self.visible)
+        window = self.visible + self.margin
+        if len(new_lines) >= window:
+            self._render()
+            return
+        self.text.insert(tk.END, ('\n' if self.rendered else '') + '\n'.join(new_lines))
+        self.rendered += len(new_lines)
+        if self.rendered > window + self.trim_batch:
+            excess = self.rendered - window
+            self.text.delete('1.0', f'{excess + 1}.0')
+            self.rendered -= excess
+        self.text.see(tk.END)
+        self._update_scrollbar()
+
+    def see(self, index):
+        if index == tk.END and not self.following:
+            self._scroll_to(len(self.lines))
+
+    def delete(self, start, end=None):
+        """Limpa todo o log (só a limpeza completa é suportada)."""
+        self.lines.clear()
+        self.text.delete('1.0', tk.END)
+        self.rendered = 0
+        self.top = 0
+        self.following = True
+        self._update_scrollbar()
+
+    def _render(self):
+        window = list(islice(self.lines, self.top, self.top + self.visible + self.margin))
+        self.text.delete('1.0', tk.END)
+        self.text.insert(tk.END, '\n'.join(window))
+        self.rendered = len(window)
+        if self.following:
+            self.text.see(tk.END)
+        else:
+            self.text.see('1.0')
+        self._update_scrollbar()
+
+    def _scroll_to(self, top):
+        max_top = max(0, len(self.lines) - self.visible)
+        self.top = min(max(0, top), max_top)
+        self.following = self.top >= max_top
+        self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self._scroll_to(int(float(amount) * len(self.lines)))
+        elif action == 'scroll':
+            step = self.visible if unit == 'pages' else 1
+            self._scroll_to(self.top + int(amount) * step)
+
+    def _on_wheel(self, event):
+        up = event.num == 4 or getattr(event, 'delta', 0) > 0
+        self._scroll_to(self.top + (-3 if up else 3))
+        return 'break'
+
+    def _update_scrollbar(self):
+        total = len(self.lines)
+        if not total:
+            self.scrollbar.set(0, 1)
+            return
+        self.scrollbar.set(self.top / total, min(1.0, (self.top + self.visible) / total))
@@ -0,0 +1,226 @@
+import bisect
+import json
+import logging
+import threading
+import time
+
+from config_store import write_atomic
+
+PREFIX = 'staf_'
+# Limites dos histogramas de latência, em segundos
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(labels, extra=None):
+    items = dict(labels)
+    if extra:
+        items.update(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(items.items())) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def collect(self):
+        return self.value
+
+
+class CallbackMetric:
+    """Valor lido só na hora da coleta (profundidade de fila, tamanho do backlog): custo zero no caminho quente."""
+
+    def __init__(self, kind, read):
+        self.kind = kind
+        self.read = read
+
+    def collect(self):
+        try:
+            return self.read()
+        except Exception as e:
+            logging.error(f"Erro ao ler métrica: {e}")
+            return None
+
+
+class Histogram:
+    """Histograma de buckets fixos: observe() é uma busca binária e três somas sob lock."""
+
+    kind = 'histogram'
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def collect(self):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            running += bucket_count
+            cumulative['+Inf' if bound == float('inf') else repr(bound)] = running
+        return {'buckets': cumulative, 'sum': total, 'count': count}
+
+
+class Registry:
+    """Métricas do processo, agrupadas por nome; cada combinação de labels é uma série."""
+
+    def __init__(self):
+        self.families = {}  # nome -> (tipo, ajuda, {labels: métrica})
+        self.lock = threading.Lock()
+
+    def _register(self, name, help_text, labels, factory):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            family = self.families.setdefault(PREFIX + name, [None, help_text, {}])
+            series = family[2].get(key)
+            if series is None:
+                series = family[2][key] = factory()
+                family[0] = series.kind
+            return series
+
+    def counter(self, name, help_text, labels=None):
+        return self._register(name, help_text, labels, Counter)
+
+    def histogram(self, name, help_text, labels=None, buckets=LATENCY_BUCKETS):
+        return self._register(name, help_text, labels, lambda: Histogram(buckets))
+
+    def gauge(self, name, help_text, read, labels=None, kind='gauge'):
+        """Registra (ou troca) uma métrica lida por read() na coleta."""
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            family = self.families.setdefault(PREFIX + name, [kind, help_text, {}])
+            family[2][key] = CallbackMetric(kind, read)
+
+    def _families(self):
+        with self.lock:
+            return [(name, kind, help_text, list(series.items())) for name, (kind, help_text, series) in sorted(self.families.items())]
+
+    def render_prometheus(self):
+        lines = []
+        for name, kind, help_text, series in self._families():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series:
+                value = metric.collect()
+                if value is None:
+                    continue
+                if kind == 'histogram':
+                    for bound, count in value['buckets'].items():
+                        lines.append(f"{name}_bucket{_label_text(labels, {'le': bound})} {count}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {value['sum']}")
+                    lines.append(f"{name}_count{_label_text(labels)} {value['count']}")
+                else:
+                    lines.append(f"{name}{_label_text(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        metrics = {}
+        for name, kind, help_text, series in self._families():
+            metrics[name] = [dict(labels=dict(labels), value=metric.collect()) for labels, metric in series]
+        return {'timestamp': time.time(), 'metrics': metrics}
+
+
+REGISTRY = Registry()
+
+def counter(name, help_text, labels=None):
+    return REGISTRY.counter(name, help_text, labels)
+
+def histogram(name, help_text, labels=None, buckets=LATENCY_BUCKETS):
+    return REGISTRY.histogram(name, help_text, labels, buckets)
+
+def gauge(name, help_text, read, labels=None, kind='gauge'):
+    REGISTRY.gauge(name, help_text, read, labels, kind)
+
+
+class MetricsServer:
+    """Endpoint HTTP local: /metrics (texto Prometheus) e /metrics.json."""
+
+    def __init__(self, host='127.0.0.1', port=9464, registry=REGISTRY):
+        # http.server só é importado quando o endpoint é aberto (em segundo plano, na inicialização)
+        from http.server import ThreadingHTTPServer
+        self.registry = registry
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self.server.shutdown()
+        self.server.server_close()
+
+    def _handler_class(self):
+        from http.server import BaseHTTPRequestHandler
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = registry.render_prometheus().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body, content_type = json.dumps(registry.snapshot()).encode('utf-8'), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+class SnapshotWriter:
+    """Grava o snapshot JSON das métricas a cada interval segundos (gravação atômica)."""
+
+    def __init__(self, path, interval=60.0, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def write(self):
+        try:
+            write_atomic(self.path, json.dumps(self.registry.snapshot(), indent=2))
+        except OSError as e:
+            logging.error(f"Erro ao gravar snapshot das métricas em {self.path}: {e}")
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+        self.write()
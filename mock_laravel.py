@@ -0,0 +1,235 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import random
+import socket
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from transport import OFFLINE_PATH, SCAN_PATH
+
+BATCH_PATH = '/api/raspberry-scan-store-batch'
+STATS_PATH = '/__stats'
+
+
+def parse_multipart(content_type, body):
+    """Campos e arquivos de um corpo multipart/form-data: ({nome: texto}, {nome: bytes})."""
+    message = BytesParser(policy=policy.default).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        payload = part.get_payload(decode=True) or b''
+        if part.get_filename():
+            files[name] = payload
+        else:
+            fields[name] = payload.decode('utf-8', errors='replace')
+    return fields, files
+
+
+class MockLaravel:
+    """Servidor local no lugar do Laravel, para testes e benchmark sem o backend real.
+
+    Atende os endpoints de envio online, em lote e do backlog offline
+    (CSV com ou sem gzip). Injeta falhas para exercitar o cliente: latência
+    (latency + jitter segundos), respostas de erro (error_rate, sorteando
+    entre error_statuses, com Retry-After nos 429/503) e conexões derrubadas
+    sem resposta (drop_rate). GET /__stats devolve os contadores.
+
+    Para simular o servidor sob carga da frota: cada requisição simultânea
+    soma load_latency segundos à latência e, com capacity > 0, requisições
+    além desse número de simultâneas recebem 503 (pool do PHP esgotado).
+    in_flight e max_in_flight acompanham a concorrência no servidor.
+
+    Como o Laravel, descarta reenvios pelo scan_id: o envio online responde
+    409 e os envios em lote e do backlog trazem o status de cada scan_id.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_statuses=(429, 500, 503), drop_rate=0.0, retry_after=1, capacity=0, load_latency=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.drop_rate = drop_rate
+        self.retry_after = retry_after
+        self.capacity = capacity
+        self.load_latency = load_latency
+        self.random = random.Random()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'scans': 0, 'batch_scans': 0, 'offline_rows': 0, 'offline_bytes': 0, 'duplicates': 0, 'errors': 0, 'dropped': 0,
+                      'overloaded': 0, 'in_flight': 0, 'max_in_flight': 0}
+        self.seen = set()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-laravel", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def enter(self):
+        """Conta uma requisição em andamento; devolve quantas estão em andamento com ela."""
+        with self.lock:
+            self.stats['in_flight'] += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+            return self.stats['in_flight']
+
+    def leave(self):
+        with self.lock:
+            self.stats['in_flight'] -= 1
+
+    def accept(self, scan_id):
+        """Registra o scan_id; False se ele já tinha sido recebido. Itens sem scan_id são sempre aceitos."""
+        if not scan_id:
+            return True
+        with self.lock:
+            if scan_id in self.seen:
+                self.stats['duplicates'] += 1
+                return False
+            self.seen.add(scan_id)
+            return True
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Cabeçalhos e corpo saem em writes separados: sem isso, com keep-alive, Nagle + ACK atrasado somam ~40 ms por resposta
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                logging.debug(f"mock_laravel: {format % args}")
+
+            def do_GET(self):
+                if self.path == STATS_PATH:
+                    self.reply(200, mock.snapshot())
+                else:
+                    self.reply(404, {'message': 'Not Found'})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                mock.count('requests')
+                concurrent = mock.enter()
+                try:
+                    self.handle_post(body, concurrent)
+                finally:
+                    mock.leave()
+
+            def handle_post(self, body, concurrent):
+                if mock.capacity and concurrent > mock.capacity:
+                    mock.count('overloaded')
+                    self.reply(503, {'message': 'Server overloaded'}, {'Retry-After': str(mock.retry_after)})
+                    return
+                delay = mock.latency + (mock.random.uniform(0, mock.jitter) if mock.jitter else 0) + mock.load_latency * concurrent
+                if delay:
+                    time.sleep(delay)
+                roll = mock.random.random()
+                if roll < mock.drop_rate:
+                    mock.count('dropped')
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                if roll < mock.drop_rate + mock.error_rate:
+                    mock.count('errors')
+                    status = mock.random.choice(mock.error_statuses)
+                    headers = {'Retry-After': str(mock.retry_after)} if status in (429, 503) else {}
+                    self.reply(status, {'message': 'Injected error'}, headers)
+                    return
+                try:
+                    if self.path == SCAN_PATH:
+                        payload = json.loads(body)
+                        if not mock.accept(payload.get('scan_id')):
+                            self.reply(409, {'message': 'Scan already received', 'scan_id': payload.get('scan_id')})
+                            return
+                        mock.count('scans')
+                        self.reply(200, {'success': True, 'scan_id': payload.get('scan_id')})
+                    elif self.path == BATCH_PATH:
+                        items = json.loads(body)
+                        results = [{'scan_id': item.get('scan_id'), 'status': 200 if mock.accept(item.get('scan_id')) else 409} for item in items]
+                        mock.count('batch_scans', sum(1 for result in results if result['status'] == 200))
+                        self.reply(200, {'results': results})
+                    elif self.path == OFFLINE_PATH:
+                        fields, files = parse_multipart(self.headers.get('Content-Type', ''), body)
+                        data = files.get('data_backup', b'')
+                        if fields.get('compression') == 'gzip':
+                            data = gzip.decompress(data)
+                        rows = list(csv.DictReader(io.StringIO(data.decode('utf-8'))))
+                        results = [{'scan_id': row.get('scan_id'), 'status': 200 if mock.accept(row.get('scan_id')) else 409} for row in rows]
+                        mock.count('offline_rows', sum(1 for result in results if result['status'] == 200))
+                        mock.count('offline_bytes', len(body))
+                        if all(result['scan_id'] for result in results):
+                            self.reply(200, {'success': True, 'rows': len(rows), 'results': results})
+                        else:
+                            self.reply(200, {'success': True, 'rows': len(rows)})
+                    else:
+                        self.reply(404, {'message': 'Not Found'})
+                except Exception as e:
+                    self.reply(422, {'message': str(e)})
+
+            def reply(self, status, payload, headers=None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local no lugar do Laravel, com injeção de falhas.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency-ms', type=float, default=0, help="latência fixa por requisição")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="latência extra aleatória, até este valor")
+    parser.add_argument('--error-rate', type=float, default=0, help="fração das requisições respondidas com erro")
+    parser.add_argument('--error-statuses', default='429,500,503', help="códigos sorteados nas respostas de erro")
+    parser.add_argument('--drop-rate', type=float, default=0, help="fração das conexões derrubadas sem resposta")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After (segundos) dos 429/503")
+    parser.add_argument('--capacity', type=int, default=0, help="requisições simultâneas atendidas; as demais recebem 503 (0 = sem limite)")
+    parser.add_argument('--load-latency-ms', type=float, default=0, help="latência extra por requisição simultânea")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    mock = MockLaravel(
+        args.host, args.port, args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate,
+        [int(status) for status in args.error_statuses.split(',') if status], args.drop_rate, args.retry_after,
+        args.capacity, args.load_latency_ms / 1000
+    )
+    logging.info(f"Mock do Laravel ouvindo em {mock.url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from journal import claim_segment, read_segment, release_segment, remove_segment, sealed_segments
+from segment_format import CSV_HEADER
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+# Recusada de vez pelo servidor (400/422): fica guardada, fora do envio, até alguém reenviar (requeue_dead)
+DEAD = 'dead'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    timestamp TEXT NOT NULL,
+    raspberry_id TEXT,
+    codigobarras TEXT,
+    filial_id TEXT,
+    mac_address TEXT,
+    seq INTEGER,
+    source TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_retry_at REAL NOT NULL DEFAULT 0,
+    claimed_at REAL,
+    sent_at REAL,
+    last_status INTEGER,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_status_retry ON outbox (status, next_retry_at, id);
+CREATE INDEX IF NOT EXISTS idx_outbox_timestamp ON outbox (timestamp);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS backlog_counts (
+    day TEXT NOT NULL,
+    source TEXT NOT NULL,
+    pending INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, source)
+);
+CREATE TABLE IF NOT EXISTS backlog_files (
+    path TEXT PRIMARY KEY,
+    inode INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    offset INTEGER NOT NULL DEFAULT 0,
+    lines INTEGER NOT NULL DEFAULT 0,
+    rows INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS recent_scans (
+    codigobarras TEXT NOT NULL,
+    device TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    suppressed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (codigobarras, device)
+);
+"""
+
+# Contagem de pendentes por dia e por origem mantida pelo próprio SQLite a cada
+# inserção, mudança de status ou remoção; a aba de backup lê só esta tabela
+PENDING_STATUSES = "('pending', 'sending')"
+COUNT_TRIGGERS = f"""
+CREATE INDEX IF NOT EXISTS idx_outbox_pending_barcode ON outbox (codigobarras) WHERE status IN {PENDING_STATUSES};
+CREATE TRIGGER IF NOT EXISTS backlog_counts_insert AFTER INSERT ON outbox
+WHEN NEW.status IN {PENDING_STATUSES}
+BEGIN
+    INSERT INTO backlog_counts (day, source, pending) VALUES (substr(NEW.timestamp, 1, 10), COALESCE(NEW.source, ''), 1)
+    ON CONFLICT(day, source) DO UPDATE SET pending = pending + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS backlog_counts_update AFTER UPDATE OF status ON outbox
+WHEN (OLD.status IN {PENDING_STATUSES}) != (NEW.status IN {PENDING_STATUSES})
+BEGIN
+    INSERT INTO backlog_counts (day, source, pending)
+    VALUES (substr(NEW.timestamp, 1, 10), COALESCE(NEW.source, ''), CASE WHEN NEW.status IN {PENDING_STATUSES} THEN 1 ELSE -1 END)
+    ON CONFLICT(day, source) DO UPDATE SET pending = pending + excluded.pending;
+END;
+CREATE TRIGGER IF NOT EXISTS backlog_counts_delete AFTER DELETE ON outbox
+WHEN OLD.status IN {PENDING_STATUSES}
+BEGIN
+    UPDATE backlog_counts SET pending = pending - 1 WHERE day = substr(OLD.timestamp, 1, 10) AND source = COALESCE(OLD.source, '');
+END;
+"""
+COUNTS_VERSION_KEY = 'backlog_counts_version'
+
+
+class Outbox:
+    """Fila de saída em SQLite (modo WAL) compartilhada pela aplicação e pelos scripts de envio.
+
+    Cada batimento é uma linha com chave de idempotência (o scan_id gerado na
+    leitura), número de sequência do dispositivo, status
+    (pending/sending/sent/dead), número de tentativas e horário da próxima
+    tentativa. Linhas enviadas continuam no banco como retenção permanente.
+    Linhas recusadas de vez (dead-letter) guardam o último status HTTP e a
+    mensagem de erro e só voltam para a fila com requeue_dead().
+
+    A aba de backup não varre a tabela: contagens por dia e por origem
+    (backlog_counts) são mantidas por triggers, a busca por código usa um
+    índice parcial só das pendentes e os CSVs legados são lidos de forma
+    incremental (backlog_files guarda tamanho, mtime e o ponto já lido).
+    """
+
+    def __init__(self, db_path, retry_base=30, retry_max=3600, claim_timeout=600):
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.claim_timeout = claim_timeout
+        self.lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None: as transações são abertas explicitamente com BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        # Bancos criados antes das colunas seq, source, last_status e last_error
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(outbox)")}
+        for column, kind in (('seq', 'INTEGER'), ('source', 'TEXT'), ('last_status', 'INTEGER'), ('last_error', 'TEXT')):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {kind}")
+        self.conn.executescript(COUNT_TRIGGERS)
+        if self.get_meta(COUNTS_VERSION_KEY) is None:
+            self.rebuild_counts()
+
+    def rebuild_counts(self):
+        """Recalcula backlog_counts a partir do outbox (primeira abertura ou reparo)."""
+        def rebuild(conn):
+            conn.execute("DELETE FROM backlog_counts")
+            conn.execute(
+                "INSERT INTO backlog_counts (day, source, pending) "
+                f"SELECT substr(timestamp, 1, 10), COALESCE(source, ''), COUNT(*) FROM outbox WHERE status IN {PENDING_STATUSES} "
+                "GROUP BY 1, 2"
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, '1')", (COUNTS_VERSION_KEY,))
+        self._transaction(rebuild)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _transaction(self, statements):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self.conn)
+                self.conn.execute("COMMIT")
+                return result
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def enqueue_many(self, records):
+        """Insere registros ignorando chaves de idempotência já existentes. Retorna quantos entraram."""
+        def insert(conn):
+            # rowcount e não total_changes: este conta também as linhas alteradas pelos triggers
+            return conn.executemany(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, timestamp, raspberry_id, codigobarras, filial_id, mac_address, seq, source) "
+                "VALUES (:key, :timestamp, :raspberry_id, :codigobarras, :filial_id, :mac_address, :seq, :source)",
+                [dict(record, seq=record.get('seq'), source=record.get('source')) for record in records],
+            ).rowcount
+        return self._transaction(insert)
+
+    def ingest_journal(self, journal_dir):
+        """Move os segmentos selados do diário para o outbox."""
+        ingested = 0
+        for segment_path in sealed_segments(journal_dir):
+            claimed = claim_segment(segment_path)
+            if claimed is None:
+                continue
+            try:
+                records = []
+                for record in read_segment(claimed):
+                    record.setdefault('key', hashlib.sha1(repr(sorted(record.items())).encode('utf-8')).hexdigest())
+                    records.append(dict({column: record.get(column) for column in ['key', 'seq'] + CSV_HEADER}, source='journal'))
+                ingested += self.enqueue_many(records)
+                remove_segment(claimed)
+            except Exception as e:
+                release_segment(claimed)
+                logging.error(f"Erro ao importar segmento {os.path.basename(segment_path)} para o outbox: {e}")
+        return ingested
+
+    def import_csv(self, csv_path):
+        """Importa as linhas novas de um CSV de backup legado; o arquivo fica onde está.
+
+        Só é lido o que foi acrescentado desde a última importação (a partir do
+        offset guardado em backlog_files). Um arquivo trocado ou truncado (outro
+        inode, tamanho menor que o offset) é relido do início; as chaves de
+        idempotência (arquivo, linha, conteúdo) evitam duplicar o que já entrou.
+        Retorna quantas linhas novas entraram no outbox.
+        """
+        try:
+            stat = os.stat(csv_path)
+        except FileNotFoundError:
+            return 0
+        with self.lock:
+            known = self.conn.execute("SELECT * FROM backlog_files WHERE path = ?", (csv_path,)).fetchone()
+        if known is not None and known['inode'] == stat.st_ino and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return 0
+        offset, lines, rows = 0, 0, 0
+        if known is not None and known['inode'] == stat.st_ino and stat.st_size >= known['offset']:
+            offset, lines, rows = known['offset'], known['lines'], known['rows']
+
+        with open(csv_path, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+        # Só linhas completas; uma linha ainda sendo gravada fica para a próxima leitura
+        complete = data[:data.rfind(b'\n') + 1]
+        records = []
+        source = os.path.basename(csv_path)
+        for row in csv.reader(io.StringIO(complete.decode('utf-8', errors='replace'), newline='')):
+            line_number = lines
+            lines += 1
+            if not row or row == CSV_HEADER:
+                continue
+            row = (row + [None] * len(CSV_HEADER))[:len(CSV_HEADER)]
+            record = dict(zip(CSV_HEADER, row))
+            record['key'] = hashlib.sha1(f"{source}:{line_number}:{row}".encode('utf-8')).hexdigest()
+            record['source'] = source
+            records.append(record)
+
+        def save(conn):
+            imported = 0
+            if records:
+                imported = conn.executemany(
+                    "INSERT OR IGNORE INTO outbox (idempotency_key, timestamp, raspberry_id, codigobarras, filial_id, mac_address, source) "
+                    "VALUES (:key, :timestamp, :raspberry_id, :codigobarras, :filial_id, :mac_address, :source)",
+                    records,
+                ).rowcount
+            conn.execute(
+                "INSERT INTO backlog_files (path, inode, size, mtime_ns, offset, lines, rows, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET inode = excluded.inode, size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                "offset = excluded.offset, lines = excluded.lines, rows = excluded.rows, updated_at = excluded.updated_at",
+                (csv_path, stat.st_ino, offset + len(complete), stat.st_mtime_ns, offset + len(complete), lines, rows + len(records), time.time()),
+            )
+            return imported
+        return self._transaction(save)
+
+    def claim_pending(self, limit):
+        """Reserva até limit linhas pendentes (mais antigas primeiro) para envio."""
+        def claim(conn):
+            now = time.time()
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE status = ? AND next_retry_at <= ? ORDER BY id LIMIT ?",
+                (PENDING, now, limit),
+            ).fetchall()
+            # Reservas de processos que morreram no meio do envio voltam a valer
+            if len(rows) < limit:
+                rows += conn.execute(
+                    "SELECT * FROM outbox WHERE status = ? AND claimed_at < ? ORDER BY id LIMIT ?",
+                    (SENDING, now - self.claim_timeout, limit - len(rows)),
+                ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = ?, claimed_at = ? WHERE id = ?",
+                [(SENDING, now, row['id']) for row in rows],
+            )
+            return rows
+        return self._transaction(claim)
+
+    def mark_sent(self, ids):
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE outbox SET status = ?, sent_at = ?, attempts = attempts + 1 WHERE id = ?",
+            [(SENT, now, row_id) for row_id in ids],
+        ))
+
+    def release(self, ids):
+        """Devolve linhas reservadas para a fila sem contar tentativa."""
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE outbox SET status = ?, claimed_at = NULL WHERE id = ? AND status = ?",
+            [(PENDING, row_id, SENDING) for row_id in ids],
+        ))
+
+    def mark_failed(self, ids):
+        """Devolve as linhas para a fila com backoff exponencial pelo número de tentativas."""
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE outbox SET status = ?, attempts = attempts + 1, "
+            "next_retry_at = ? + MIN(? * (1 << MIN(attempts, 16)), ?) WHERE id = ?",
+            [(PENDING, now, self.retry_base, self.retry_max, row_id) for row_id in ids],
+        ))
+
+    def mark_dead(self, ids, status=None, error=None):
+        """Tira as linhas da fila (dead-letter), guardando o status HTTP e o erro que as recusou."""
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE outbox SET status = ?, attempts = attempts + 1, claimed_at = NULL, last_status = ?, last_error = ? WHERE id = ?",
+            [(DEAD, status, error, row_id) for row_id in ids],
+        ))
+
+    def dead_letter(self, records, status=None, error=None):
+        """Grava direto como dead-letter leituras recusadas no envio online; chaves já enviadas ficam como estão."""
+        def insert(conn):
+            return conn.executemany(
+                "INSERT INTO outbox (idempotency_key, timestamp, raspberry_id, codigobarras, filial_id, mac_address, seq, source, "
+                "status, attempts, last_status, last_error) "
+                "VALUES (:key, :timestamp, :raspberry_id, :codigobarras, :filial_id, :mac_address, :seq, :source, :status, 1, :last_status, :last_error) "
+                "ON CONFLICT(idempotency_key) DO UPDATE SET status = excluded.status, last_status = excluded.last_status, "
+                "last_error = excluded.last_error WHERE outbox.status != 'sent'",
+                [dict(record, seq=record.get('seq'), source=record.get('source'), status=DEAD, last_status=status, last_error=error)
+                 for record in records],
+            ).rowcount
+        return self._transaction(insert)
+
+    def dead_letters(self, limit=100, after_id=0):
+        """Página de linhas em dead-letter, em ordem de chegada."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT * FROM outbox WHERE status = ? AND id > ? ORDER BY id LIMIT ?",
+                (DEAD, after_id, limit),
+            ).fetchall()
+
+    def requeue_dead(self, ids=None):
+        """Devolve linhas em dead-letter (todas, sem ids) para a fila de envio. Retorna quantas voltaram."""
+        if ids is None:
+            return self._transaction(lambda conn: conn.execute(
+                "UPDATE outbox SET status = ?, next_retry_at = 0 WHERE status = ?", (PENDING, DEAD)
+            ).rowcount)
+        return self._transaction(lambda conn: conn.executemany(
+            "UPDATE outbox SET status = ?, next_retry_at = 0 WHERE id = ? AND status = ?",
+            [(PENDING, row_id, DEAD) for row_id in ids],
+        ).rowcount)
+
+    def count(self, status=PENDING):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox WHERE status = ?", (status,)).fetchone()[0]
+
+    def pending_total(self):
+        """Pendentes (inclusive reservados para envio), lido das contagens mantidas pelos triggers."""
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(pending), 0) FROM backlog_counts").fetchone()[0]
+
+    def pending_by_day(self, limit=None):
+        """[(dia, pendentes)] do dia mais recente para o mais antigo."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT day, SUM(pending) FROM backlog_counts GROUP BY day HAVING SUM(pending) > 0 ORDER BY day DESC LIMIT ?",
+                (-1 if limit is None else limit,),
+            ).fetchall()
+
+    def pending_by_source(self):
+        """[(origem, pendentes)]: 'journal' para o diário, nome do arquivo para CSVs legados, '' para o resto."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT source, SUM(pending) FROM backlog_counts GROUP BY source HAVING SUM(pending) > 0 ORDER BY source"
+            ).fetchall()
+
+    def backlog_files(self):
+        """CSVs legados já indexados, com tamanho, ponto lido e linhas importadas."""
+        with self.lock:
+            return self.conn.execute("SELECT * FROM backlog_files ORDER BY path").fetchall()
+
+    def search(self, barcode, limit=100):
+        """Pendentes cujo código de barras começa com barcode, pelo índice parcial das pendentes."""
+        if not barcode:
+            return []
+        upper = barcode[:-1] + chr(ord(barcode[-1]) + 1)
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT * FROM outbox WHERE codigobarras >= ? AND codigobarras < ? AND status IN {PENDING_STATUSES} "
+                "ORDER BY codigobarras, id LIMIT ?",
+                (barcode, upper, limit),
+            ).fetchall()
+
+    def pending(self, limit=100, after_id=0):
+        """Página de linhas pendentes em ordem de chegada, a partir de after_id."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT * FROM outbox WHERE status IN (?, ?) AND id > ? ORDER BY id LIMIT ?",
+                (PENDING, SENDING, after_id, limit),
+            ).fetchall()
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self._transaction(lambda conn: conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        ))
+
+    def update_meta(self, key, update, default=None):
+        """Lê, altera e grava um valor de meta numa só transação: update(valor atual ou default) -> novo valor."""
+        def apply(conn):
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            value = update(row[0] if row else default)
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+            return value
+        return self._transaction(apply)
+
+    def save_recent_scans(self, rows, meta=None, prune_before=None):
+        """Grava em uma transação as leituras aceitas [(codigobarras, device, seen_at, suppressed)], meta e a limpeza."""
+        def save(conn):
+            conn.executemany(
+                "INSERT INTO recent_scans (codigobarras, device, seen_at, suppressed) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(codigobarras, device) DO UPDATE SET seen_at = excluded.seen_at, suppressed = excluded.suppressed",
+                rows,
+            )
+            for key, value in (meta or {}).items():
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (key, value),
+                )
+            if prune_before is not None:
+                conn.execute("DELETE FROM recent_scans WHERE seen_at < ?", (prune_before,))
+        self._transaction(save)
+
+    def recent_scans(self, since):
+        """Leituras aceitas desde since (epoch), mais antigas primeiro; as anteriores são apagadas."""
+        def load(conn):
+            conn.execute("DELETE FROM recent_scans WHERE seen_at < ?", (since,))
+            return conn.execute("SELECT * FROM recent_scans ORDER BY seen_at").fetchall()
+        return self._transaction(load)
+
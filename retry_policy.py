@@ -0,0 +1,266 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import metrics
+
+RESPONSE_MESSAGES = {
+    200: "Dados enviados com sucesso.",
+    201: "Recurso criado com sucesso.",
+    202: "Requisição aceita, mas ainda não processada.",
+    204: "Nenhum conteúdo para retornar.",
+    400: "Requisição inválida. Verifique os dados enviados.",
+    401: "Não autorizado. Verifique suas credenciais.",
+    403: "Proibido. Você não tem permissão para acessar este recurso.",
+    404: "Recurso não encontrado. Verifique a URL.",
+    405: "Método não permitido para este recurso.",
+    408: "Tempo limite da requisição excedido.",
+    409: "Conflito. O recurso já existe.",
+    410: "O recurso solicitado foi removido permanentemente.",
+    415: "Tipo de mídia não suportado.",
+    422: "Entidade não processável. Verifique os dados enviados.",
+    429: "Muitas requisições. Tente novamente mais tarde. Limite de requisições excedido.",
+    500: "Erro interno do servidor. Tente novamente mais tarde.",
+    502: "Bad Gateway. O servidor está temporariamente indisponível.",
+    503: "Serviço indisponível. O servidor está sobrecarregado ou em manutenção.",
+    504: "Gateway Timeout. O servidor demorou muito para responder."
+}
+
+# Classes de resposta usadas pelo envio online e pelo envio do backlog
+SUCCESS = 'success'      # 2xx: confirmado (202/204 inclusive)
+DUPLICATE = 'duplicate'  # 409: o servidor já tinha o scan_id; também confirma
+RETRYABLE = 'retryable'  # sem resposta, 408, 429, 5xx: falha passageira, tentar de novo mais tarde
+PERMANENT = 'permanent'  # 400/422: a leitura em si foi recusada; repetir não adianta, vai para dead-letter
+CLIENT = 'client'        # demais respostas (401, 403, 404...): configuração ou credenciais; fica no backlog
+
+PERMANENT_STATUSES = (400, 422)
+# Respostas que pedem para o cliente esperar antes de tentar de novo (Retry-After)
+THROTTLE_STATUS = (429, 503)
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+BREAKER_STATES = {BREAKER_CLOSED: 0, BREAKER_HALF_OPEN: 1, BREAKER_OPEN: 2}
+
+RETRIES_SCHEDULED = metrics.counter('scan_retries_scheduled_total', "Novas tentativas de envio online agendadas")
+
+
+def describe(status):
+    return RESPONSE_MESSAGES.get(status, 'Erro desconhecido.')
+
+def parse_statuses(text, default=PERMANENT_STATUSES):
+    """'400,422' -> (400, 422); texto vazio devolve default."""
+    statuses = tuple(int(item) for item in text.replace(' ', '').split(',') if item)
+    return statuses or default
+
+def classify(status, permanent=PERMANENT_STATUSES):
+    """Classe da resposta pelo código HTTP; None (sem resposta) é sempre RETRYABLE."""
+    if status is None or status == 408 or status == 429 or status >= 500:
+        return RETRYABLE
+    if 200 <= status < 300:
+        return SUCCESS
+    if status == 409:
+        return DUPLICATE
+    if status in permanent:
+        return PERMANENT
+    return CLIENT
+
+def retry_after_seconds(response):
+    """Lê o cabeçalho Retry-After (segundos ou data HTTP). Retorna None se ausente ou inválido."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Backoff exponencial com jitter completo."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def retry_delay(response, attempt, base=1.0, cap=60.0):
+    """Espera antes da próxima tentativa: o Retry-After de um 429/503 ou o backoff com jitter."""
+    if response is not None and response.status_code in THROTTLE_STATUS:
+        delay = retry_after_seconds(response)
+        if delay is not None:
+            return delay
+    return backoff_delay(attempt, base, cap)
+
+
+class CircuitBreaker:
+    """Disjuntor por endpoint: depois de failure_threshold falhas seguidas para de mandar requisições.
+
+    Fechado, tudo passa. Aberto, allow() recusa até reset_timeout segundos;
+    depois disso o circuito fica meio-aberto e libera uma única requisição de
+    teste. Sucesso fecha o circuito; falha reabre com o dobro do tempo, até
+    max_reset_timeout. Só falhas passageiras (RETRYABLE) e erros de
+    configuração (CLIENT) contam; uma recusa de dados (400/422) prova que o
+    servidor está respondendo.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, max_reset_timeout=600, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.reset_timeout = reset_timeout
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_started_at = 0.0
+        self.lock = threading.Lock()
+        metrics.gauge('circuit_state', "Estado do circuito de cada endpoint (0 fechado, 1 meio-aberto, 2 aberto)",
+                      lambda: BREAKER_STATES[self.state], {'endpoint': name})
+
+    def allow(self):
+        with self.lock:
+            if self.state == BREAKER_CLOSED:
+                return True
+            if self.state == BREAKER_OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = BREAKER_HALF_OPEN
+                self.probing = False
+            # Meio-aberto: uma requisição de teste por vez (outra só se a anterior nunca deu resultado)
+            if self.probing and self.clock() - self.probe_started_at < self.reset_timeout:
+                return False
+            self.probing = True
+            self.probe_started_at = self.clock()
+            return True
+
+    def retry_in(self):
+        """Segundos até o circuito aceitar uma requisição de teste (0 se já aceita)."""
+        with self.lock:
+            if self.state != BREAKER_OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def record(self, kind):
+        """Registra o resultado de uma requisição pela classe da resposta (classify)."""
+        if kind in (RETRYABLE, CLIENT):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_success(self):
+        with self.lock:
+            if self.state != BREAKER_CLOSED:
+                logging.info(f"Circuito {self.name} fechado: servidor respondendo de novo.")
+            self.state = BREAKER_CLOSED
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            if self.state == BREAKER_HALF_OPEN:
+                # Teste falhou: reabre esperando o dobro
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                self._open()
+                return
+            self.failures += 1
+            if self.state == BREAKER_CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = BREAKER_OPEN
+        self.opened_at = self.clock()
+        self.probing = False
+        metrics.counter('circuit_opened_total', "Vezes em que o circuito de cada endpoint abriu", {'endpoint': self.name}).inc()
+        logging.warning(f"Circuito {self.name} aberto por {self.reset_timeout:.0f}s após falhas seguidas.")
+
+
+BREAKERS = {}
+BREAKERS_LOCK = threading.Lock()
+
+def get_breaker(endpoint, failure_threshold=5, reset_timeout=30, max_reset_timeout=600):
+    """Disjuntor compartilhado do endpoint (caminho da API), criado no primeiro uso."""
+    with BREAKERS_LOCK:
+        breaker = BREAKERS.get(endpoint)
+        if breaker is None:
+            breaker = BREAKERS[endpoint] = CircuitBreaker(endpoint, failure_threshold, reset_timeout, max_reset_timeout)
+        return breaker
+
+
+class RetryQueue:
+    """Fila de novas tentativas ordenada pelo horário da próxima tentativa (heap), com uma thread própria.
+
+    schedule(delay, item) agenda; quando o horário chega, handler(item) é
+    chamado na thread da fila. retry_now() antecipa tudo o que está agendado.
+    """
+
+    def __init__(self, handler, clock=time.monotonic):
+        self.handler = handler
+        self.clock = clock
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        metrics.gauge('scan_retry_queue_depth', "Leituras aguardando nova tentativa de envio online", self.pending)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="retry-queue", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Para a thread e devolve os itens ainda agendados, para quem chamou guardá-los."""
+        with self.condition:
+            self._stopped = True
+            items = [item for _, _, item in sorted(self.heap)]
+            self.heap = []
+            self.condition.notify_all()
+        return items
+
+    def schedule(self, delay, item):
+        """Agenda item para daqui a delay segundos. Retorna False se a fila já foi parada."""
+        with self.condition:
+            if self._stopped:
+                return False
+            heapq.heappush(self.heap, (self.clock() + delay, next(self.counter), item))
+            self.condition.notify_all()
+        RETRIES_SCHEDULED.inc()
+        return True
+
+    def retry_now(self):
+        with self.condition:
+            now = self.clock()
+            self.heap = [(now, order, item) for _, order, item in self.heap]
+            heapq.heapify(self.heap)
+            self.condition.notify_all()
+            return len(self.heap)
+
+    def pending(self):
+        with self.condition:
+            return len(self.heap)
+
+    def snapshot(self):
+        """[(segundos até a tentativa, item)] na ordem em que serão tentados."""
+        with self.condition:
+            now = self.clock()
+            return [(max(0.0, due - now), item) for due, _, item in sorted(self.heap)]
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self._stopped and (not self.heap or self.heap[0][0] > self.clock()):
+                    self.condition.wait(self.heap[0][0] - self.clock() if self.heap else None)
+                if self._stopped:
+                    return
+                _, _, item = heapq.heappop(self.heap)
+            try:
+                self.handler(item)
+            except Exception as e:
+                logging.error(f"Erro ao tentar de novo o envio: {e}")
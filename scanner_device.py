@@ -0,0 +1,210 @@
+import errno
+import fcntl
+import logging
+import os
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+
+# struct input_event do Linux: segundos, microssegundos, tipo, código, valor. Os dois primeiros
+# campos têm o tamanho do long do kernel visto pelo processo (16 bytes por evento em userland de
+# 32 bits, 24 em 64 bits), independente do time_t da libc. O tamanho real é confirmado na
+# abertura do dispositivo (event_layout); INPUT_EVENT é só o palpite inicial pelo long nativo.
+INPUT_EVENT_32 = struct.Struct('=iiHHi')
+INPUT_EVENT_64 = struct.Struct('=qqHHi')
+INPUT_EVENT = INPUT_EVENT_64 if struct.calcsize('l') == 8 else INPUT_EVENT_32
+EV_KEY = 1
+KEY_RELEASE, KEY_PRESS, KEY_REPEAT = 0, 1, 2
+EVIOCGRAB = 0x40044590
+
+KEY_ENTER = 28
+KEY_KPENTER = 96
+SHIFT_KEYS = (42, 54)  # KEY_LEFTSHIFT, KEY_RIGHTSHIFT
+
+# Códigos de tecla (linux/input-event-codes.h) -> (caractere, caractere com shift), layout US
+KEYMAP = {
+    2: ('1', '!'), 3: ('2', '@'), 4: ('3', '#'), 5: ('4', '$'), 6: ('5', '%'),
+    7: ('6', '^'), 8: ('7', '&'), 9: ('8', '*'), 10: ('9', '('), 11: ('0', ')'),
+    12: ('-', '_'), 13: ('=', '+'),
+    16: ('q', 'Q'), 17: ('w', 'W'), 18: ('e', 'E'), 19: ('r', 'R'), 20: ('t', 'T'),
+    21: ('y', 'Y'), 22: ('u', 'U'), 23: ('i', 'I'), 24: ('o', 'O'), 25: ('p', 'P'),
+    26: ('[', '{'), 27: (']', '}'),
+    30: ('a', 'A'), 31: ('s', 'S'), 32: ('d', 'D'), 33: ('f', 'F'), 34: ('g', 'G'),
+    35: ('h', 'H'), 36: ('j', 'J'), 37: ('k', 'K'), 38: ('l', 'L'),
+    39: (';', ':'), 40: ("'", '"'), 41: ('`', '~'), 43: ('\\', '|'),
+    44: ('z', 'Z'), 45: ('x', 'X'), 46: ('c', 'C'), 47: ('v', 'V'), 48: ('b', 'B'),
+    49: ('n', 'N'), 50: ('m', 'M'), 51: (',', '<'), 52: ('.', '>'), 53: ('/', '?'),
+    55: ('*', '*'), 57: (' ', ' '),
+    71: ('7', '7'), 72: ('8', '8'), 73: ('9', '9'), 74: ('-', '-'), 75: ('4', '4'),
+    76: ('5', '5'), 77: ('6', '6'), 78: ('+', '+'), 79: ('1', '1'), 80: ('2', '2'),
+    81: ('3', '3'), 82: ('0', '0'), 83: ('.', '.'), 98: ('/', '/'),
+}
+
+
+def event_layout(fd):
+    """Descobre o formato do input_event pelo kernel. Retorna (struct, bytes já lidos).
+
+    O evdev recusa com EINVAL uma leitura menor que um evento, sem consumir
+    nada: um read() de 16 bytes só é aceito se o evento tiver 16 bytes. Os
+    bytes que vierem nessa leitura são eventos válidos e devem ser processados.
+    """
+    try:
+        return INPUT_EVENT_32, os.read(fd, INPUT_EVENT_32.size)
+    except BlockingIOError:
+        return INPUT_EVENT_32, b''
+    except OSError as e:
+        if e.errno == errno.EINVAL:
+            return INPUT_EVENT_64, b''
+        raise
+
+
+class _DeviceReader:
+    """Base das leituras diretas do dispositivo: thread com leitura não bloqueante e reconexão."""
+
+    reconnect_delay = 2.0
+
+    def __init__(self, path, framer):
+        self.path = path
+        self.framer = framer
+        self.fd = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"scanner-{os.path.basename(self.path)}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def open(self):
+        raise NotImplementedError
+
+    def process(self, data):
+        """Interpreta bytes lidos do dispositivo e alimenta o framer."""
+        raise NotImplementedError
+
+    def _close(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if self.fd is None:
+                    self.fd = self.open()
+                    logging.info(f"Leitor de código de barras conectado: {self.path}")
+                ready, _, _ = select.select([self.fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(self.fd, 4096)
+                if not data:
+                    raise OSError("dispositivo fechado")
+                self.process(data)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                logging.error(f"Erro no leitor de código de barras {self.path}: {e}. Tentando reconectar.")
+                self._close()
+                self._stopped.wait(self.reconnect_delay)
+        self._close()
+
+
+class EvdevReader(_DeviceReader):
+    """Lê o leitor direto do dispositivo de entrada do Linux (/dev/input/eventX).
+
+    Não depende de sessão X nem de foco da janela. Com grab=True o dispositivo
+    fica exclusivo deste processo e as teclas não chegam a outros programas.
+    """
+
+    def __init__(self, path, framer, grab=True):
+        super().__init__(path, framer)
+        self.grab = grab
+        self.shift = False
+        self.pending = b''
+        self.event = INPUT_EVENT
+
+    def open(self):
+        fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        if self.grab:
+            try:
+                fcntl.ioctl(fd, EVIOCGRAB, 1)
+            except OSError as e:
+                logging.warning(f"Não foi possível obter acesso exclusivo a {self.path}: {e}")
+        self.shift = False
+        self.pending = b''
+        try:
+            self.event, first = event_layout(fd)
+        except OSError:
+            os.close(fd)
+            raise
+        if self.event is not INPUT_EVENT:
+            logging.info(f"{self.path}: eventos de {self.event.size} bytes (long nativo de {struct.calcsize('l')} bytes).")
+        self.process(first)
+        return fd
+
+    def process(self, data):
+        data = self.pending + data
+        usable = len(data) - len(data) % self.event.size
+        self.pending = data[usable:]
+        # Converte o horário do evento (relógio de parede) para o relógio monotônico do framer
+        offset = time.monotonic() - time.time()
+        for seconds, microseconds, event_type, code, value in self.event.iter_unpack(data[:usable]):
+            if event_type != EV_KEY:
+                continue
+            if code in SHIFT_KEYS:
+                self.shift = value != KEY_RELEASE
+                continue
+            if value != KEY_PRESS:
+                continue
+            at = seconds + microseconds / 1e6 + offset
+            if code in (KEY_ENTER, KEY_KPENTER):
+                self.framer.feed_enter(at)
+            elif code in KEYMAP:
+                self.framer.feed_char(KEYMAP[code][1 if self.shift else 0], at)
+
+
+class SerialReader(_DeviceReader):
+    """Lê o leitor em modo serial/CDC-ACM (/dev/ttyACM0, /dev/ttyUSB0); CR ou LF encerram a leitura."""
+
+    def __init__(self, path, framer, baudrate=9600):
+        super().__init__(path, framer)
+        self.baudrate = baudrate
+        self.last_was_cr = False
+
+    def open(self):
+        fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK | os.O_NOCTTY)
+        if os.isatty(fd):
+            tty.setraw(fd)
+            speed = getattr(termios, f'B{self.baudrate}', None)
+            if speed is not None:
+                attributes = termios.tcgetattr(fd)
+                attributes[4] = attributes[5] = speed
+                termios.tcsetattr(fd, termios.TCSANOW, attributes)
+        self.last_was_cr = False
+        return fd
+
+    def process(self, data):
+        for char in data.decode('utf-8', errors='ignore'):
+            if char == '\r' or (char == '\n' and not self.last_was_cr):
+                self.framer.feed_enter()
+            elif char != '\n' and char.isprintable():
+                self.framer.feed_char(char)
+            self.last_was_cr = char == '\r'
+
+
+def create_reader(backend, path, framer, baudrate=9600, grab=True):
+    """Cria o leitor direto para SCANNER_BACKEND ('evdev' ou 'serial')."""
+    if backend == 'evdev':
+        return EvdevReader(path, framer, grab=grab)
+    if backend == 'serial':
+        return SerialReader(path, framer, baudrate=baudrate)
+    raise ValueError(f"Backend de leitor desconhecido: {backend}")
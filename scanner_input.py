@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+
+SCANNER = 'scanner'
+MANUAL = 'manual'
+
+
+class ScanFramer:
+    """Monta leituras completas a partir de caracteres soltos, sem tocar no Tk.
+
+    Uma leitura termina com Enter ou, para leitores que não enviam Enter,
+    quando passa char_timeout segundos sem caracteres depois de uma rajada.
+    Leitores de código de barras digitam com intervalos de poucos
+    milissegundos; a sequência final de caracteres com intervalo até
+    max_interval é tratada como leitura do leitor e o que veio antes, digitado
+    devagar, como digitação humana. Digitação humana seguida de Enter vira uma
+    leitura manual se accept_manual for verdadeiro.
+
+    on_scan(codigo, origem) é chamado uma vez por leitura, fora do lock.
+    """
+
+    def __init__(self, on_scan, char_timeout=0.05, max_interval=0.03, min_length=4, accept_manual=True, human_timeout=30.0, clock=time.monotonic):
+        self.on_scan = on_scan
+        self.char_timeout = char_timeout
+        self.max_interval = max_interval
+        self.min_length = min_length
+        self.accept_manual = accept_manual
+        self.human_timeout = human_timeout
+        self.clock = clock
+        self.chars = []
+        self.times = []
+        self.cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._flush_loop, name="scan-framer", daemon=True)
+        self._thread.start()
+
+    def feed_char(self, char, at=None):
+        with self.cond:
+            self.chars.append(char)
+            self.times.append(self.clock() if at is None else at)
+            self.cond.notify()
+
+    def feed_enter(self, at=None):
+        with self.cond:
+            scans = self._take_frame(enter=True)
+        self._emit(scans)
+
+    def stop(self):
+        with self.cond:
+            self._stopped = True
+            self.cond.notify()
+
+    def _burst_start(self):
+        """Índice onde começa a rajada rápida no final do buffer (len(chars) se não houver)."""
+        start = len(self.times) - 1
+        while start > 0 and self.times[start] - self.times[start - 1] <= self.max_interval:
+            start -= 1
+        if len(self.times) - start < self.min_length:
+            return len(self.times)
+        return start
+
+    def _take_frame(self, enter):
+        """Retira o buffer e devolve a lista de leituras (codigo, origem) que ele contém."""
+        if not self.chars:
+            return []
+        start = self._burst_start()
+        typed = ''.join(self.chars[:start]).strip()
+        burst = ''.join(self.chars[start:]).strip()
+        self.chars, self.times = [], []
+        scans = []
+        if burst:
+            if typed:
+                logging.info(f"Digitação descartada antes da leitura do leitor: {typed!r}")
+            scans.append((burst, SCANNER))
+        elif typed and enter and self.accept_manual:
+            scans.append((typed, MANUAL))
+        return scans
+
+    def _emit(self, scans):
+        for barcode, source in scans:
+            try:
+                self.on_scan(barcode, source)
+            except Exception as e:
+                logging.error(f"Erro ao processar leitura do leitor: {e}")
+
+    def _flush_loop(self):
+        while True:
+            with self.cond:
+                if self._stopped:
+                    return
+                if not self.chars:
+                    self.cond.wait()
+                    continue
+                scanner_tail = self._burst_start() < len(self.chars)
+                timeout = self.char_timeout if scanner_tail else self.human_timeout
+                remaining = self.times[-1] + timeout - self.clock()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                    continue
+                # Tempo esgotado sem Enter: fecha a rajada do leitor ou descarta a digitação parada
+                scans = self._take_frame(enter=False)
+            self._emit(scans)
@@ -1,49 +1,45 @@
-import requests
+import startup
+import argparse
+import logging
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Leitura e envio de códigos de barras do STAF.")
+    parser.add_argument('--headless', action='store_true', help="roda só o motor de leitura e envio, sem a janela (serviço systemd)")
+    return parser.parse_args()
+
+
+# Sem interface o controle passa para o motor antes de carregar tkinter, ui_bus e log_view
+if __name__ == "__main__" and parse_args().headless:
+    from engine import run_headless
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        run_headless()
+    except Exception as e:
+        logging.error(f"Erro ao executar a aplicação: {e}")
+    sys.exit(0)
+
 import os
-import uuid
-import csv
 from datetime import datetime, timedelta
-import time
 import threading
-import logging
-from dotenv import load_dotenv
 import tkinter as tk
-from tkinter import scrolledtext, messagebox, ttk
+from tkinter import messagebox, ttk
 from tkinter import font as tkfont
-from pynput import keyboard
-import socket
-import subprocess
-
-# Carregar variáveis de ambiente do arquivo .env
-load_dotenv()
-
-# Configurações
-LARAVEL_STORE_ENDPOINT = os.getenv('LARAVEL_STORE_ENDPOINT')
-RASPBERRY_ID = os.getenv('RASPBERRY_ID')
-FILIAL_ID = os.getenv('FILIAL_ID')
-RESPONSE_MESSAGES = {
-    200: "Dados enviados com sucesso.",
-    201: "Recurso criado com sucesso.",
-    202: "Requisição aceita, mas ainda não processada.",
-    204: "Nenhum conteúdo para retornar.",
-    400: "Requisição inválida. Verifique os dados enviados.",
-    401: "Não autorizado. Verifique suas credenciais.",
-    403: "Proibido. Você não tem permissão para acessar este recurso.",
-    404: "Recurso não encontrado. Verifique a URL.",
-    405: "Método não permitido para este recurso.",
-    408: "Tempo limite da requisição excedido.",
-    409: "Conflito. O recurso já existe.",
-    410: "O recurso solicitado foi removido permanentemente.",
-    415: "Tipo de mídia não suportado.",
-    422: "Entidade não processável. Verifique os dados enviados.",
-    429: "Muitas requisições. Tente novamente mais tarde. Limite de requisições excedido.",
-    500: "Erro interno do servidor. Tente novamente mais tarde.",
-    502: "Bad Gateway. O servidor está temporariamente indisponível.",
-    503: "Serviço indisponível. O servidor está sobrecarregado ou em manutenção.",
-    504: "Gateway Timeout. O servidor demorou muito para responder."
-}
-
-CSV_FILE_PATH = os.getenv('CSV_FILE_PATH')
+from ui_bus import UiBus
+from log_view import LogView
+from config_store import update_env, write_atomic
+from outbox import DEAD
+from engine import (
+    CONFIG, CONNECTIVITY, DUPLICATE_SCAN, ERROR, FAILED, LARAVEL_STORE_ENDPOINT, LOG, REJECTED, RESPONSE, RETRY, SCAN, SENT, STATUS,
+    UPLOAD_CONCURRENCY, ENV_PATH, STARTUP_REPORT_PATH, ScanEngine, remove_legacy_cron
+)
+startup.mark('imports')
+
+# Áreas de log: linhas mantidas em memória por área e linhas por página na aba de backup
+LOG_VIEW_CAPACITY = int(os.getenv('LOG_VIEW_CAPACITY', 2000))
+PENDING_PAGE_SIZE = int(os.getenv('PENDING_PAGE_SIZE', 200))
+PENDING_SUMMARY_DAYS = int(os.getenv('PENDING_SUMMARY_DAYS', 3))
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -58,6 +54,13 @@ class Application(tk.Tk):
             self.bind("<Escape>", self.exit_fullscreen)  # Tecla Esc para sair da tela cheia
 
             self.custom_font = tkfont.Font(family="Helvetica", size=12)
+
+            # Atualizações da interface vindas de outras threads passam por esta fila
+            self.ui = UiBus(self)
+
+            # Motor de leitura, envio e backup; a janela é só um cliente dos eventos dele
+            self.engine = ScanEngine()
+            self.engine.add_listener(self.on_engine_event)
             
             self.last_sent_timestamp = tk.StringVar()
             self.last_service_send_timestamp = tk.StringVar()
@@ -66,27 +69,27 @@ class Application(tk.Tk):
             
             self.current_timestamp = tk.StringVar()
             self.update_current_timestamp()
-            
-            try:
-                self.logo_image = tk.PhotoImage(file="logo.png").subsample(10, 10)  # Resize the logo to be smaller
-            except tk.TclError:
-                self.logo_image = None
-                logging.error("Logo image not found. Continuing without logo.")
-            
+
+            # O logo é decodificado depois que a janela aparece (load_logo)
+            self.logo_image = None
+
             self.laravel_store_endpoint = tk.StringVar(value=f"Servidor: {LARAVEL_STORE_ENDPOINT}")
             self.barcode_status = tk.StringVar(value="Status: Aguardando...")
+            self.barcode_text = tk.StringVar()
             self.setup_cron_status = tk.StringVar(value="Status do setup_cron: Verificando...")
-            self.check_and_run_setup_cron()
+            self.pending_page_starts = [0]
+            self.pending_page_rows = []
+            # Só a consulta mais recente da lista de pendentes/falhas é exibida
+            self.pending_request = 0
             self.create_widgets()
-            self.load_backup_csv()  # Load CSV content on startup
+            self.ui.start()
+            # Leitura liberada assim que os widgets existem; cron, backlog e logo vêm depois
+            self.engine.start()
             self.protocol("WM_DELETE_WINDOW", self.on_closing)
             self.display_mac_address()
+            self.after_idle(self.on_first_idle)
 
-            # Iniciar listener de teclas
-            self.listener = keyboard.Listener(on_press=self.on_key_press)
-            self.listener.start()
-
-            # Lista de códigos de barras não enviados
+            # Leituras aguardando nova tentativa do envio online (retrato da fila do motor)
             self.failed_barcodes = []
         except Exception as e:
             logging.error(f"Erro na inicialização da aplicação: {e}")
@@ -104,25 +107,21 @@ class Application(tk.Tk):
             self.label = tk.Label(self.main_frame, text="Digite o código de barras:", font=self.custom_font)
             self.label.grid(row=0, column=0, padx=10, pady=10, sticky='w')
 
-            self.barcode_entry = tk.Entry(self.main_frame, width=50, state='disabled', font=self.custom_font)  # Cria um widget de entrada desabilitado
+            self.barcode_entry = tk.Entry(self.main_frame, width=50, state='disabled', textvariable=self.barcode_text, font=self.custom_font)  # Cria um widget de entrada desabilitado
             self.barcode_entry.grid(row=0, column=1, padx=10, pady=10, sticky='w')
 
-            if self.logo_image:
-                self.logo_label = tk.Label(self.main_frame, image=self.logo_image)
-                self.logo_label.grid(row=0, column=2, padx=10, pady=10, sticky='w')
-
             # Frame para logs
             self.log_frame = ttk.Frame(self.main_frame)
             self.log_frame.grid(row=1, column=0, columnspan=3, padx=10, pady=10, sticky='nsew')
 
             self.log_area_label = tk.Label(self.log_frame, text="Log de Batimentos", font=self.custom_font)
             self.log_area_label.pack(anchor='nw', padx=5, pady=5)
-            self.log_area = scrolledtext.ScrolledText(self.log_frame, wrap=tk.WORD, width=50, height=10, font=self.custom_font)
+            self.log_area = LogView(self.log_frame, capacity=LOG_VIEW_CAPACITY, wrap=tk.WORD, width=50, height=10, font=self.custom_font)
             self.log_area.pack(side='left', padx=5, pady=5, fill='both', expand=True)
 
             self.barcode_log_area_response_label = tk.Label(self.log_frame, text="Resposta do Endpoint", font=self.custom_font)
             self.barcode_log_area_response_label.pack(anchor='ne', padx=5, pady=5)
-            self.barcode_log_area_response = scrolledtext.ScrolledText(self.log_frame, wrap=tk.WORD, width=50, height=10, font=self.custom_font)
+            self.barcode_log_area_response = LogView(self.log_frame, capacity=LOG_VIEW_CAPACITY, wrap=tk.WORD, width=50, height=10, font=self.custom_font)
             self.barcode_log_area_response.pack(side='right', padx=5, pady=5, fill='both', expand=True)
 
             # Frame para logs de sucesso e falha
@@ -131,12 +130,12 @@ class Application(tk.Tk):
 
             self.success_log_area_label = tk.Label(self.success_log_frame, text="Log de Sucesso", font=self.custom_font, fg="green")
             self.success_log_area_label.pack(anchor='nw', padx=5, pady=5)
-            self.success_log_area = scrolledtext.ScrolledText(self.success_log_frame, wrap=tk.WORD, width=50, height=10, font=self.custom_font, fg="green")
+            self.success_log_area = LogView(self.success_log_frame, capacity=LOG_VIEW_CAPACITY, wrap=tk.WORD, width=50, height=10, font=self.custom_font, fg="green")
             self.success_log_area.pack(side='left', padx=5, pady=5, fill='both', expand=True)
 
             self.failed_log_area_label = tk.Label(self.success_log_frame, text="Log de Falha", font=self.custom_font, fg="red")
             self.failed_log_area_label.pack(anchor='ne', padx=5, pady=5)
-            self.failed_log_area = scrolledtext.ScrolledText(self.success_log_frame, wrap=tk.WORD, width=50, height=10, font=self.custom_font, fg="red")
+            self.failed_log_area = LogView(self.success_log_frame, capacity=LOG_VIEW_CAPACITY, wrap=tk.WORD, width=50, height=10, font=self.custom_font, fg="red")
             self.failed_log_area.pack(side='right', padx=5, pady=5, fill='both', expand=True)
 
             # Frame para informações de rede
@@ -205,16 +204,39 @@ class Application(tk.Tk):
             self.unsent_barcode_log_area_label = tk.Label(self.data_backup_frame, text="Códigos de Barras Não Enviados", font=self.custom_font)
             self.unsent_barcode_log_area_label.grid(row=1, column=0, columnspan=3, padx=10, pady=10, sticky='w')
 
-            self.unsent_barcode_log_area = scrolledtext.ScrolledText(self.data_backup_frame, wrap=tk.WORD, font=self.custom_font)
+            self.unsent_barcode_log_area = LogView(self.data_backup_frame, capacity=PENDING_PAGE_SIZE + 1, wrap=tk.WORD, font=self.custom_font)
             self.unsent_barcode_log_area.grid(row=2, column=0, columnspan=3, padx=10, pady=10, sticky='nsew')
 
+            # Paginação do backlog pendente, lida do outbox sob demanda
+            self.previous_pending_page_button = tk.Button(self.data_backup_frame, text="Página Anterior", command=self.previous_pending_page, font=self.custom_font)
+            self.previous_pending_page_button.grid(row=3, column=0, padx=10, pady=10, sticky='w')
+
+            self.next_pending_page_button = tk.Button(self.data_backup_frame, text="Próxima Página", command=self.next_pending_page, font=self.custom_font)
+            self.next_pending_page_button.grid(row=3, column=1, padx=10, pady=10, sticky='w')
+
+            # Busca por código de barras entre os pendentes (prefixo, pelo índice do outbox)
+            self.pending_search_frame = tk.Frame(self.data_backup_frame)
+            self.pending_search_frame.grid(row=3, column=2, padx=10, pady=10, sticky='e')
+            self.pending_search_entry = tk.Entry(self.pending_search_frame, font=self.custom_font, width=16)
+            self.pending_search_entry.pack(side=tk.LEFT)
+            self.pending_search_entry.bind('<Return>', lambda event: self.search_pending())
+            self.pending_search_button = tk.Button(self.pending_search_frame, text="Buscar", command=self.search_pending, font=self.custom_font)
+            self.pending_search_button.pack(side=tk.LEFT, padx=5)
+
+            # Leituras aguardando nova tentativa e recusadas pelo servidor (dead-letter)
+            self.show_failed_button = tk.Button(self.data_backup_frame, text="Ver Falhas", command=self.update_failed_list, font=self.custom_font)
+            self.show_failed_button.grid(row=4, column=0, padx=10, pady=10, sticky='w')
+
+            self.retry_failed_button = tk.Button(self.data_backup_frame, text="Reenviar Falhas", command=self.retry_failed_barcodes, font=self.custom_font)
+            self.retry_failed_button.grid(row=4, column=1, padx=10, pady=10, sticky='w')
+
             # Aba de log de erros
             self.error_log_frame = ttk.Frame(self.notebook)
             self.notebook.add(self.error_log_frame, text='Log de Erros')
 
             self.error_log_area_label = tk.Label(self.error_log_frame, text="Log de Erros", font=self.custom_font, fg="red")
             self.error_log_area_label.pack(anchor='nw', padx=5, pady=5)
-            self.error_log_area = scrolledtext.ScrolledText(self.error_log_frame, wrap=tk.WORD, width=100, height=20, font=self.custom_font, fg="red")
+            self.error_log_area = LogView(self.error_log_frame, capacity=LOG_VIEW_CAPACITY, wrap=tk.WORD, width=100, height=20, font=self.custom_font, fg="red")
             self.error_log_area.pack(fill='both', expand=True, padx=10, pady=10)
 
             # Expand all rows and columns to fill the screen
@@ -233,15 +255,8 @@ class Application(tk.Tk):
         try:
             new_endpoint = self.laravel_endpoint_entry.get().strip()
             if new_endpoint:
-                os.environ['LARAVEL_STORE_ENDPOINT'] = new_endpoint
-                with open('.env', 'r') as file:
-                    lines = file.readlines()
-                with open('.env', 'w') as file:
-                    for line in lines:
-                        if line.startswith('LARAVEL_STORE_ENDPOINT'):
-                            file.write(f'LARAVEL_STORE_ENDPOINT={new_endpoint}\n')
-                        else:
-                            file.write(line)
+                update_env(ENV_PATH, {'LARAVEL_STORE_ENDPOINT': new_endpoint})
+                self.engine.reload_config()
                 messagebox.showinfo("Sucesso", "Endpoint salvo com sucesso!")
             else:
                 messagebox.showerror("Erro", "O endpoint não pode estar vazio.")
@@ -256,55 +271,50 @@ class Application(tk.Tk):
             # new_filial_id = self.filial_id_entry.get().strip()
 
             if new_laravel_endpoint:
-                os.environ['LARAVEL_STORE_ENDPOINT'] = new_laravel_endpoint
-                with open('.env', 'r') as file:
-                    lines = file.readlines()
-                with open('.env', 'w') as file:
-                    for line in lines:
-                        if line.startswith('LARAVEL_STORE_ENDPOINT'):
-                            file.write(f'LARAVEL_STORE_ENDPOINT={new_laravel_endpoint}\n')
-                    
-                        else:
-                            file.write(line)
+                update_env(ENV_PATH, {'LARAVEL_STORE_ENDPOINT': new_laravel_endpoint})
+                # Aplica o novo endpoint na hora, sem reiniciar a aplicação
+                self.engine.reload_config()
                 messagebox.showinfo("Sucesso", "Configurações salvas com sucesso!")
             else:
                 messagebox.showerror("Erro", "Todos os campos devem ser preenchidos.")
         except Exception as e:
             logging.error(f"Erro ao salvar configurações: {e}")
 
-    def on_key_press(self, key):
-        try:
-            if key == keyboard.Key.enter:
-                self.process_barcode()
-            elif hasattr(key, 'char') and key.char is not None:
-                self.barcode_entry.config(state='normal')
-                self.barcode_entry.insert(tk.END, key.char)
-                self.barcode_entry.config(state='disabled')
-        except Exception as e:
-            logging.error(f"Erro ao processar tecla pressionada: {e}")
+    def on_engine_event(self, event, message, data):
+        """Traduz os eventos do motor (vindos de threads de trabalho) em atualizações via UiBus."""
+        if event == SCAN:
+            # Uma única atualização de interface por leitura
+            self.ui.append(self.log_area, message)
+            self.ui.set(self.barcode_text, data['barcode'])
+        elif event == STATUS:
+            self.ui.set(self.barcode_status, message)
+        elif event == SENT:
+            self.ui.set(self.last_sent_timestamp, f"Último envio: {data['data_time']}")
+            self.ui.append(self.success_log_area, message)
+        elif event in (FAILED, REJECTED):
+            self.ui.append(self.failed_log_area, message)
+        elif event == RETRY:
+            self.log(message)
+        elif event == RESPONSE:
+            self.ui.append(self.barcode_log_area_response, message)
+        elif event == ERROR:
+            self.log_error(message)
+        elif event in (LOG, DUPLICATE_SCAN):
+            self.log(message)
+        elif event == CONFIG:
+            self.ui.set(self.laravel_store_endpoint, message)
+        elif event == CONNECTIVITY:
+            self.ui.config(self.internet_status_label, text=message, fg="green" if data['online'] else "red")
 
     def display_mac_address(self):
         try:
             """Exibe o MAC Address e IP da rede local no canto superior direito da janela."""
-            mac_address = self.get_mac_address()
-            local_network_ip = self.get_local_network_ip()
-            if mac_address and local_network_ip:
-                self.network_info_label.config(text=f"MAC: {mac_address}\nIP Rede Local: {local_network_ip}")
+            identity = self.engine.identity.snapshot()
+            if identity.mac_address and identity.ip_address:
+                self.network_info_label.config(text=f"MAC: {identity.mac_address}\nIP Rede Local: {identity.ip_address}")
         except Exception as e:
             logging.error(f"Erro ao exibir MAC Address: {e}")
 
-    def get_local_network_ip(self):
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.settimeout(0)
-            s.connect(('192.168.1.1', 1))  # Pode ser qualquer IP na rede local
-            local_network_ip = s.getsockname()[0]
-            s.close()
-            return local_network_ip
-        except Exception as e:
-            logging.error(f"Erro ao obter IP da rede local: {e}")
-            return None
-
     def exit_fullscreen(self, event=None):
         try:
             """Sair do modo de tela cheia ao pressionar Esc ou clicar no botão."""
@@ -315,6 +325,7 @@ class Application(tk.Tk):
     def on_closing(self):
         try:
             if messagebox.askokcancel("Sair", "Tem certeza de que deseja sair?"):
+                self.engine.stop()
                 self.destroy()
         except Exception as e:
             logging.error(f"Erro ao fechar a aplicação: {e}")
@@ -331,15 +342,13 @@ class Application(tk.Tk):
 
     def log(self, message):
         try:
-            self.log_area.insert(tk.END, f"{message}\n")
-            self.log_area.see(tk.END)
+            self.ui.append(self.log_area, message)
         except Exception as e:
             logging.error(f"Erro ao registrar log: {e}")
 
     def log_error(self, message):
         try:
-            self.error_log_area.insert(tk.END, f"{message}\n")
-            self.error_log_area.see(tk.END)
+            self.ui.append(self.error_log_area, message)
         except Exception as e:
             logging.error(f"Erro ao registrar log de erro: {e}")
 
@@ -347,177 +356,82 @@ class Application(tk.Tk):
         try:
             env_content = self.env_text.get("1.0", tk.END).strip()
             try:
-                with open('.env', 'w') as env_file:
-                    env_file.write(env_content)
+                write_atomic(ENV_PATH, env_content)
                 messagebox.showinfo("Sucesso", "Arquivo .env salvo com sucesso!")
             except Exception as e:
                 self.log_error(f"Erro ao salvar o arquivo .env: {e}")
         except Exception as e:
             logging.error(f"Erro ao salvar arquivo .env: {e}")
 
-    def process_barcode(self, event=None):
-        try:
-            barcode = self.barcode_entry.get().strip()
-            timestamp = datetime.now().strftime('%H:%M')
-    
-            self.log_area.insert(tk.END, f"Codigo de barras batido: {barcode} - {timestamp}\n")
-            self.log_area.see(tk.END)
-    
-            if not barcode:
-                return
-            self.barcode_entry.config(state='normal')
-            self.barcode_entry.delete(0, tk.END)
-            self.barcode_entry.config(state='disabled')
-            # Chama a função principal (ou a parte do código que precisa ser executada)
-            self.insert_data(RASPBERRY_ID, barcode, FILIAL_ID)
-        except Exception as e:
-            logging.error(f"Erro ao processar código de barras: {e}")
-
-    def get_mac_address(self):
-        try:
-            mac = uuid.getnode()
-            mac_address = ':'.join(("%012X" % mac)[i:i+2] for i in range(0, 12, 2))
-            return mac_address
-        except Exception as e:
-            logging.error(f"Erro ao obter MAC Address: {e}")
-            return None
-    
-    def insert_data(self, raspberry_id, codigobarras, filial_id):
-        try:
-            data_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            payload = {
-                'raspberry_id': RASPBERRY_ID,
-                'codigo_barras': codigobarras,
-                'data_time': data_time,
-                'filial_id': FILIAL_ID,
-                'mac_address': self.get_mac_address(),
-                'tipo': 'online'
-            }
-
-            def send_data():
-                self.barcode_status.set(f"Status: Enviando código de barras {codigobarras}...")
-                if not self.is_internet_available():
-                    self.log("Sem conexão com a internet. Salvando no CSV.")
-                    self.backup_data_csv(raspberry_id, codigobarras, filial_id, data_time)
-                    self.failed_log_area.insert(tk.END, f"Falha ao enviar: {codigobarras} - {data_time}\n")
-                    self.failed_log_area.see(tk.END)
-                    self.barcode_status.set("Status: Aguardando...")
-                    return
-
-                try:
-                    response = requests.post(f"{LARAVEL_STORE_ENDPOINT}/api/raspberry-scan-store", json=payload)
-                    if response.status_code == 200:
-                        self.update_last_sent_timestamp(data_time)
-                        self.success_log_area.insert(tk.END, f"Enviado com sucesso: {codigobarras} - {data_time}\n")
-                        self.success_log_area.see(tk.END)
-                        self.barcode_log_area_response.insert(tk.END, f"Resposta do Endpoint: {response.json()}\n")
-                        self.barcode_log_area_response.see(tk.END)
-                        self.barcode_status.set(f"Status: Código de barras {codigobarras} enviado com sucesso.")
-                    else:
-                        error_message = RESPONSE_MESSAGES.get(response.status_code, "Erro desconhecido.")
-                        self.error_log_area.insert(tk.END, f"Erro do Endpoint ({response.status_code}): {error_message}\n")
-                        self.error_log_area.see(tk.END)
-                        self.backup_data_csv(raspberry_id, codigobarras, filial_id, data_time)
-                        self.failed_log_area.insert(tk.END, f"Falha ao enviar: {codigobarras} - {data_time}\n")
-                        self.failed_log_area.see(tk.END)
-                        self.barcode_status.set(f"Status: Falha ao enviar código de barras {codigobarras}.")
-                except requests.exceptions.RequestException as e:
-                    self.error_log_area.insert(tk.END, f"Erro ao tentar conectar: {e}\n")
-                    self.error_log_area.see(tk.END)
-                    self.backup_data_csv(raspberry_id, codigobarras, filial_id, data_time)
-                    self.failed_log_area.insert(tk.END, f"Falha ao enviar: {codigobarras} - {data_time}\n")
-                    self.failed_log_area.see(tk.END)
-                    self.barcode_status.set(f"Status: Falha ao enviar código de barras {codigobarras}.")
-
-                self.barcode_status.set("Status: Aguardando...")
-
-            threading.Thread(target=send_data).start()
-        except Exception as e:
-            logging.error(f"Erro ao inserir dados: {e}")
-
-    def update_last_sent_timestamp(self, timestamp):
-        try:
-            self.last_sent_timestamp.set(f"Último envio: {timestamp}")
-            with open('.env', 'r') as file:
-                lines = file.readlines()
-            with open('.env', 'w') as file:
-                for line in lines:
-                    if line.startswith('LAST_SENT_TIMESTAMP'):
-                        file.write(f'LAST_SENT_TIMESTAMP={timestamp}\n')
-                    else:
-                        file.write(line)
-        except Exception as e:
-            logging.error(f"Erro ao atualizar timestamp do último envio: {e}")
-
     def get_last_sent_timestamp(self):
         try:
-            return os.getenv('LAST_SENT_TIMESTAMP', 'Nunca')
+            return self.engine.get_last_sent_timestamp()
         except Exception as e:
             logging.error(f"Erro ao obter timestamp do último envio: {e}")
             return "Nunca"
 
-    def is_internet_available(self):
-        try:
-            requests.get('https://www.google.com', timeout=5)
-            return True
-        except requests.ConnectionError:
-            return False
-        except Exception as e:
-            logging.error(f"Erro ao verificar conexão com a internet: {e}")
-            return False
+    def run_in_background(self, name, work, done, error_message):
+        """Roda work() fora do loop do Tk (consultas ao outbox podem esperar o lock do SQLite) e entrega o resultado a done() pelo UiBus."""
+        def run():
+            try:
+                result = work()
+            except Exception as e:
+                logging.error(f"{error_message}: {e}")
+                return
+            self.ui.call(lambda: done(result))
+        threading.Thread(target=run, name=name, daemon=True).start()
 
-    def update_failed_list(self):
-        try:
-            self.unsent_barcode_log_area.delete(1.0, tk.END)
-            self.unsent_barcode_log_area.insert(tk.END, "Códigos de Barras Não Enviados:\n")
-            for payload in self.failed_barcodes:
-                self.unsent_barcode_log_area.insert(tk.END, f"{payload['codigo_barras']} - {payload['data_time']}\n")
-        except Exception as e:
-            logging.error(f"Erro ao atualizar lista de falhas: {e}")
+    def show_pending_lines(self, request, lines):
+        if request != self.pending_request:
+            return
+        self.unsent_barcode_log_area.delete(1.0, tk.END)
+        self.unsent_barcode_log_area.insert(tk.END, '\n'.join(lines))
 
-    def backup_data_csv(self, raspberry_id, codigobarras, filial_id, data_time):
-        try:
-            backup_folder = '/home/kali/staf-rasp/backup'
-            if not os.path.exists(backup_folder):
-                os.makedirs(backup_folder)
-            csv_file_path = os.path.join(backup_folder, os.path.basename(CSV_FILE_PATH))
-            file_exists = os.path.isfile(csv_file_path)
-            with open(csv_file_path, mode='a', newline='') as file:
-                writer = csv.writer(file)
-                if not file_exists:
-                    writer.writerow(['timestamp', 'raspberry_id', 'codigobarras', 'filial_id', 'mac_address'])
-                writer.writerow([data_time, raspberry_id, codigobarras, filial_id, self.get_mac_address()])
-        except Exception as e:
-            logging.error(f"Erro ao fazer backup de dados no CSV: {e}")
+    def update_failed_list(self):
+        self.pending_request += 1
+        request = self.pending_request
+
+        def load():
+            retries = self.engine.retry_queue.snapshot()
+            dead = self.engine.outbox.dead_letters(limit=PENDING_PAGE_SIZE // 2 - 1)
+            lines = [f"Aguardando nova tentativa: {len(retries)}"]
+            lines += [f"{payload['codigo_barras']} - {payload['data_time']} (em {delay:.0f}s)" for delay, payload in retries[:PENDING_PAGE_SIZE // 2]]
+            lines.append(f"Recusados pelo servidor: {self.engine.outbox.count(DEAD)}")
+            lines += [f"{row['codigobarras']} - {row['timestamp']} ({row['last_status']}: {row['last_error']})" for row in dead]
+            return retries, lines
+
+        def show(result):
+            retries, lines = result
+            self.failed_barcodes = [payload for _, payload in retries]
+            self.show_pending_lines(request, lines)
+        self.run_in_background("failed-list", load, show, "Erro ao atualizar lista de falhas")
 
     def check_internet_connection(self):
         try:
-            def update_status():
-                while True:
-                    try:
-                        requests.get('https://www.google.com', timeout=5)
-                        self.internet_status_label.config(text="Internet: Online", fg="green")
-                    except requests.ConnectionError:
-                        self.internet_status_label.config(text="Internet: Offline", fg="red")
-                    self.update_network_info_label()
-                    time.sleep(10)
-
-            threading.Thread(target=update_status, daemon=True).start()
+            def update_network_info():
+                self.update_network_info_label()
+                self.after(10000, update_network_info)
+
+            # O estado da conexão chega pelos eventos CONNECTIVITY do motor (iniciado em __init__)
+            update_network_info()
         except Exception as e:
             logging.error(f"Erro ao verificar conexão com a internet: {e}")
 
     def update_network_info_label(self):
         try:
-            mac_address = self.get_mac_address()
-            local_network_ip = self.get_local_network_ip()
-            internet_status = self.internet_status_label.cget('text')
-            if mac_address and local_network_ip:
-                self.network_info_label.config(text=f"MAC: {mac_address}\nIP Rede Local: {local_network_ip}\n")
+            # Lê o retrato em cache da identidade; nenhum socket é aberto aqui
+            identity = self.engine.identity.snapshot()
+            if identity.mac_address and identity.ip_address:
+                self.network_info_label.config(text=f"MAC: {identity.mac_address}\nIP Rede Local: {identity.ip_address}\n")
         except Exception as e:
             logging.error(f"Erro ao atualizar informações de rede: {e}")
 
     def retry_failed_barcodes(self):
-        pass  # Remove the retry logic
+        def done(result):
+            scheduled, requeued = result
+            self.log(f"Reenvio solicitado: {scheduled} código(s) tentados de novo agora, {requeued} recusado(s) devolvido(s) ao backlog.")
+            self.update_failed_list()
+        self.run_in_background("failed-retry", self.engine.retry_failed, done, "Erro ao reenviar códigos de barras com falha")
 
     def update_current_timestamp(self):
         try:
@@ -541,58 +455,122 @@ class Application(tk.Tk):
 
     def send_csv(self):
         try:
-            subprocess.run(["python", "send_csv.py"], check=True)
-            self.log("CSV enviado com sucesso.")
-        except subprocess.CalledProcessError as e:
-            self.log_error(f"Erro ao enviar CSV: {e}")
+            self.engine.trigger_sync(1)
+            self.log("Envio do CSV iniciado em segundo plano.")
         except Exception as e:
             logging.error(f"Erro ao enviar CSV: {e}")
 
     def send_all_csvs(self):
         try:
-            subprocess.run(["python", "send_all_csvs.py"], check=True)
-            self.log("Todos os CSVs enviados com sucesso.")
-        except subprocess.CalledProcessError as e:
-            self.log_error(f"Erro ao enviar todos os CSVs: {e}")
+            self.engine.trigger_sync(UPLOAD_CONCURRENCY)
+            self.log("Envio de todos os CSVs iniciado em segundo plano.")
         except Exception as e:
             logging.error(f"Erro ao enviar todos os CSVs: {e}")
 
     def load_backup_csv(self):
-        try:
-            self.unsent_barcode_log_area.delete(1.0, tk.END)
-            backup_folder = '/home/kali/staf-rasp/backup'
-            if os.path.exists(backup_folder):
-                self.unsent_barcode_log_area.insert(tk.END, "Códigos de Barras Não Enviados:\n")
-                for filename in os.listdir(backup_folder):
-                    if filename.endswith('.csv'):
-                        backup_csv_path = os.path.join(backup_folder, filename)
-                        with open(backup_csv_path, mode='r') as file:
-                            reader = csv.reader(file)
-                            self.unsent_barcode_log_area.insert(tk.END, f"Arquivo: {filename}\n")
-                            for row in reader:
-                                self.unsent_barcode_log_area.insert(tk.END, f"{row}\n")
-            else:
-                self.unsent_barcode_log_area.insert(tk.END, "Nenhum CSV de backup encontrado.\n")
-        except Exception as e:
-            logging.error(f"Erro ao carregar CSV de backup: {e}")
+        # Selar o diário e importar os segmentos pode demorar: roda fora do loop do Tk
+        self.load_backup_csv_button.config(state=tk.DISABLED)
+
+        def load():
+            # O botão volta mesmo se a carga falhar
+            try:
+                self.engine.load_backlog()
+            except Exception as e:
+                logging.error(f"Erro ao carregar CSV de backup: {e}")
+
+        def done(result):
+            self.load_backup_csv_button.config(state=tk.NORMAL)
+            self.pending_page_starts = [0]
+            self.show_pending_page()
+        self.run_in_background("backlog-load", load, done, "Erro ao carregar CSV de backup")
+
+    def show_pending_page(self):
+        self.pending_request += 1
+        request = self.pending_request
+        after_id, page = self.pending_page_starts[-1], len(self.pending_page_starts)
+
+        def load():
+            rows = self.engine.outbox.pending(limit=PENDING_PAGE_SIZE, after_id=after_id)
+            lines = [f"Códigos de Barras Não Enviados: {self.engine.outbox.pending_total()} - Página {page}"]
+            lines += [f"{row['codigobarras']} - {row['timestamp']} (tentativas: {row['attempts']})" for row in rows]
+            return rows, self.pending_summary(), lines
+
+        def show(result):
+            if request != self.pending_request:
+                return
+            rows, summary, lines = result
+            self.pending_page_rows = rows
+            self.unsent_barcode_log_area_label.config(text=summary)
+            self.show_pending_lines(request, lines)
+        self.run_in_background("pending-page", load, show, "Erro ao exibir página de códigos de barras pendentes")
+
+    def pending_summary(self):
+        """Pendentes por dia (os mais recentes) e por origem, das contagens mantidas pelo outbox."""
+        days = ', '.join(f"{day}: {count}" for day, count in self.engine.outbox.pending_by_day(limit=PENDING_SUMMARY_DAYS))
+        sources = ', '.join(f"{source or 'leituras'}: {count}" for source, count in self.engine.outbox.pending_by_source())
+        summary = "Códigos de Barras Não Enviados"
+        if days:
+            summary += f" - Por dia: {days}"
+        if sources:
+            summary += f" - Por origem: {sources}"
+        return summary
+
+    def search_pending(self):
+        barcode = self.pending_search_entry.get().strip()
+        if not barcode:
+            self.show_pending_page()
+            return
+        self.pending_request += 1
+        request = self.pending_request
+
+        def load():
+            rows = self.engine.outbox.search(barcode, limit=PENDING_PAGE_SIZE)
+            lines = [f"Busca por {barcode}: {len(rows)}{'+' if len(rows) == PENDING_PAGE_SIZE else ''} pendente(s)"]
+            return lines + [f"{row['codigobarras']} - {row['timestamp']} (tentativas: {row['attempts']})" for row in rows]
+        self.run_in_background("pending-search", load, lambda lines: self.show_pending_lines(request, lines), "Erro ao buscar código de barras pendente")
+
+    def next_pending_page(self):
+        if len(self.pending_page_rows) == PENDING_PAGE_SIZE:
+            self.pending_page_starts.append(self.pending_page_rows[-1]['id'])
+            self.show_pending_page()
+
+    def previous_pending_page(self):
+        if len(self.pending_page_starts) > 1:
+            self.pending_page_starts.pop()
+            self.show_pending_page()
 
     def check_and_run_setup_cron(self):
         try:
-            setup_cron_path = "/home/kali/staf-rasp/setup_cron.sh"
-            cron_job = "0 * * * * /usr/bin/python3 /home/kali/staf-rasp/send_all_csvs.py"
-
-            try:
-                result = subprocess.run(["crontab", "-l"], capture_output=True, text=True)
-                if cron_job not in result.stdout:
-                    subprocess.run(["bash", setup_cron_path], check=True)
-                    self.setup_cron_status.set("Status do setup_cron: Instalado e executado.")
-                else:
-                    self.setup_cron_status.set("Status do setup_cron: Já instalado.")
-            except subprocess.CalledProcessError as e:
-                self.setup_cron_status.set(f"Status do setup_cron: Erro ao verificar/instalar - {e}")
+            # Roda fora do loop do Tk: crontab e setup_cron.sh podem demorar
+            self.ui.set(self.setup_cron_status, remove_legacy_cron())
         except Exception as e:
             logging.error(f"Erro ao verificar ou executar setup_cron: {e}")
 
+    def on_first_idle(self):
+        """Primeira passada ociosa do Tk (janela desenhada): inicia a etapa adiada da inicialização."""
+        startup.mark('window')
+        self.after(1, self.load_logo)
+        threading.Thread(target=self.run_deferred_startup, name="startup-deferred", daemon=True).start()
+
+    def load_logo(self):
+        try:
+            self.logo_image = tk.PhotoImage(file="logo.png").subsample(10, 10)  # Resize the logo to be smaller
+            self.logo_label = tk.Label(self.main_frame, image=self.logo_image)
+            self.logo_label.grid(row=0, column=2, padx=10, pady=10, sticky='w')
+        except tk.TclError:
+            logging.error("Logo image not found. Continuing without logo.")
+
+    def run_deferred_startup(self):
+        """Etapa adiada, em segundo plano: cron antigo e backup local para o outbox; grava o relatório de tempos."""
+        self.check_and_run_setup_cron()
+        try:
+            self.engine.load_backlog()
+        except Exception as e:
+            logging.error(f"Erro ao carregar CSV de backup: {e}")
+        self.ui.call(self.show_pending_page)
+        startup.mark('deferred')
+        startup.report(STARTUP_REPORT_PATH)
+
 if __name__ == "__main__":
     try:
         app = Application()
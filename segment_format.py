@@ -0,0 +1,388 @@
+import argparse
+import csv
+import gzip
+import itertools
+import json
+import logging
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Formato compacto dos segmentos selados do diário:
+#   MAGIC + tamanho (2 bytes) + cabeçalho JSON (campos fixos do dispositivo, compressão)
+#   blocos: codec, linhas, bytes crus, bytes gravados, crc32 (BLOCK_HEADER) + dados
+# Cada linha guarda só o que muda: diferença de tempo para a linha anterior, o
+# código de barras como prefixo comum com o anterior + sufixo e a diferença do
+# número de sequência (quando o cabeçalho traz "seq"). Cada bloco
+# começa do zero, então um bloco corrompido não impede a leitura dos anteriores.
+MAGIC = b'STAFSEG\x01'
+FILE_HEADER = struct.Struct('>H')
+BLOCK_HEADER = struct.Struct('>BIIII')
+CODECS = {'none': 0, 'gzip': 1, 'zstd': 2}
+CSV_HEADER = ['timestamp', 'raspberry_id', 'codigobarras', 'filial_id', 'mac_address']
+DEVICE_FIELDS = ('raspberry_id', 'filial_id', 'mac_address')
+# Campos gravados em colunas próprias; os demais vão em JSON (ROW_EXTRA)
+ENCODED_FIELDS = set(CSV_HEADER) | {'key', 'seq'}
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+EPOCH = datetime(1970, 1, 1)
+
+# Marcas de cada linha, nos bits baixos da diferença de tempo
+ROW_RAW_TIMESTAMP = 1  # timestamp fora do formato padrão, gravado como texto
+ROW_DEVICE = 2         # campos do dispositivo diferentes do cabeçalho
+ROW_EXTRA = 4          # campos adicionais do registro, em JSON
+ROW_FLAG_BITS = 3
+
+# Chave de idempotência: ausente, uuid4 em hexadecimal (16 bytes) ou texto
+KEY_NONE = 0
+KEY_UUID = 1
+
+
+def resolve_compression(name):
+    """Compressão efetiva dos blocos: zstd só com o pacote zstandard instalado, senão gzip."""
+    if name not in CODECS:
+        raise ValueError(f"Compressão desconhecida: {name}")
+    if name == 'zstd' and zstandard is None:
+        logging.warning("Pacote zstandard não instalado. Usando gzip nos segmentos do diário.")
+        return 'gzip'
+    return name
+
+
+def _compress(codec, data):
+    if codec == CODECS['gzip']:
+        return gzip.compress(data, mtime=0)
+    if codec == CODECS['zstd']:
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def _decompress(codec, data):
+    if codec == CODECS['gzip']:
+        return gzip.decompress(data)
+    if codec == CODECS['zstd']:
+        if zstandard is None:
+            raise ValueError("Bloco comprimido com zstd, mas o pacote zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODECS['none']:
+        return data
+    raise ValueError(f"Codec de bloco desconhecido: {codec}")
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_text(out, value):
+    # 0 = None; n > 0 = texto UTF-8 de n - 1 bytes
+    if value is None:
+        out.append(0)
+        return
+    data = str(value).encode('utf-8')
+    _write_varint(out, len(data) + 1)
+    out += data
+
+
+def _read_text(data, pos):
+    length, pos = _read_varint(data, pos)
+    if length == 0:
+        return None, pos
+    end = pos + length - 1
+    return data[pos:end].decode('utf-8'), end
+
+
+def _timestamp_seconds(value):
+    """Segundos desde 1970 de um timestamp no formato padrão, ou None se não der para reconstruí-lo igual."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    if parsed.strftime(TIMESTAMP_FORMAT) != value:
+        return None
+    return (parsed - EPOCH) // timedelta(seconds=1)
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+def _common_prefix(a, b):
+    limit = min(len(a), len(b))
+    index = 0
+    while index < limit and a[index] == b[index]:
+        index += 1
+    return index
+
+
+class SegmentWriter:
+    """Grava registros do diário no formato compacto, em blocos de até block_rows linhas.
+
+    device traz os campos fixos (raspberry_id, filial_id, mac_address), gravados
+    uma única vez no cabeçalho; registros com valores diferentes levam os
+    próprios campos. close() grava o último bloco, mas não fecha o arquivo.
+    """
+
+    def __init__(self, file, device, compression='gzip', block_rows=4096):
+        self.file = file
+        self.device = tuple(device.get(field) for field in DEVICE_FIELDS)
+        self.codec = CODECS[resolve_compression(compression)]
+        self.block_rows = block_rows
+        self.rows = 0
+        self._reset_block()
+        header = json.dumps({
+            'device': dict(zip(DEVICE_FIELDS, self.device)),
+            'compression': compression,
+            'seq': True,
+            'created_at': time.time(),
+        }, separators=(',', ':')).encode('utf-8')
+        file.write(MAGIC + FILE_HEADER.pack(len(header)) + header)
+
+    def _reset_block(self):
+        self.block = bytearray()
+        self.block_count = 0
+        self.previous_seconds = 0
+        self.previous_barcode = ''
+        self.previous_seq = 0
+
+    def write(self, record):
+        out = self.block
+        timestamp = record.get('timestamp')
+        seconds = _timestamp_seconds(timestamp)
+        device = tuple(record.get(field) for field in DEVICE_FIELDS)
+        extra = {name: value for name, value in record.items() if name not in ENCODED_FIELDS}
+        flags = (ROW_RAW_TIMESTAMP if seconds is None else 0) | (ROW_DEVICE if device != self.device else 0) | (ROW_EXTRA if extra else 0)
+        delta = 0 if seconds is None else seconds - self.previous_seconds
+        _write_varint(out, (_zigzag(delta) << ROW_FLAG_BITS) | flags)
+        if seconds is None:
+            _write_text(out, timestamp)
+        else:
+            self.previous_seconds = seconds
+
+        barcode = record.get('codigobarras')
+        if barcode is None:
+            out.append(0)
+            _write_text(out, None)
+        else:
+            barcode = str(barcode)
+            prefix = _common_prefix(self.previous_barcode, barcode)
+            _write_varint(out, prefix)
+            _write_text(out, barcode[prefix:])
+            self.previous_barcode = barcode
+
+        key = record.get('key')
+        if key is None:
+            out.append(KEY_NONE)
+        elif isinstance(key, str) and len(key) == 32 and key == key.lower() and all(char in '0123456789abcdef' for char in key):
+            out.append(KEY_UUID)
+            out += bytes.fromhex(key)
+        else:
+            data = str(key).encode('utf-8')
+            _write_varint(out, len(data) + 2)
+            out += data
+
+        # 0 = sem sequência; n > 0 = diferença para a anterior (zigzag) + 1
+        seq = record.get('seq')
+        if seq is None:
+            out.append(0)
+        else:
+            seq = int(seq)
+            _write_varint(out, _zigzag(seq - self.previous_seq) + 1)
+            self.previous_seq = seq
+
+        if flags & ROW_DEVICE:
+            for value in device:
+                _write_text(out, value)
+        if flags & ROW_EXTRA:
+            _write_text(out, json.dumps(extra, separators=(',', ':')))
+
+        self.block_count += 1
+        self.rows += 1
+        if self.block_count >= self.block_rows:
+            self.flush_block()
+
+    def flush_block(self):
+        if not self.block_count:
+            return
+        raw = bytes(self.block)
+        data = _compress(self.codec, raw)
+        self.file.write(BLOCK_HEADER.pack(self.codec, self.block_count, len(raw), len(data), zlib.crc32(data)) + data)
+        self._reset_block()
+
+    def close(self):
+        self.flush_block()
+
+
+def _decode_block(raw, rows, device, has_seq):
+    pos = 0
+    previous_seconds = 0
+    previous_barcode = ''
+    previous_seq = 0
+    for _ in range(rows):
+        tag, pos = _read_varint(raw, pos)
+        flags = tag & ((1 << ROW_FLAG_BITS) - 1)
+        if flags & ROW_RAW_TIMESTAMP:
+            timestamp, pos = _read_text(raw, pos)
+        else:
+            previous_seconds += _unzigzag(tag >> ROW_FLAG_BITS)
+            timestamp = (EPOCH + timedelta(seconds=previous_seconds)).strftime(TIMESTAMP_FORMAT)
+
+        prefix, pos = _read_varint(raw, pos)
+        suffix, pos = _read_text(raw, pos)
+        if suffix is None:
+            barcode = None
+        else:
+            barcode = previous_barcode = previous_barcode[:prefix] + suffix
+
+        kind = raw[pos]
+        if kind == KEY_NONE:
+            key, pos = None, pos + 1
+        elif kind == KEY_UUID:
+            key, pos = raw[pos + 1:pos + 17].hex(), pos + 17
+        else:
+            length, pos = _read_varint(raw, pos)
+            key, pos = raw[pos:pos + length - 2].decode('utf-8'), pos + length - 2
+
+        seq = None
+        if has_seq:
+            encoded, pos = _read_varint(raw, pos)
+            if encoded:
+                seq = previous_seq = previous_seq + _unzigzag(encoded - 1)
+
+        values = device
+        if flags & ROW_DEVICE:
+            values = []
+            for _field in DEVICE_FIELDS:
+                value, pos = _read_text(raw, pos)
+                values.append(value)
+        record = {'timestamp': timestamp, 'codigobarras': barcode}
+        record.update(zip(DEVICE_FIELDS, values))
+        if key is not None:
+            record['key'] = key
+        if seq is not None:
+            record['seq'] = seq
+        if flags & ROW_EXTRA:
+            extra, pos = _read_text(raw, pos)
+            record.update(json.loads(extra))
+        yield record
+
+
+def is_compact(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def read_header(file):
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Arquivo não está no formato compacto de segmento")
+    (length,) = FILE_HEADER.unpack(file.read(FILE_HEADER.size))
+    return json.loads(file.read(length).decode('utf-8'))
+
+
+def read_records(path):
+    """Lê os registros de um segmento compacto, parando no primeiro bloco incompleto ou corrompido."""
+    with open(path, 'rb') as file:
+        header = read_header(file)
+        device = [header['device'].get(field) for field in DEVICE_FIELDS]
+        while True:
+            block_header = file.read(BLOCK_HEADER.size)
+            if len(block_header) < BLOCK_HEADER.size:
+                return
+            codec, rows, raw_length, length, crc = BLOCK_HEADER.unpack(block_header)
+            data = file.read(length)
+            if len(data) < length or zlib.crc32(data) != crc:
+                logging.warning(f"Bloco corrompido ou incompleto em {path}. Leitura interrompida.")
+                return
+            raw = _decompress(codec, data)
+            if len(raw) != raw_length:
+                logging.warning(f"Bloco com tamanho inesperado em {path}. Leitura interrompida.")
+                return
+            yield from _decode_block(raw, rows, device, header.get('seq', False))
+
+
+def write_segment(file, records, compression='gzip', block_rows=4096):
+    """Grava records (qualquer iterável) no formato compacto; o cabeçalho usa o dispositivo do primeiro registro.
+
+    Retorna o número de registros gravados.
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return 0
+    writer = SegmentWriter(file, first, compression, block_rows)
+    for record in itertools.chain([first], records):
+        writer.write(record)
+    writer.close()
+    return writer.rows
+
+
+def segment_to_csv(records, out):
+    """Escreve os registros no layout CSV do data_backup.csv (out em modo texto), linha a linha."""
+    writer = csv.writer(out)
+    writer.writerow(CSV_HEADER)
+    rows = 0
+    for record in records:
+        writer.writerow([record.get(column) for column in CSV_HEADER])
+        rows += 1
+    return rows
+
+
+def csv_records(file):
+    """Registros de um CSV no layout do data_backup.csv (file em modo texto), linha a linha."""
+    for row in csv.reader(file):
+        if not row or row == CSV_HEADER:
+            continue
+        row = (row + [None] * len(CSV_HEADER))[:len(CSV_HEADER)]
+        yield dict(zip(CSV_HEADER, row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converte segmentos compactos do diário de/para o CSV do data_backup.csv.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    to_csv = subparsers.add_parser('to-csv', help="segmento compacto -> CSV")
+    to_csv.add_argument('segment')
+    to_csv.add_argument('output', nargs='?', help="arquivo CSV (padrão: saída padrão)")
+    from_csv = subparsers.add_parser('from-csv', help="CSV -> segmento compacto")
+    from_csv.add_argument('csv')
+    from_csv.add_argument('output')
+    from_csv.add_argument('--compression', choices=sorted(CODECS), default='gzip')
+    args = parser.parse_args()
+
+    if args.command == 'to-csv':
+        if args.output:
+            with open(args.output, 'w', newline='') as out:
+                segment_to_csv(read_records(args.segment), out)
+        else:
+            segment_to_csv(read_records(args.segment), sys.stdout)
+    else:
+        with open(args.csv, newline='') as file, open(args.output, 'wb') as out:
+            rows = write_segment(out, csv_records(file), args.compression)
+        print(f"{rows} linhas gravadas em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import logging
+import queue
+import threading
+import time
+import zlib
+
+# Marcador usado para encerrar as threads do pool
+_STOP = object()
+
+
+def create_session(pool_size=2):
+    """Cria uma sessão HTTP compartilhada com conexões keep-alive reaproveitadas."""
+    # requests é importado só aqui: a carga dele fica fora do caminho até a primeira leitura
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# Respostas que confirmam o recebimento: qualquer 2xx; 409 = o servidor já tinha o scan_id (reenvio)
+ACK_STATUSES = frozenset(range(200, 300)) | {409}
+
+
+def _result_status(result, default):
+    if isinstance(result, dict):
+        status = result.get('status', result.get('status_code'))
+        if status is None and 'success' in result:
+            status = 200 if result['success'] else 422
+        return int(status) if status is not None else default
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    return default
+
+
+def parse_batch_results(response, count, ids=None):
+    """Extrai o status de cada item da resposta de um envio em lote.
+
+    Aceita uma lista alinhada com os itens enviados ou um objeto com a chave
+    'results'; cada posição pode ser um código HTTP ou um objeto com 'status'.
+    Sem detalhes por item, o status da resposta vale para todos.
+
+    Com ids (o scan_id de cada item), resultados que trazem 'scan_id' são
+    casados pelo id, em qualquer ordem; itens sem resultado ficam com None.
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    results = body.get('results') if isinstance(body, dict) else body
+    if ids is not None and isinstance(results, list) and results and all(isinstance(result, dict) and 'scan_id' in result for result in results):
+        by_id = {str(result['scan_id']): _result_status(result, response.status_code) for result in results}
+        return [by_id.get(str(scan_id)) for scan_id in ids]
+    if not isinstance(results, list) or len(results) != count:
+        return [response.status_code] * count
+    return [_result_status(result, response.status_code) for result in results]
+
+
+class ScanSender:
+    """Pool fixo de threads que envia os códigos de barras de uma fila limitada.
+
+    Cada dispositivo é sempre atendido pela mesma thread, o que mantém a ordem
+    dos envios por dispositivo. Quando a fila está cheia o item é entregue a
+    on_overflow (armazenamento local) sem bloquear quem chamou submit.
+
+    Com batch_size > 1 e batch_handler definido, cada thread junta até
+    batch_size itens ou espera até linger segundos e entrega a lista inteira a
+    batch_handler. Voltar batch_size para 1 retoma o envio item a item.
+    """
+
+    def __init__(self, handler, on_overflow, workers=2, queue_size=200, batch_handler=None, batch_size=1, linger=0):
+        self.handler = handler
+        self.on_overflow = on_overflow
+        self.batch_handler = batch_handler
+        self.batch_size = batch_size
+        self.linger = linger
+        workers = max(1, workers)
+        per_worker = max(1, queue_size // workers)
+        self.queues = [queue.Queue(maxsize=per_worker) for _ in range(workers)]
+        self.threads = []
+        for index, work_queue in enumerate(self.queues):
+            thread = threading.Thread(target=self._worker, args=(work_queue,), name=f"scan-sender-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, device_key, item):
+        # crc32 é estável entre execuções, ao contrário de hash() para strings
+        work_queue = self.queues[zlib.crc32(str(device_key).encode()) % len(self.queues)]
+        try:
+            work_queue.put_nowait(item)
+            return True
+        except queue.Full:
+            logging.warning("Fila de envio cheia. Salvando código de barras localmente.")
+            try:
+                self.on_overflow(item)
+            except Exception as e:
+                logging.error(f"Erro ao salvar código de barras descartado da fila: {e}")
+            return False
+
+    def pending(self):
+        return sum(work_queue.qsize() for work_queue in self.queues)
+
+    def stop(self, timeout=5):
+        for work_queue in self.queues:
+            try:
+                work_queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logging.error("Não foi possível encerrar uma thread de envio: fila cheia.")
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _worker(self, work_queue):
+        while True:
+            item = work_queue.get()
+            if item is _STOP:
+                work_queue.task_done()
+                return
+            items = [item]
+            stopping = False
+            if self.batch_handler is not None and self.batch_size > 1:
+                deadline = time.monotonic() + self.linger
+                while len(items) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        next_item = work_queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if next_item is _STOP:
+                        stopping = True
+                        break
+                    items.append(next_item)
+            try:
+                if len(items) > 1:
+                    self.batch_handler(items)
+                else:
+                    self.handler(items[0])
+            except Exception as e:
+                logging.error(f"Erro no envio do código de barras: {e}")
+            finally:
+                for _ in items:
+                    work_queue.task_done()
+            if stopping:
+                work_queue.task_done()
+                return
@@ -10,8 +10,9 @@ if [ -f "/home/kali/staf-rasp/data_backup.csv" ]; then
     echo "Arquivo data_backup.csv movido para o diretório de backup."
 fi
 
-# Adicionar tarefas ao crontab
-(crontab -l 2>/dev/null; echo "0 * * * * /usr/bin/python3 $SEND_ALL_CSVS_SCRIPT") | crontab -
-(crontab -l 2>/dev/null; echo "0 * * * * /usr/bin/python3 $SEND_CSV_SCRIPT") | crontab -
+# O envio do backlog roda dentro da aplicação (SyncScheduler em sync.py).
+# Remover as tarefas horárias antigas do crontab; os scripts continuam
+# disponíveis para envio manual e respeitam a mesma trava de sincronização.
+crontab -l 2>/dev/null | grep -v -e "$SEND_ALL_CSVS_SCRIPT" -e "$SEND_CSV_SCRIPT" | crontab -
 
-echo "Crontab configurado para executar os scripts a cada hora."
+echo "Tarefas de envio removidas do crontab. A sincronização é feita pela aplicação."
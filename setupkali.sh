@@ -49,6 +49,7 @@ echo "Installing dependencies..."
 sudo apt-get update
 sudo apt-get install -y python3-pip python3-tk python3-dotenv
 pip3 install requests python-dotenv pynput --break-system-packages
+# Opcional, para NETWORK_CORE=async: pip3 install -r requirements-async.txt --break-system-packages
 
 # Disable hibernation
 echo "Disabling hibernation..."
@@ -117,11 +118,11 @@ if [ -f "/home/kali/staf-rasp/data_backup.csv" ]; then
     echo "Arquivo data_backup.csv movido para o diretório de backup."
 fi
 
-# Adicionar tarefas ao crontab
-(crontab -l 2>/dev/null; echo "0 * * * * /usr/bin/python3 $SEND_ALL_CSVS_SCRIPT") | crontab -
-(crontab -l 2>/dev/null; echo "0 * * * * /usr/bin/python3 $SEND_CSV_SCRIPT") | crontab -
+# O envio do backlog roda dentro da aplicação (SyncScheduler em sync.py);
+# remover tarefas horárias antigas do crontab, se existirem
+crontab -l 2>/dev/null | grep -v -e "$SEND_ALL_CSVS_SCRIPT" -e "$SEND_CSV_SCRIPT" | crontab -
 
-echo "Crontab configurado para executar os scripts a cada hora."
+echo "Sincronização do backlog configurada na aplicação."
 
 echo "Setup completed. Rebooting the system..."
 sudo reboot
@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+from config_store import write_atomic
+
+
+def process_age():
+    """Segundos desde que o kernel criou o processo (inclui a carga do interpretador), ou None fora do Linux."""
+    try:
+        with open('/proc/self/stat') as file:
+            # Depois do nome do processo (entre parênteses) o primeiro campo é o 3; starttime é o 22
+            fields = file.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as file:
+            uptime = float(file.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """Tempo de cada etapa da inicialização, contado desde a criação do processo.
+
+    mark() grava só a primeira ocorrência de cada etapa (ex.: first_scan) e
+    publica o valor na métrica startup_phase_seconds{phase}.
+    """
+
+    def __init__(self):
+        age = process_age()
+        self.origin = time.monotonic() - (age or 0.0)
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def mark(self, phase):
+        with self.lock:
+            if phase in self.phases:
+                return
+            seconds = self.phases[phase] = time.monotonic() - self.origin
+        metrics.gauge('startup_phase_seconds', "Tempo desde a criação do processo até cada etapa da inicialização, em segundos",
+                      lambda: seconds, {'phase': phase})
+
+    def report(self, path=None):
+        """Registra as etapas no log e, com path, grava o relatório em JSON."""
+        with self.lock:
+            phases = dict(self.phases)
+        logging.info("Inicialização: " + ', '.join(f"{phase}={seconds:.3f}s" for phase, seconds in phases.items()))
+        if path:
+            try:
+                write_atomic(path, json.dumps({'timestamp': time.time(), 'pid': os.getpid(), 'phases': phases}, indent=2))
+            except OSError as e:
+                logging.error(f"Erro ao gravar relatório de inicialização em {path}: {e}")
+
+
+TIMER = StartupTimer()
+
+def mark(phase):
+    TIMER.mark(phase)
+
+def report(path=None):
+    TIMER.report(path)
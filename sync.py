@@ -0,0 +1,251 @@
+from dotenv import load_dotenv
+import os
+import logging
+import random
+import threading
+import time
+import zlib
+import fcntl
+from contextlib import contextmanager
+from outbox import Outbox
+import uploader
+from retry_policy import get_breaker, parse_statuses
+from transport import OFFLINE_PATH, create_transport
+from device_identity import get_identity
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+# Transporte HTTP usado pelo envio online e pelo backlog ('http' = requests; outros via transport.register_transport)
+TRANSPORT = os.getenv('TRANSPORT', 'http')
+
+# Diário, outbox e CSVs legados gravados por versões anteriores da aplicação
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', '/home/kali/staf-rasp/journal')
+OUTBOX_DB_PATH = os.getenv('OUTBOX_DB_PATH', '/home/kali/staf-rasp/backup_permanente/outbox.db')
+LEGACY_BACKUP_DIRS = ['/home/kali/staf-rasp/backup', '/home/kali/staf-rasp/backup_temporario']
+
+# Lotes do envio offline: máximo de linhas e de bytes (CSV) por lote, compressão e timeouts
+UPLOAD_BATCH_SIZE = int(os.getenv('UPLOAD_BATCH_SIZE', 500))
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', 256 * 1024))
+UPLOAD_COMPRESSION = os.getenv('UPLOAD_COMPRESSION', 'gzip')
+UPLOAD_TIMEOUT = (float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05)), float(os.getenv('UPLOAD_READ_TIMEOUT', 60)))
+# Envio paralelo: lotes simultâneos, requisições por segundo, tentativas por lote e tempo máximo da rodada (segundos)
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 2))
+UPLOAD_RATE_LIMIT = float(os.getenv('UPLOAD_RATE_LIMIT', 2))
+UPLOAD_MAX_RETRIES = int(os.getenv('UPLOAD_MAX_RETRIES', 3))
+SYNC_TIME_BUDGET = float(os.getenv('SYNC_TIME_BUDGET', 3000))
+
+# Respostas que recusam a leitura de vez (vão para dead-letter) e circuito por endpoint: falhas seguidas
+# até abrir, espera (segundos) até a requisição de teste e espera máxima, dobrada a cada teste que falha
+RETRY_PERMANENT_STATUSES = parse_statuses(os.getenv('RETRY_PERMANENT_STATUSES', '400,422'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+CIRCUIT_MAX_RESET_TIMEOUT = float(os.getenv('CIRCUIT_MAX_RESET_TIMEOUT', 600))
+
+# Agendador interno: intervalo de segurança (segundos), gatilho por backlog e trava entre processos
+SYNC_INTERVAL = float(os.getenv('SYNC_INTERVAL', 3600))
+SYNC_BACKLOG_THRESHOLD = int(os.getenv('SYNC_BACKLOG_THRESHOLD', 200))
+SYNC_LOCK_PATH = os.getenv('SYNC_LOCK_PATH', '/home/kali/staf-rasp/.sync.lock')
+# Espalhamento das rodadas automáticas entre os dispositivos da filial (interval, jitter ou hashed)
+# e janela, em segundos, dentro da qual os gatilhos (conexão de volta, backlog) são espalhados
+SCHEDULES = ('interval', 'jitter', 'hashed')
+SYNC_SCHEDULE = os.getenv('SYNC_SCHEDULE', 'hashed')
+SYNC_SPREAD = float(os.getenv('SYNC_SPREAD', 300))
+
+def transport_factory():
+    """Transporte de um worker do envio offline; o endpoint é lido a cada rodada para acompanhar o .env."""
+    base_url = os.getenv('LARAVEL_STORE_ENDPOINT', '')
+    return lambda: create_transport(TRANSPORT, base_url, pool_size=1, timeout=UPLOAD_TIMEOUT)
+
+def endpoint_breaker(path):
+    """Circuito compartilhado do caminho da API, com os limites do .env."""
+    return get_breaker(path, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, CIRCUIT_MAX_RESET_TIMEOUT)
+
+@contextmanager
+def single_flight(lock_path=SYNC_LOCK_PATH):
+    """Trava exclusiva entre processos (flock). Produz False se outra sincronização já está rodando."""
+    directory = os.path.dirname(lock_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def ingest_local_backlog(outbox):
+    """Passa para o outbox os segmentos selados do diário e os CSVs legados."""
+    ingested = outbox.ingest_journal(JOURNAL_DIR)
+    for backup_dir in LEGACY_BACKUP_DIRS:
+        if os.path.isdir(backup_dir):
+            for filename in sorted(os.listdir(backup_dir)):
+                if filename.endswith('.csv'):
+                    ingested += outbox.import_csv(os.path.join(backup_dir, filename))
+    return ingested
+
+def drain_outbox(outbox, concurrency=1, factory=None):
+    """Envia os batimentos pendentes em lotes comprimidos; cada lote é confirmado separadamente.
+
+    factory() cria o transporte de cada worker; por padrão, um novo transporte TRANSPORT por rodada.
+    """
+    return uploader.drain_outbox(
+        outbox, factory or transport_factory(), get_identity().snapshot().mac_address,
+        max_rows=UPLOAD_BATCH_SIZE, max_bytes=UPLOAD_CHUNK_BYTES,
+        compression=UPLOAD_COMPRESSION, timeout=UPLOAD_TIMEOUT,
+        concurrency=concurrency, rate=UPLOAD_RATE_LIMIT,
+        time_budget=SYNC_TIME_BUDGET, max_retries=UPLOAD_MAX_RETRIES,
+        breaker=endpoint_breaker(OFFLINE_PATH), permanent=RETRY_PERMANENT_STATUSES
+    )
+
+def run_sync(outbox=None, concurrency=1, factory=None):
+    """Uma rodada de sincronização do backlog offline.
+
+    Retorna o número de batimentos enviados, ou None se outra rodada (da
+    aplicação, do cron ou de um botão) já estiver em andamento.
+    """
+    with single_flight() as acquired:
+        if not acquired:
+            logging.info("Sincronização já em andamento em outro processo. Ignorando.")
+            return None
+        own_outbox = outbox is None
+        if own_outbox:
+            outbox = Outbox(OUTBOX_DB_PATH)
+        try:
+            ingest_local_backlog(outbox)
+            return drain_outbox(outbox, concurrency, factory)
+        finally:
+            if own_outbox:
+                outbox.close()
+
+
+class SyncScheduler:
+    """Agenda a sincronização do backlog dentro da aplicação, em uma thread própria.
+
+    Roda quando a conexão volta (on_connectivity), quando o número de
+    batimentos salvos offline passa de backlog_threshold (notify_backlog), a
+    pedido (trigger) e, como segurança, a cada interval segundos.
+
+    Numa filial todos os dispositivos ligam juntos e veem a conexão voltar no
+    mesmo instante; schedule espalha as rodadas automáticas para não chegarem
+    todas juntas ao servidor:
+      'interval': a cada interval segundos desde o início, gatilhos na hora;
+      'jitter': rodada periódica em interval + até spread segundos aleatórios,
+                gatilhos atrasados de 0 a spread segundos aleatórios;
+      'hashed': fração fixa por dispositivo (crc32 de device_key): a rodada
+                periódica cai sempre no mesmo ponto do relógio dentro do
+                intervalo e os gatilhos esperam essa fração de spread.
+    Pedidos manuais (trigger sem delay) rodam na hora em qualquer modo.
+    """
+
+    def __init__(self, run, interval=SYNC_INTERVAL, backlog_threshold=SYNC_BACKLOG_THRESHOLD, on_done=None,
+                 schedule=SYNC_SCHEDULE, spread=SYNC_SPREAD, device_key='', clock=time.time, rng=None):
+        if schedule not in SCHEDULES:
+            raise ValueError(f"Agendamento desconhecido: {schedule}")
+        self.run = run
+        self.interval = interval
+        self.backlog_threshold = backlog_threshold
+        self.on_done = on_done
+        self.schedule = schedule
+        self.spread = spread
+        # Fração estável em [0, 1) para o modo 'hashed'
+        self.fraction = zlib.crc32(str(device_key).encode('utf-8')) / 2 ** 32
+        self.clock = clock
+        self.random = rng or random.Random()
+        self.saved_since_sync = 0
+        self.concurrency = 0
+        self.immediate = False
+        self.pending_at = None
+        self.lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sync-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Encerra o agendador; com timeout espera a rodada em andamento terminar."""
+        self._stopped.set()
+        self._wake.set()
+        if timeout is not None and self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self, concurrency=1, delay=0):
+        with self.lock:
+            self.concurrency = max(self.concurrency, concurrency)
+            if delay <= 0:
+                self.immediate = True
+            else:
+                due = self.clock() + delay
+                self.pending_at = due if self.pending_at is None else min(self.pending_at, due)
+        self._wake.set()
+
+    def trigger_delay(self):
+        """Atraso de um gatilho automático (conexão de volta, backlog), conforme schedule."""
+        if self.schedule == 'jitter':
+            return self.random.uniform(0, self.spread)
+        if self.schedule == 'hashed':
+            return self.fraction * self.spread
+        return 0
+
+    def next_periodic(self, now):
+        """Horário da próxima rodada periódica depois de now."""
+        if self.schedule == 'jitter':
+            return now + self.interval + self.random.uniform(0, self.spread)
+        if self.schedule == 'hashed':
+            offset = self.fraction * self.interval
+            return now + ((offset - now) % self.interval or self.interval)
+        return now + self.interval
+
+    def on_connectivity(self, online):
+        if online:
+            self.trigger(UPLOAD_CONCURRENCY, self.trigger_delay())
+
+    def notify_backlog(self, added=1):
+        with self.lock:
+            self.saved_since_sync += added
+            reached = self.saved_since_sync >= self.backlog_threshold
+        if reached:
+            self.trigger(UPLOAD_CONCURRENCY, self.trigger_delay())
+
+    def _run(self):
+        periodic_at = self.next_periodic(self.clock())
+        while not self._stopped.is_set():
+            with self.lock:
+                due = periodic_at if self.pending_at is None else min(periodic_at, self.pending_at)
+            self._wake.wait(max(0, due - self.clock()))
+            if self._stopped.is_set():
+                return
+            self._wake.clear()
+            now = self.clock()
+            with self.lock:
+                periodic = now >= periodic_at
+                delayed = self.pending_at is not None and now >= self.pending_at
+                if not (self.immediate or delayed or periodic):
+                    continue
+                concurrency, self.concurrency = self.concurrency, 0
+                self.immediate = False
+                if delayed:
+                    self.pending_at = None
+                self.saved_since_sync = 0
+            if periodic:
+                periodic_at = self.next_periodic(now)
+            try:
+                # Rodada periódica (sem pedido explícito) usa o envio paralelo
+                sent = self.run(concurrency or UPLOAD_CONCURRENCY)
+                error = None
+            except Exception as e:
+                sent, error = None, e
+                logging.error(f"Erro na sincronização do backlog: {e}")
+            if self.on_done is not None:
+                try:
+                    self.on_done(sent, error)
+                except Exception as e:
+                    logging.error(f"Erro ao notificar fim da sincronização: {e}")
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import config_store
+from config_store import Sequence, StateStore
+
+
+class StateStoreFlushTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, 'state.json')
+        self.store = StateStore(self.path, flush_interval=60)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def saved(self):
+        with open(self.path) as file:
+            return json.load(file)
+
+    def test_older_snapshot_never_overwrites_a_newer_one(self):
+        real_write = config_store.write_atomic
+        gate = threading.Event()
+        first = threading.Event()
+
+        def slow_first_write(path, text):
+            # A primeira gravação fica parada no meio, como um fsync demorado
+            if not first.is_set():
+                first.set()
+                gate.wait(5)
+            real_write(path, text)
+
+        with mock.patch.object(config_store, 'write_atomic', slow_first_write):
+            self.store.set('seq', 10)
+            older = threading.Thread(target=self.store.flush)
+            older.start()
+            self.assertTrue(first.wait(5))
+            self.store.set('seq', 20)
+            newer = threading.Thread(target=self.store.flush)
+            newer.start()
+            newer.join(0.2)
+            gate.set()
+            older.join(5)
+            newer.join(5)
+        self.assertEqual(self.saved()['seq'], 20)
+
+    def test_sequence_reservation_survives_concurrent_flushes(self):
+        sequence = Sequence(self.store, 'seq', block=5)
+        flushers = [threading.Thread(target=self.store.flush) for _ in range(4)]
+        values = []
+        for thread in flushers:
+            thread.start()
+            values += [sequence.next() for _ in range(7)]
+        for thread in flushers:
+            thread.join(5)
+        self.assertGreaterEqual(self.saved()['seq'], max(values))
+        # Depois de um reinício o contador continua de onde a reserva parou, sem repetir
+        restarted = Sequence(StateStore(self.path, flush_interval=60), 'seq', block=5)
+        self.assertGreater(restarted.next(), max(values))
+        restarted.state.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
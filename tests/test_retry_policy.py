@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from outbox import SENT, Outbox
+from retry_policy import BREAKER_CLOSED, BREAKER_OPEN, CLIENT, DUPLICATE, PERMANENT, RETRYABLE, SUCCESS, CircuitBreaker, classify
+from uploader import drain_outbox, reconcile_acks
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.headers = {}
+        self.text = json.dumps(body) if body is not None else ''
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeTransport:
+    """Transporte que responde sempre com o mesmo status, sem rede."""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.posts = 0
+
+    def post(self, path, **kwargs):
+        self.posts += 1
+        return FakeResponse(self.status_code)
+
+    def close(self):
+        pass
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_every_2xx_is_success(self):
+        for status in (200, 201, 202, 204):
+            self.assertEqual(classify(status), SUCCESS, status)
+
+    def test_other_classes(self):
+        self.assertEqual(classify(409), DUPLICATE)
+        self.assertEqual(classify(None), RETRYABLE)
+        self.assertEqual(classify(429), RETRYABLE)
+        self.assertEqual(classify(503), RETRYABLE)
+        self.assertEqual(classify(422), PERMANENT)
+        self.assertEqual(classify(401), CLIENT)
+
+    def test_accepted_responses_do_not_open_the_breaker(self):
+        breaker = CircuitBreaker('/test-2xx', failure_threshold=5, clock=lambda: 0.0)
+        for _ in range(10):
+            breaker.record(classify(202))
+            breaker.record(classify(204))
+        self.assertEqual(breaker.state, BREAKER_CLOSED)
+        for _ in range(5):
+            breaker.record(classify(503))
+        self.assertEqual(breaker.state, BREAKER_OPEN)
+
+
+class ReconcileAcksTest(unittest.TestCase):
+    rows = [{'id': 1, 'idempotency_key': 'a'}, {'id': 2, 'idempotency_key': 'b'}]
+
+    def test_202_and_204_without_details_ack_every_row(self):
+        for status in (202, 204):
+            acked, retry, dead = reconcile_acks(FakeResponse(status), self.rows)
+            self.assertEqual((acked, retry, dead), (self.rows, [], []), status)
+
+    def test_202_results_per_row(self):
+        body = {'results': [{'scan_id': 'a', 'status': 202}, {'scan_id': 'b', 'status': 422}]}
+        acked, retry, dead = reconcile_acks(FakeResponse(202, body), self.rows)
+        self.assertEqual(acked, self.rows[:1])
+        self.assertEqual(retry, [])
+        self.assertEqual(dead, [(self.rows[1], 422)])
+
+
+class DrainAcceptedTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.outbox = Outbox(os.path.join(self.workdir, 'outbox.db'))
+        self.outbox.enqueue_many([{
+            'key': f"k{index}", 'timestamp': '2026-01-01 00:00:00', 'raspberry_id': '1',
+            'codigobarras': f"{index:012d}", 'filial_id': '1', 'mac_address': '00:00:00:00:00:00',
+        } for index in range(10)])
+
+    def tearDown(self):
+        self.outbox.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def drain(self, status):
+        transport = FakeTransport(status)
+        sent = drain_outbox(self.outbox, lambda: transport, '00:00:00:00:00:00', max_rows=4)
+        self.assertEqual(sent, 10)
+        self.assertEqual(transport.posts, 3)
+        self.assertEqual(self.outbox.pending_total(), 0)
+        self.assertEqual(self.outbox.count(SENT), 10)
+
+    def test_202_marks_the_backlog_sent(self):
+        self.drain(202)
+
+    def test_204_marks_the_backlog_sent(self):
+        self.drain(204)
+
+
+if __name__ == '__main__':
+    unittest.main()
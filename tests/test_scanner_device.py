@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+import unittest
+
+from scanner_device import INPUT_EVENT, INPUT_EVENT_32, EV_KEY, KEY_ENTER, KEY_PRESS, KEY_RELEASE, EvdevReader, SerialReader, event_layout
+from scanner_input import SCANNER, ScanFramer
+
+# Códigos de tecla usados nos testes (linux/input-event-codes.h)
+KEY_1, KEY_2, KEY_3, KEY_4, KEY_A, KEY_B, KEY_LEFTSHIFT = 2, 3, 4, 5, 30, 48, 42
+EV_SYN = 0
+
+
+class FakeStream:
+    """Fluxo falso do dispositivo: o teste escreve numa ponta de um os.pipe() e o leitor lê da outra."""
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+
+    def write(self, data):
+        os.write(self.write_fd, data)
+
+    def read(self, size=4096):
+        return os.read(self.read_fd, size)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+class ReaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scans = []
+        self.emitted = threading.Event()
+        self.framer = ScanFramer(self.on_scan, char_timeout=0.05, max_interval=0.03, min_length=4)
+        self.stream = FakeStream()
+
+    def tearDown(self):
+        self.framer.stop()
+        self.stream.close()
+
+    def on_scan(self, barcode, source):
+        self.scans.append((barcode, source))
+        self.emitted.set()
+
+    def pump(self, reader, chunk):
+        """Lê o pipe em pedaços de chunk bytes (leituras parciais) e entrega cada um ao leitor."""
+        os.set_blocking(self.stream.read_fd, False)
+        while True:
+            try:
+                data = self.stream.read(chunk)
+            except BlockingIOError:
+                return
+            reader.process(data)
+
+
+class EvdevReaderTest(ReaderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = EvdevReader('/dev/input/fake', self.framer, grab=False)
+        self.now = time.time()
+
+    def event(self, event_type, code, value, layout=INPUT_EVENT):
+        # Teclas do leitor chegam com poucos milissegundos de intervalo
+        self.now += 0.005
+        seconds = int(self.now)
+        return layout.pack(seconds, int((self.now - seconds) * 1e6), event_type, code, value)
+
+    def key(self, code, shift=False):
+        events = []
+        if shift:
+            events.append(self.event(EV_KEY, KEY_LEFTSHIFT, KEY_PRESS))
+        events += [self.event(EV_KEY, code, KEY_PRESS), self.event(EV_SYN, 0, 0), self.event(EV_KEY, code, KEY_RELEASE)]
+        if shift:
+            events.append(self.event(EV_KEY, KEY_LEFTSHIFT, KEY_RELEASE))
+        return b''.join(events)
+
+    def test_keys_and_enter_make_one_scanner_read(self):
+        self.stream.write(b''.join(self.key(code) for code in (KEY_1, KEY_2, KEY_3, KEY_4)) + self.key(KEY_ENTER))
+        self.pump(self.reader, 4096)
+        self.assertEqual(self.scans, [('1234', SCANNER)])
+
+    def test_shifted_characters(self):
+        self.stream.write(self.key(KEY_A, shift=True) + self.key(KEY_B) + self.key(KEY_1, shift=True) + self.key(KEY_2) + self.key(KEY_ENTER))
+        self.pump(self.reader, 4096)
+        self.assertEqual(self.scans, [('Ab!2', SCANNER)])
+
+    def test_partial_reads_split_events(self):
+        self.stream.write(b''.join(self.key(code) for code in (KEY_4, KEY_3, KEY_2, KEY_1)) + self.key(KEY_ENTER))
+        self.pump(self.reader, 7)
+        self.assertEqual(self.scans, [('4321', SCANNER)])
+        self.assertEqual(self.reader.pending, b'')
+
+    def test_truncated_trailing_event_waits_for_the_rest(self):
+        data = b''.join(self.key(code) for code in (KEY_1, KEY_2, KEY_3, KEY_4)) + self.event(EV_KEY, KEY_ENTER, KEY_PRESS)
+        cut = len(data) - INPUT_EVENT.size // 2
+        self.stream.write(data[:cut])
+        self.pump(self.reader, 4096)
+        self.assertEqual(len(self.reader.pending), INPUT_EVENT.size - INPUT_EVENT.size // 2)
+        self.assertEqual(self.scans, [])
+        self.stream.write(data[cut:])
+        self.pump(self.reader, 4096)
+        self.assertEqual(self.scans, [('1234', SCANNER)])
+
+    def test_key_repeat_is_ignored(self):
+        self.stream.write(self.key(KEY_1) + self.event(EV_KEY, KEY_1, 2) + self.key(KEY_2) + self.key(KEY_3) + self.key(KEY_4) + self.key(KEY_ENTER))
+        self.pump(self.reader, 4096)
+        self.assertEqual(self.scans, [('1234', SCANNER)])
+
+    def test_event_layout_keeps_bytes_read_while_probing(self):
+        # Um pipe aceita a leitura de 16 bytes, como o evdev com eventos de 16 bytes
+        self.stream.write(self.event(EV_KEY, KEY_1, KEY_PRESS, INPUT_EVENT_32))
+        layout, first = event_layout(self.stream.read_fd)
+        self.assertIs(layout, INPUT_EVENT_32)
+        self.assertEqual(len(first), INPUT_EVENT_32.size)
+
+    def test_thirty_two_bit_layout(self):
+        self.reader.event = INPUT_EVENT_32
+        keys = [(KEY_1, False), (KEY_A, True), (KEY_2, False), (KEY_3, False), (KEY_ENTER, False)]
+        for code, shift in keys:
+            events = []
+            if shift:
+                events.append(self.event(EV_KEY, KEY_LEFTSHIFT, KEY_PRESS, INPUT_EVENT_32))
+            events += [self.event(EV_KEY, code, KEY_PRESS, INPUT_EVENT_32), self.event(EV_KEY, code, KEY_RELEASE, INPUT_EVENT_32)]
+            if shift:
+                events.append(self.event(EV_KEY, KEY_LEFTSHIFT, KEY_RELEASE, INPUT_EVENT_32))
+            self.stream.write(b''.join(events))
+        self.pump(self.reader, 5)
+        self.assertEqual(self.scans, [('1A23', SCANNER)])
+
+
+class SerialReaderTest(ReaderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = SerialReader('/dev/ttyACM-fake', self.framer)
+
+    def test_crlf_ends_one_read(self):
+        self.stream.write(b'7891234567895\r\n')
+        self.pump(self.reader, 4096)
+        self.assertEqual(self.scans, [('7891234567895', SCANNER)])
+
+    def test_cr_and_lf_terminators(self):
+        self.stream.write(b'12345\r67890\nABCDE\r\n')
+        self.pump(self.reader, 4096)
+        self.assertEqual(self.scans, [('12345', SCANNER), ('67890', SCANNER), ('ABCDE', SCANNER)])
+
+    def test_crlf_split_across_reads(self):
+        self.stream.write(b'1111\r')
+        self.pump(self.reader, 4096)
+        self.stream.write(b'\n2222\r\n')
+        self.pump(self.reader, 4096)
+        self.assertEqual(self.scans, [('1111', SCANNER), ('2222', SCANNER)])
+
+    def test_partial_reads(self):
+        self.stream.write(b'ABC-123\x00\r\n')
+        self.pump(self.reader, 2)
+        self.assertEqual(self.scans, [('ABC-123', SCANNER)])
+
+    def test_read_without_terminator_is_closed_by_timeout(self):
+        self.stream.write(b'55556666')
+        self.pump(self.reader, 3)
+        self.assertTrue(self.emitted.wait(2))
+        self.assertEqual(self.scans, [('55556666', SCANNER)])
+
+
+if __name__ == '__main__':
+    unittest.main()
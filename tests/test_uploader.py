@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from outbox import Outbox
+from uploader import get_progress, save_progress
+
+
+class SaveProgressTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.outbox = Outbox(os.path.join(self.workdir, 'outbox.db'))
+
+    def tearDown(self):
+        self.outbox.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_concurrent_workers_do_not_lose_progress(self):
+        # Oito workers confirmando lotes de 5 linhas, em qualquer ordem
+        chunks = [[{'id': start + offset} for offset in range(5)] for start in range(1, 400, 5)]
+        def worker(index):
+            for rows in chunks[index::8]:
+                save_progress(self.outbox, rows, 100)
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        progress = get_progress(self.outbox)
+        self.assertEqual(progress['acked_rows'], 5 * len(chunks))
+        self.assertEqual(progress['acked_bytes'], 100 * len(chunks))
+        self.assertEqual(progress['last_acked_id'], chunks[-1][-1]['id'])
+
+    def test_last_acked_id_never_moves_backwards(self):
+        save_progress(self.outbox, [{'id': 20}, {'id': 21}], 10)
+        save_progress(self.outbox, [{'id': 5}, {'id': 6}], 10)
+        self.assertEqual(get_progress(self.outbox)['last_acked_id'], 21)
+
+
+if __name__ == '__main__':
+    unittest.main()
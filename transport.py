@@ -0,0 +1,72 @@
+import threading
+import time
+
+import metrics
+from sender import create_session
+
+# Caminhos da API do Laravel usados pelo envio online e pelo envio do backlog offline
+SCAN_PATH = '/api/raspberry-scan-store'
+OFFLINE_PATH = '/api/raspberry-scan-store-offline'
+
+
+class TransportError(Exception):
+    """Falha de rede: conexão recusada ou derrubada, timeout, DNS."""
+
+
+class HttpTransport:
+    """Transporte padrão: requests com sessão keep-alive, relativo a base_url.
+
+    post() devolve a resposta (status_code, headers, text, json()) para
+    qualquer código HTTP e levanta TransportError quando não há resposta.
+    base_url pode ser trocado em execução (recarga do .env). A sessão (e o
+    import do requests) só é criada no primeiro post() ou em warm_up().
+    """
+
+    def __init__(self, base_url, pool_size=2, timeout=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = None
+        self.request_error = None
+        self.lock = threading.Lock()
+
+    def warm_up(self):
+        """Cria a sessão antes do primeiro envio; chamado em segundo plano na inicialização."""
+        with self.lock:
+            if self.session is None:
+                import requests
+                self.request_error = requests.exceptions.RequestException
+                self.session = create_session(self.pool_size)
+        return self.session
+
+    def post(self, path, json=None, data=None, files=None, timeout=None):
+        session = self.session or self.warm_up()
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{self.base_url or ''}{path}", json=json, data=data, files=files, timeout=timeout or self.timeout)
+        except self.request_error as e:
+            metrics.counter('http_failures_total', "Requisições HTTP sem resposta (conexão, timeout)", {'path': path}).inc()
+            raise TransportError(str(e)) from e
+        metrics.histogram('http_request_seconds', "Latência das requisições HTTP, em segundos", {'path': path}).observe(time.perf_counter() - started)
+        return response
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+TRANSPORTS = {'http': HttpTransport}
+
+def register_transport(name, factory):
+    """Registra outro transporte; factory(base_url, pool_size=..., timeout=...) deve ter a interface do HttpTransport.
+
+    warm_up() é opcional: se existir, o motor o chama em segundo plano na inicialização.
+    """
+    TRANSPORTS[name] = factory
+
+def create_transport(name, base_url, pool_size=2, timeout=None):
+    try:
+        factory = TRANSPORTS[name]
+    except KeyError:
+        raise ValueError(f"Transporte desconhecido: {name}") from None
+    return factory(base_url, pool_size=pool_size, timeout=timeout)
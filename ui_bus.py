@@ -0,0 +1,68 @@
+import logging
+import queue
+import tkinter as tk
+
+
+class UiBus:
+    """Fila de atualizações da interface, segura para chamar de qualquer thread.
+
+    As threads de trabalho só enfileiram eventos; o loop principal do Tk
+    esvazia a fila a cada interval_ms com after(). Em cada passada os textos
+    destinados a uma mesma área são juntados em um único insert/see, e para
+    variáveis e configurações de widgets vale apenas o último valor.
+    """
+
+    def __init__(self, root, interval_ms=50):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.events = queue.SimpleQueue()
+
+    def start(self):
+        self.root.after(self.interval_ms, self._drain)
+
+    def append(self, widget, text):
+        """Acrescenta uma linha ao final de uma área de texto e rola até ela."""
+        self.events.put(('append', widget, text))
+
+    def set(self, variable, value):
+        self.events.put(('set', variable, value))
+
+    def config(self, widget, **options):
+        self.events.put(('config', widget, options))
+
+    def call(self, callback):
+        """Executa callback() no loop principal do Tk, depois das atualizações da mesma passada."""
+        self.events.put(('call', callback, None))
+
+    def _drain(self):
+        appends = {}
+        values = {}
+        configs = {}
+        calls = []
+        while True:
+            try:
+                kind, target, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'append':
+                appends.setdefault(target, []).append(f"{value}\n")
+            elif kind == 'set':
+                values[target] = value
+            elif kind == 'call':
+                calls.append(target)
+            else:
+                configs.setdefault(target, {}).update(value)
+        try:
+            for widget, lines in appends.items():
+                widget.insert(tk.END, ''.join(lines))
+                widget.see(tk.END)
+            for variable, value in values.items():
+                variable.set(value)
+            for widget, options in configs.items():
+                widget.config(**options)
+            for callback in calls:
+                callback()
+        except Exception as e:
+            logging.error(f"Erro ao atualizar a interface: {e}")
+        finally:
+            self.root.after(self.interval_ms, self._drain)
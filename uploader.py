@@ -0,0 +1,252 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from retry_policy import CLIENT, PERMANENT, PERMANENT_STATUSES, classify, describe, retry_delay
+from segment_format import CSV_HEADER
+from sender import ACK_STATUSES, parse_batch_results
+from transport import OFFLINE_PATH, TransportError
+
+PROGRESS_KEY = 'upload_progress'
+# Layout do data_backup.csv mais a identificação de cada leitura, no fim para não mudar as colunas antigas
+UPLOAD_CSV_HEADER = CSV_HEADER + ['scan_id', 'seq']
+
+RETRIES = metrics.counter('upload_retries_total', "Novas tentativas de envio de lotes do backlog")
+CHUNKS_SENT = metrics.counter('upload_chunks_sent_total', "Lotes do backlog confirmados pelo servidor")
+CHUNKS_FAILED = metrics.counter('upload_chunks_failed_total', "Lotes do backlog devolvidos à fila após falha")
+ROWS_SENT = metrics.counter('upload_rows_sent_total', "Batimentos do backlog confirmados pelo servidor")
+ROWS_REJECTED = metrics.counter('upload_rows_rejected_total', "Batimentos do backlog recusados ou sem confirmação numa resposta com detalhes por linha")
+ROWS_DEAD = metrics.counter('upload_rows_dead_total', "Batimentos do backlog recusados de vez (400/422) e levados para dead-letter")
+CHUNKS_SHED = metrics.counter('upload_chunks_shed_total', "Lotes do backlog não enviados porque o circuito do endpoint estava aberto")
+
+
+class TokenBucket:
+    """Limita a taxa de requisições: rate fichas por segundo, com rajadas de até capacity."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Espera por uma ficha. Retorna False se o prazo acabar antes."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def claim_chunk(outbox, max_rows, max_bytes):
+    """Reserva o próximo lote (linhas, csv) do outbox, limitado por linhas e bytes.
+
+    Cada lote é um CSV completo (com cabeçalho), com scan_id e seq de cada
+    linha para o servidor descartar reenvios. Linhas reservadas que não
+    couberam no limite de bytes voltam para a fila e entram no próximo lote.
+    Retorna None quando não há mais nada pendente.
+    """
+    rows = outbox.claim_pending(max_rows)
+    if not rows:
+        return None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(UPLOAD_CSV_HEADER)
+    chunk = []
+    for row in rows:
+        writer.writerow([row[column] for column in CSV_HEADER] + [row['idempotency_key'], row['seq']])
+        chunk.append(row)
+        if buffer.tell() >= max_bytes:
+            break
+    leftover = rows[len(chunk):]
+    if leftover:
+        outbox.release([row['id'] for row in leftover])
+    return chunk, buffer.getvalue().encode('utf-8')
+
+
+def upload_chunk(transport, mac_address, data, compression, timeout):
+    if compression == 'gzip':
+        files = {'data_backup': ('data_backup.csv.gz', gzip.compress(data), 'application/gzip')}
+    else:
+        files = {'data_backup': ('data_backup.csv', data, 'text/csv')}
+    payload = {'mac_address': mac_address, 'compression': compression}
+    return transport.post(OFFLINE_PATH, files=files, data=payload, timeout=timeout)
+
+
+def reconcile_acks(response, rows, permanent=PERMANENT_STATUSES):
+    """Separa as linhas de um lote em (confirmadas, a tentar de novo, recusadas de vez) pela resposta do servidor.
+
+    409 confirma o lote inteiro (já recebido). Uma resposta de sucesso com
+    resultados por linha ('results' com scan_id e status) confirma só as
+    linhas com status 2xx/409; as com status em permanent (400/422) vão
+    para dead-letter e as demais, inclusive sem resultado, voltam para a
+    fila. Sem detalhes, confirma todas.
+    """
+    if response.status_code == 409:
+        return rows, [], []
+    statuses = parse_batch_results(response, len(rows), [row['idempotency_key'] for row in rows])
+    acked, retry, dead = [], [], []
+    for row, status in zip(rows, statuses):
+        if status in ACK_STATUSES:
+            acked.append(row)
+        elif classify(status, permanent) == PERMANENT:
+            dead.append((row, status))
+        else:
+            retry.append(row)
+    return acked, retry, dead
+
+
+def get_progress(outbox):
+    """Progresso do envio: último id confirmado e totais de linhas e bytes confirmados."""
+    return json.loads(outbox.get_meta(PROGRESS_KEY, '{}'))
+
+
+def save_progress(outbox, rows, size):
+    """Soma um lote confirmado ao progresso; chamado em paralelo pelos workers, por isso numa só transação."""
+    last_id = max(row['id'] for row in rows)
+
+    def update(text):
+        progress = json.loads(text)
+        # Lotes confirmados fora de ordem não fazem o último id voltar
+        progress['last_acked_id'] = max(progress.get('last_acked_id', 0), last_id)
+        progress['acked_rows'] = progress.get('acked_rows', 0) + len(rows)
+        progress['acked_bytes'] = progress.get('acked_bytes', 0) + size
+        progress['updated_at'] = time.time()
+        return json.dumps(progress)
+    outbox.update_meta(PROGRESS_KEY, update, '{}')
+
+
+def drain_outbox(outbox, transport_factory, mac_address, max_rows=500, max_bytes=256 * 1024, compression='gzip', timeout=None,
+                 concurrency=1, rate=None, time_budget=None, max_retries=3, breaker=None, permanent=PERMANENT_STATUSES):
+    """Envia o backlog em lotes comprimidos, do mais antigo para o mais novo, confirmando lote a lote.
+
+    Cada lote confirmado é marcado como enviado no outbox e o progresso é
+    salvo; depois de uma falha o próximo envio continua a partir das linhas
+    ainda não confirmadas, sem reenviar o que já foi aceito. Respostas com
+    resultados por linha são conciliadas pelo scan_id (reconcile_acks) e um
+    409 conta como confirmação, então reenviar um lote nunca duplica dados.
+
+    Com concurrency > 1 vários lotes são enviados em paralelo. rate limita as
+    requisições por segundo (token bucket), respostas 429/503 respeitam o
+    Retry-After e as demais falhas usam backoff exponencial com jitter. Depois
+    de time_budget segundos nenhum lote novo é iniciado. Cada worker abre o
+    próprio transporte com transport_factory().
+
+    As respostas são classificadas por retry_policy.classify: um lote (ou
+    linha) recusado com status em permanent (400/422) vai para dead-letter em
+    vez de voltar para a fila. Com breaker (CircuitBreaker do endpoint),
+    falhas passageiras seguidas abrem o circuito e a rodada termina sem
+    mandar mais lotes; com o circuito meio-aberto só um lote de teste sai.
+    """
+    deadline = time.monotonic() + time_budget if time_budget else None
+    bucket = TokenBucket(rate) if rate else None
+    state = {'compression': compression, 'stop': False}
+    state_lock = threading.Lock()
+    sent = [0]
+
+    def out_of_time(extra=0):
+        return deadline is not None and time.monotonic() + extra > deadline
+
+    def upload_with_retries(transport, rows, data):
+        ids = [row['id'] for row in rows]
+        attempt = 0
+        while True:
+            if breaker is not None and not breaker.allow():
+                # Servidor com problemas: o lote volta para a fila sem contar tentativa
+                outbox.release(ids)
+                CHUNKS_SHED.inc()
+                return False
+            if bucket is not None and not bucket.acquire(deadline):
+                outbox.release(ids)
+                return False
+            try:
+                response = upload_chunk(transport, mac_address, data, state['compression'], timeout)
+            except TransportError as e:
+                logging.error(f"Failed to send chunk: {e}")
+                response = None
+            if response is not None and response.status_code == 415 and state['compression'] != 'none':
+                # Servidor não aceita CSV comprimido: segue sem compressão
+                logging.warning("Server rejected compressed chunk. Falling back to plain CSV.")
+                state['compression'] = 'none'
+                continue
+            kind = classify(response.status_code if response is not None else None, permanent)
+            if breaker is not None:
+                breaker.record(kind)
+            if response is not None and response.status_code in ACK_STATUSES:
+                acked, retry, dead = reconcile_acks(response, rows, permanent)
+                if acked:
+                    outbox.mark_sent([row['id'] for row in acked])
+                    save_progress(outbox, acked, len(data))
+                if retry:
+                    # Só as linhas sem confirmação voltam para a fila; o scan_id evita duplicar as demais
+                    logging.warning(f"{len(retry)} of {len(rows)} scans in chunk were not acknowledged. They will be retried.")
+                    outbox.mark_failed([row['id'] for row in retry])
+                    ROWS_REJECTED.inc(len(retry))
+                for status in sorted({status for _, status in dead}):
+                    rejected = [row['id'] for row, row_status in dead if row_status == status]
+                    logging.error(f"{len(rejected)} of {len(rows)} scans in chunk were rejected ({status}). Moved to dead-letter.")
+                    outbox.mark_dead(rejected, status, describe(status))
+                    ROWS_DEAD.inc(len(rejected))
+                CHUNKS_SENT.inc()
+                ROWS_SENT.inc(len(acked))
+                with state_lock:
+                    sent[0] += len(acked)
+                return True
+            if kind == PERMANENT:
+                # O servidor recusou o lote inteiro pelos dados: repetir não adianta, os demais lotes seguem
+                logging.error(f"Chunk rejected: {response.status_code} - {response.text}. {len(rows)} scans moved to dead-letter.")
+                outbox.mark_dead(ids, response.status_code, response.text[:500] or describe(response.status_code))
+                ROWS_DEAD.inc(len(rows))
+                CHUNKS_FAILED.inc()
+                return True
+            if kind == CLIENT:
+                # Erro de configuração ou credenciais: tentar de novo agora não adianta
+                logging.error(f"Failed to send chunk: {response.status_code} - {response.text}")
+                outbox.mark_failed(ids)
+                CHUNKS_FAILED.inc()
+                return False
+            delay = retry_delay(response, attempt)
+            attempt += 1
+            if attempt > max_retries or out_of_time(delay):
+                if response is not None:
+                    logging.error(f"Failed to send chunk: {response.status_code} - {response.text}")
+                outbox.mark_failed(ids)
+                CHUNKS_FAILED.inc()
+                return False
+            RETRIES.inc()
+            time.sleep(delay)
+
+    def worker():
+        transport = transport_factory()
+        try:
+            while not state['stop'] and not out_of_time():
+                chunk = claim_chunk(outbox, max_rows, max_bytes)
+                if chunk is None:
+                    return
+                if not upload_with_retries(transport, *chunk):
+                    # Servidor com problemas: termina a rodada sem abrir novos lotes
+                    state['stop'] = True
+        finally:
+            transport.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for future in [executor.submit(worker) for _ in range(max(1, concurrency))]:
+            future.result()
+    if out_of_time():
+        logging.warning("Upload time budget exhausted. Remaining scans will be sent in the next run.")
+    logging.info(f"{sent[0]} scans sent from outbox.")
+    return sent[0]